@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Orchestration benchmarks on top of `FakeCopilotClient` (no network, no model).
+
+Measures what `MultiAgentTask` and the skills add on top of the model:
+  * phases:  wall time of a run vs. the simulated model/tool time, per role
+  * tools:   tool-call throughput through the real skill handlers
+  * memory:  peak Python memory per concurrent task (tracemalloc)
+  * scaling: jobs/s of `run_many` at increasing concurrency
+
+Results are written to benchmarks/results/<timestamp>-<commit>.json; pass --compare with
+an earlier file to print the differences.
+
+    python benchmarks/bench_orchestration.py --latency 0.05 --compare benchmarks/results/<old>.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.event_sink import EventSink
+from src.fake_client import FakeCopilotClient, FakeToolCall, FakeTurn
+from src.multi_agent import MultiAgentTask
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip() or "unknown"
+    except OSError:
+        return "unknown"
+
+def _task(client: FakeCopilotClient) -> MultiAgentTask:
+    # Events are still produced and batched, just not written anywhere
+    return MultiAgentTask(client, enable_pre_review=False, event_sink=EventSink(backends=[]))
+
+async def bench_phases(latency: float, iterations: int) -> dict:
+    """One Worker + one Reviewer turn per run; overhead = wall time not spent in the (fake) model or tools."""
+    walls, overheads = [], []
+    per_role, per_phase, ttfts = {}, {}, []
+    for _ in range(iterations):
+        client = FakeCopilotClient(first_token_latency=latency)
+        task = _task(client)
+        started = time.perf_counter()
+        result = await task.run("Write a function that adds two numbers.")
+        wall = time.perf_counter() - started
+        assert result.success
+        turn_total = sum(sum(times) for times in client.stats.turn_times.values())
+        walls.append(wall)
+        overheads.append(wall - turn_total)
+        for role, times in client.stats.turn_times.items():
+            per_role.setdefault(role, []).extend(times)
+        for phase in result.metrics.phases:
+            per_phase.setdefault(phase.name, []).append(phase.duration)
+            if phase.ttft is not None:
+                ttfts.append(phase.ttft)
+    return {
+        "iterations": iterations,
+        "wall_ms_mean": statistics.mean(walls) * 1000,
+        "overhead_ms_mean": statistics.mean(overheads) * 1000,
+        "overhead_ms_p95": sorted(overheads)[int(0.95 * (len(overheads) - 1))] * 1000,
+        "turn_ms_mean": {role: statistics.mean(times) * 1000 for role, times in per_role.items()},
+        "phase_ms_mean": {name: statistics.mean(times) * 1000 for name, times in per_phase.items()},
+        "ttft_ms_mean": statistics.mean(ttfts) * 1000 if ttfts else None,
+    }
+
+async def bench_tools(calls: int) -> dict:
+    """A single Worker turn issuing `calls` read-only tool calls against this repository."""
+    src = os.path.join(ROOT, "src")
+    pattern = [
+        FakeToolCall("list_directory", {"path": src, "recursive": True}),
+        FakeToolCall("read_file", {"path": os.path.join(src, "multi_agent.py")}),
+        FakeToolCall("search_code", {"path": src, "query": "def "}),
+    ]
+    tool_calls = [pattern[i % len(pattern)] for i in range(calls)]
+
+    def script(config, prompt, turn):
+        if "Reviewer" in config["system_message"].split("。")[0]:
+            return "PASS"
+        return FakeTurn("done", tool_calls if turn == 0 else [])
+
+    client = FakeCopilotClient(script)
+    task = _task(client)
+    started = time.perf_counter()
+    await task.run("Inspect the repository.", local_repo_path=ROOT)
+    wall = time.perf_counter() - started
+    return {
+        "calls": client.stats.tool_calls,
+        "tool_time_s": client.stats.tool_time,
+        "calls_per_s": client.stats.tool_calls / client.stats.tool_time if client.stats.tool_time else 0.0,
+        "wall_s": wall,
+    }
+
+async def bench_memory(concurrency: int, latency: float) -> dict:
+    client = FakeCopilotClient(first_token_latency=latency)
+    task = _task(client)
+    jobs = [(f"Task {i}: write a helper function.", None) for i in range(concurrency)]
+    tracemalloc.start()
+    try:
+        baseline, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        async for _ in task.run_many(jobs, concurrency=concurrency):
+            pass
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"concurrency": concurrency, "peak_kib": (peak - baseline) / 1024, "kib_per_task": (peak - baseline) / 1024 / concurrency}
+
+async def bench_scaling(levels, latency: float, jobs_per_level: int) -> list:
+    rows = []
+    baseline = None
+    for concurrency in levels:
+        client = FakeCopilotClient(first_token_latency=latency)
+        task = _task(client)
+        jobs = [(f"Job {i}", None) for i in range(jobs_per_level)]
+        started = time.perf_counter()
+        async for _ in task.run_many(jobs, concurrency=concurrency):
+            pass
+        wall = time.perf_counter() - started
+        throughput = jobs_per_level / wall
+        baseline = baseline or throughput
+        rows.append({
+            "concurrency": concurrency,
+            "wall_s": wall,
+            "jobs_per_s": throughput,
+            # 1.0 = perfectly linear speed-up over the first level
+            "efficiency": throughput / (baseline * concurrency / levels[0]),
+        })
+    return rows
+
+def _flatten(prefix: str, value, out: dict):
+    if isinstance(value, dict):
+        for k, v in value.items():
+            _flatten(f"{prefix}.{k}" if prefix else k, v, out)
+    elif isinstance(value, list):
+        for item in value:
+            key = item.get("concurrency", len(out)) if isinstance(item, dict) else len(out)
+            _flatten(f"{prefix}[{key}]", item, out)
+    elif isinstance(value, (int, float)):
+        out[prefix] = value
+
+def compare(old: dict, new: dict):
+    old_flat, new_flat = {}, {}
+    _flatten("", old["results"], old_flat)
+    _flatten("", new["results"], new_flat)
+    print(f"\n=== Compared with {old.get('commit')} ({old.get('timestamp')}) ===")
+    for key in sorted(new_flat):
+        if key in old_flat and old_flat[key]:
+            change = (new_flat[key] - old_flat[key]) / abs(old_flat[key]) * 100
+            print(f"{key:50} {old_flat[key]:12.3f} -> {new_flat[key]:12.3f} ({change:+.1f}%)")
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=0.02, help="Simulated time-to-first-token per turn (s)")
+    parser.add_argument("--iterations", type=int, default=20, help="Runs for the phase benchmark")
+    parser.add_argument("--tool-calls", type=int, default=60, help="Tool calls for the throughput benchmark")
+    parser.add_argument("--concurrency", default="1,2,4,8,16", help="Concurrency levels for the scaling benchmark")
+    parser.add_argument("--jobs", type=int, default=32, help="Jobs per concurrency level")
+    parser.add_argument("--output-dir", default=RESULTS_DIR)
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    args = parser.parse_args()
+    levels = [int(c) for c in args.concurrency.split(",")]
+
+    results = {
+        "phases": await bench_phases(args.latency, args.iterations),
+        "tools": await bench_tools(args.tool_calls),
+        "memory": await bench_memory(max(levels), args.latency),
+        "scaling": await bench_scaling(levels, args.latency, args.jobs),
+    }
+    report = {
+        "commit": _git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": vars(args),
+        "results": results,
+    }
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    path = os.path.join(args.output_dir, f"{stamp}-{report['commit']}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"\nSaved to {path}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(json.load(f), report)
+
+if __name__ == "__main__":
+    asyncio.run(main())
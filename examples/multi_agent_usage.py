@@ -24,17 +24,19 @@ async def main():
         print(result_1.code if result_1.success else "Failed to generate valid code.")
 
 
-        print("\n\n=== Test Case 2: Specific Requirement ===")
-        # 要求必須包含 Type Hints 和 Docstring，看 Reviewer 是否會抓
-        user_prompt_2 = "Write a Python function to calculate Fibonacci numbers. It MUST utilize recursion and include Type Hints."
-        result_2 = await task_runner.run(user_prompt_2)
-        
-        print("\n--- Execution Logs ---")
-        for log in result_2.messages:
-            print(log)
-            
-        print("\n--- Final Result ---")
-        print(result_2.code if result_2.success else "Failed to generate valid code.")
+        print("\n\n=== Test Case 2: Batch Requests (Concurrent) ===")
+        # 多個需求同時執行，總時間接近最慢的那一個，而不是全部相加
+        # 第二個需求必須包含 Type Hints 和 Docstring，看 Reviewer 是否會抓
+        jobs = [
+            ("Write a Python function to calculate Fibonacci numbers. It MUST utilize recursion and include Type Hints.", None),
+            ("Write a Python function that checks whether a string is a palindrome.", None),
+            ("Write a Python function to reverse a linked list.", None),
+        ]
+        async for item in task_runner.run_many(jobs, concurrency=3, timeout=600):
+            print(f"\n--- Job {item.job.job_id} finished in {item.elapsed:.1f}s ---")
+            for log in item.result.messages:
+                print(log)
+            print(item.result.code if item.result.success else "Failed to generate valid code.")
 
 if __name__ == "__main__":
     asyncio.run(main())
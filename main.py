@@ -1,11 +1,29 @@
 #!/usr/bin/env python3
+"""
+互動式主程式。也可以不經互動直接執行單一需求，或以常駐服務 (daemon) 模式接受 HTTP 任務：
+
+    python main.py                                          # 互動模式
+    python main.py --prompt "Add a README" --repo ./workspaces/my-repo --json
+    python main.py --serve --port 8765 --concurrency 4      # 或 --socket /tmp/multi-agent.sock
+"""
+import argparse
 import asyncio
+import json
 import os
+import signal
 import sys
+import uuid
 from dotenv import load_dotenv
 from copilot import CopilotClient
 from src.multi_agent import MultiAgentTask
-from src.skills.repository import RepositorySkill, CloneRepoParams
+from src.session_pool import SessionPool
+from src.event_sink import EventSink, ConsoleBackend, JsonlBackend
+from src.daemon import DaemonServer, JobManager
+from src.checkpoint import CheckpointStore
+from src.task_workspace import TaskWorkspace
+from src.retry_policy import RetryPolicy
+from src.model_routing import ModelRouting
+from src.skills.repository import RepositorySkill
 
 # Load environment variables
 load_dotenv(override=True)
@@ -14,24 +32,171 @@ async def async_input(prompt: str) -> str:
     """Async wrapper for input() to avoid blocking the event loop excessively."""
     return await asyncio.to_thread(input, f"\n❓ [Clarifier] {prompt}\n> ")
 
-async def main():
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--prompt", help="Run this request non-interactively and exit ('-' reads it from stdin)")
+    parser.add_argument("--resume", metavar="TASK_ID", help="Continue an interrupted task from its checkpoint (implies --checkpoints)")
+    parser.add_argument("--checkpoints", action="store_true", help="Checkpoint every step so an interrupted task can be resumed")
+    parser.add_argument("--repo", help="Local repository path, or a URL to clone (with --prompt)")
+    parser.add_argument("--json", action="store_true", help="Print the result as JSON on stdout; agent output goes to stderr (with --prompt)")
+    parser.add_argument("--serve", action="store_true", help="Run as a daemon accepting jobs over a local HTTP API")
+    parser.add_argument("--host", default="127.0.0.1", help="Daemon listen address (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8765, help="Daemon listen port (default: 8765)")
+    parser.add_argument("--socket", help="Listen on this Unix socket instead of host:port")
+    parser.add_argument("--token", default=os.environ.get("MULTI_AGENT_TOKEN"),
+                        help="Bearer token the daemon's API requires (default: $MULTI_AGENT_TOKEN; needed for a non-loopback --host)")
+    parser.add_argument("--concurrency", type=int, default=2, help="Jobs the daemon runs at once (default: 2)")
+    parser.add_argument("--prewarm", type=int, default=0, help="Worker/Reviewer sessions the daemon keeps warm (at least 1 spare per agent once it has run a job)")
+    parser.add_argument("--isolate", action="store_true",
+                        help="Run each task in its own git worktree; changes come back as a patch / an agent/<task_id> branch")
+    parser.add_argument("--model", default="gpt-5 mini")
+    parser.add_argument("--clarifier-model", help="Clarifier model(s), comma-separated from small to large (default: --model)")
+    parser.add_argument("--worker-model", help="Worker model(s), comma-separated; later ones are fallbacks / escalations")
+    parser.add_argument("--reviewer-model", help="Reviewer model(s), e.g. 'gpt-5 mini,gpt-5' to review small and escalate on disagreement")
+    parser.add_argument("--no-pre-review", action="store_true", help="Send every Worker attempt straight to the Reviewer")
+    parser.add_argument("--no-repo-map", action="store_true", help="Don't put the repository map into the agents' system messages")
+    parser.add_argument("--max-attempts", type=int, default=4, help="Worker attempts per task (default: 4)")
+    parser.add_argument("--time-budget", type=float, help="Stop retrying once a task has run this many seconds")
+    parser.add_argument("--token-budget", type=int, help="Stop retrying once a task has used this many tokens")
+    parser.add_argument("--events-jsonl", help="Also append every agent event to this JSONL file")
+    parser.add_argument("--quiet", action="store_true", help="Don't print agent output")
+    return parser.parse_args(argv)
+
+def make_event_sink(args: argparse.Namespace, stream=None, show_task_ids: bool = False) -> EventSink:
+    backends = []
+    if not args.quiet:
+        backends.append(ConsoleBackend(stream=stream, show_task_ids=show_task_ids))
+    if args.events_jsonl:
+        backends.append(JsonlBackend(args.events_jsonl))
+    return EventSink(backends)
+
+def make_retry_policy(args: argparse.Namespace) -> RetryPolicy:
+    return RetryPolicy(max_attempts=args.max_attempts, max_seconds=args.time_budget, max_tokens=args.token_budget)
+
+def make_model_routing(args: argparse.Namespace) -> ModelRouting:
+    return ModelRouting.parse(args.clarifier_model, args.worker_model, args.reviewer_model)
+
+async def run_once(client: CopilotClient, args: argparse.Namespace) -> int:
+    """Non-interactive mode: one request from the flags, no clarification. Returns the exit code."""
+    prompt = sys.stdin.read() if args.prompt == "-" else args.prompt
+    store = CheckpointStore() if args.checkpoints or args.resume else None
+    repo_url, local_path = None, None
+    if args.repo:
+        if os.path.isdir(args.repo):
+            local_path = os.path.abspath(args.repo)
+        else:
+            repo_url = args.repo
+
+    if args.isolate and not args.resume:
+        # Worktrees of interrupted tasks that were never resumed
+        await asyncio.to_thread(TaskWorkspace.prune_stale)
+
+    # With --json, stdout carries only the result
+    sink = make_event_sink(args, stream=sys.stderr if args.json else None)
+    task_runner = MultiAgentTask(client, model=args.model, enable_pre_review=not args.no_pre_review, event_sink=sink, checkpoint_store=store,
+                                 isolate_workspaces=args.isolate, enable_repo_map=not args.no_repo_map, retry_policy=make_retry_policy(args),
+                                 model_routing=make_model_routing(args))
+    try:
+        if args.resume:
+            result = await task_runner.resume(args.resume)
+        else:
+            task_id = uuid.uuid4().hex[:12]
+            if store:
+                print(f"[System] Task {task_id} (if interrupted: python main.py --resume {task_id})", file=sys.stderr, flush=True)
+            result = None
+            async for event in task_runner.run_stream(prompt, repo_url=repo_url, local_repo_path=local_path, task_id=task_id):
+                if event.kind == "result":
+                    result = event.data["result"]
+    finally:
+        task_runner.close()
+        await sink.close()
+        if store:
+            store.close()
+
+    if args.json:
+        print(json.dumps({
+            "task_id": result.metrics.task_id if result.metrics else None,
+            "success": result.success,
+            "code": result.code,
+            "messages": result.messages,
+            "metrics": result.metrics.to_dict() if result.metrics else None,
+            "branch": result.branch,
+            "patch": result.patch.decode("utf-8", errors="replace") if result.patch else None,
+        }, ensure_ascii=False, indent=2))
+    else:
+        print("\n" + "="*50)
+        print("✅ [SUCCESS] Task completed and passed review." if result.success else "❌ [FAILED] Task failed to pass review after retries.")
+        print(result.code)
+        if result.branch:
+            print(f"\n🌿 Changes committed to branch {result.branch}")
+        elif result.patch:
+            print(f"\n📄 Changes (apply with `git apply` at the repository root):\n{result.patch.decode('utf-8', errors='replace')}")
+    return 0 if result.success else 1
+
+async def serve(client: CopilotClient, args: argparse.Namespace) -> int:
+    """Daemon mode: keeps the client and warm sessions alive and runs jobs from the HTTP API until SIGINT/SIGTERM."""
+    sink = make_event_sink(args, show_task_ids=True)
+    pool = SessionPool(client, max_size=max(16, 2 * (args.concurrency + args.prewarm)), min_idle=max(1, args.prewarm))
+    task_runner = MultiAgentTask(client, model=args.model, session_pool=pool, enable_pre_review=not args.no_pre_review, event_sink=sink,
+                                 checkpoint_store=CheckpointStore() if args.checkpoints else None, isolate_workspaces=args.isolate,
+                                 enable_repo_map=not args.no_repo_map, retry_policy=make_retry_policy(args),
+                                 model_routing=make_model_routing(args))
+    if args.prewarm:
+        await task_runner.prewarm(args.prewarm)
+    if args.isolate:
+        # Worktrees of tasks a previous daemon lost in a crash
+        await asyncio.to_thread(TaskWorkspace.prune_stale)
+
+    server = DaemonServer(JobManager(task_runner, concurrency=args.concurrency), args.host, args.port, args.socket, args.token)
+    await server.start()
+    print(f"🛰️  Multi-Agent daemon listening on {server.address} (concurrency {args.concurrency})", flush=True)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass  # e.g. Windows: Ctrl+C still raises KeyboardInterrupt
+    try:
+        await stop.wait()
+    finally:
+        print("\nShutting down...", flush=True)
+        await server.stop()
+        task_runner.close()
+        await pool.close()
+        await sink.close()
+    return 0
+
+async def main(args: argparse.Namespace) -> int:
+    if args.serve or args.prompt or args.resume:
+        client = CopilotClient()
+        await client.start()
+        try:
+            return await (serve(client, args) if args.serve else run_once(client, args))
+        finally:
+            await client.stop()
+
     try:
         print("Initializing GitHub Copilot Client (Multi-Agent Mode)...")
         print("Note: Ensure the standalone 'copilot' CLI is installed and in your PATH.")
         
         client = CopilotClient()
+        task_runner = None
         try:
             # Start the client explicitly
             await client.start()
             
-            task_runner = MultiAgentTask(client)
+            task_runner = MultiAgentTask(client, model=args.model, enable_pre_review=not args.no_pre_review, enable_repo_map=not args.no_repo_map,
+                                         retry_policy=make_retry_policy(args), model_routing=make_model_routing(args),
+                                         event_sink=make_event_sink(args))
             
             print("\n✅ Multi-Agent System Ready! (Worker + Reviewer + Clarifier)")
             print("Enter your request below (or type 'exit' to quit).")
             
             print("\n🔍 Checking 'workspaces' directory for existing repositories...")
             os.makedirs("workspaces", exist_ok=True)
-            existing_repos = [d for d in os.listdir("workspaces") if os.path.isdir(os.path.join("workspaces", d))]
+            existing_repos = [d for d in os.listdir("workspaces") if not d.startswith(".") and os.path.isdir(os.path.join("workspaces", d))]
             
             repo_url = None
             local_path = None
@@ -63,14 +228,7 @@ async def main():
                         print(f"⬇️ Cloning {repo_url}...")
                         try:
                             # Use RepositorySkill directly to clone
-                            repo_skill = RepositorySkill()
-                            result_msg = repo_skill.clone_repository(CloneRepoParams(repo_url=repo_url))
-                            
-                            # Parse content to find path (or modify skill to return path cleanly, but for now assuming standard structure)
-                            # The skill returns a message string. Let's re-derive path or parse it.
-                            # Skill logic: repo_name = params.repo_url.split("/")[-1].replace(".git", "")
-                            repo_name = repo_url.split("/")[-1].replace(".git", "")
-                            local_path = os.path.abspath(os.path.join("workspaces", repo_name))
+                            local_path = await RepositorySkill().checkout(repo_url)
                             
                             print(f"✅ Cloned to: {local_path}")
                             repo_url = None # Clear URL since we now have a local path
@@ -116,11 +274,15 @@ async def main():
                 print("\n❌ [FAILED] Task failed to pass review after retries.")
                 print(f"Last candidate code:\n{result.code[:500]}...")
         finally:
+            if task_runner is not None:
+                task_runner.close()
             # Ensure client is stopped
             await client.stop()
 
     except Exception as ex:
         print(f"\nProgram Error: {ex}")
+        return 1
+    return 0
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    sys.exit(asyncio.run(main(parse_args())))
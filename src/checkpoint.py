@@ -0,0 +1,89 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from dataclasses import asdict, dataclass, field, fields
+from typing import List, Optional
+
+@dataclass
+class TaskCheckpoint:
+    """State of a `MultiAgentTask` run after its last completed step."""
+    task_id: str
+    user_prompt: str
+    repo_url: Optional[str] = None
+    working_dir: Optional[str] = None
+    status: str = "running"       # running / succeeded / failed
+    phase: str = "started"        # Last completed step: started / clarify / work / pre_review / review
+    attempt: int = 0              # 1-based attempt of that step (0 before the first attempt)
+    final_requirements: Optional[str] = None
+    current_code: str = ""        # Latest Worker output
+    feedback: str = ""            # Latest Reviewer / pre-review feedback
+    reviewed_code: str = ""       # Output the Reviewer saw last
+    reviews: int = 0
+    base_tree: Optional[str] = None       # Workspace snapshot (git tree) when the attempt started
+    workspace_tree: Optional[str] = None  # Workspace snapshot after the step
+    attempt_started: float = 0.0
+    stop_reason: str = ""         # Why the retry policy gave up on a failed task
+    created: float = field(default_factory=time.time)
+    updated: float = field(default_factory=time.time)
+
+class CheckpointStore:
+    """
+    SQLite store of `TaskCheckpoint`s, one row per task, overwritten after every step so
+    `MultiAgentTask.resume(task_id)` can pick a task up after the process died.
+    Finished tasks are kept for `ttl` seconds.
+    """
+    def __init__(self, path: str = os.path.join("workspaces", ".cache", "checkpoints.sqlite"), ttl: Optional[float] = 7 * 24 * 3600):
+        """
+        :param ttl: (可選) Seconds finished tasks are kept; None keeps them until deleted
+        """
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS checkpoints ("
+                "task_id TEXT PRIMARY KEY, status TEXT NOT NULL, state TEXT NOT NULL, updated REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS checkpoints_status ON checkpoints(status, updated)")
+
+    def save(self, checkpoint: TaskCheckpoint):
+        checkpoint.updated = time.time()
+        state = json.dumps(asdict(checkpoint), ensure_ascii=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO checkpoints (task_id, status, state, updated) VALUES (?, ?, ?, ?)",
+                (checkpoint.task_id, checkpoint.status, state, checkpoint.updated)
+            )
+            if self.ttl is not None:
+                self._conn.execute("DELETE FROM checkpoints WHERE status != 'running' AND updated < ?", (checkpoint.updated - self.ttl,))
+
+    def load(self, task_id: str) -> Optional[TaskCheckpoint]:
+        with self._lock:
+            row = self._conn.execute("SELECT state FROM checkpoints WHERE task_id = ?", (task_id,)).fetchone()
+        if row is None:
+            return None
+        known = {f.name for f in fields(TaskCheckpoint)}
+        return TaskCheckpoint(**{k: v for k, v in json.loads(row[0]).items() if k in known})
+
+    def list(self, status: Optional[str] = None) -> List[TaskCheckpoint]:
+        """Checkpoints, most recently updated first (e.g. `list("running")` for tasks to resume)."""
+        with self._lock:
+            if status is None:
+                rows = self._conn.execute("SELECT task_id FROM checkpoints ORDER BY updated DESC").fetchall()
+            else:
+                rows = self._conn.execute("SELECT task_id FROM checkpoints WHERE status = ? ORDER BY updated DESC", (status,)).fetchall()
+        return [cp for cp in (self.load(r[0]) for r in rows) if cp is not None]
+
+    def delete(self, task_id: str):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM checkpoints WHERE task_id = ?", (task_id,))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
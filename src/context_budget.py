@@ -0,0 +1,66 @@
+from dataclasses import dataclass
+from typing import Any, Callable
+from copilot import SessionEvent
+from copilot.generated.session_events import SessionEventType
+
+COMPACTION_PROMPT = (
+    "Your context is getting long. Write a compact summary of this task so far so that it can be continued "
+    "in a fresh conversation: the goal, decisions made, files created or changed (paths only), the current "
+    "state of your latest output, and open issues. Do NOT include file contents, directory listings or other "
+    "tool outputs; they can be re-read when needed."
+)
+
+@dataclass
+class ContextBudget:
+    """Token budget for one agent session."""
+    max_tokens: int = 100_000
+    # Compact once the estimated context reaches this fraction of max_tokens
+    compact_ratio: float = 0.75
+    # Rough chars-per-token ratio used when the SDK doesn't report usage
+    chars_per_token: float = 4.0
+    # Upper bound on the summary carried over into the fresh session
+    max_summary_chars: int = 8000
+
+    @property
+    def threshold(self) -> int:
+        return int(self.max_tokens * self.compact_ratio)
+
+class ContextTracker:
+    """
+    Estimates how large a session's context has grown from its events: prompts sent,
+    assistant messages and tool results. When the SDK reports usage, the reported
+    input + output tokens of the last turn (which is the real context size) win.
+    """
+    def __init__(self, budget: ContextBudget):
+        self.budget = budget
+        self.tokens = 0
+        self.compactions = 0
+
+    def estimate(self, text: str) -> int:
+        return int(len(text) / self.budget.chars_per_token) + 1
+
+    def add_text(self, text: str):
+        self.tokens += self.estimate(text)
+
+    def reset(self, carried_over: str = ""):
+        self.tokens = self.estimate(carried_over) if carried_over else 0
+
+    @property
+    def over_budget(self) -> bool:
+        return self.tokens >= self.budget.threshold
+
+    def on_event(self, event: SessionEvent):
+        data = getattr(event, "data", None)
+        if event.type == SessionEventType.ASSISTANT_MESSAGE:
+            self.add_text(getattr(data, "content", None) or "")
+        elif event.type == SessionEventType.TOOL_EXECUTION_COMPLETE:
+            result = getattr(data, "result", None)
+            text = getattr(result, "content", None) if result is not None else None
+            self.add_text(text if isinstance(text, str) else str(result or ""))
+        elif event.type == getattr(SessionEventType, "ASSISTANT_USAGE", None):
+            input_tokens = getattr(data, "input_tokens", None)
+            if input_tokens:
+                self.tokens = int(input_tokens) + int(getattr(data, "output_tokens", None) or 0)
+
+    def attach(self, session: Any) -> Callable[[], None]:
+        return session.on(self.on_event)
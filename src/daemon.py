@@ -0,0 +1,444 @@
+"""
+Long-lived job server: keeps one `CopilotClient` (and its warm sessions) alive and runs
+`MultiAgentTask` jobs submitted over a small local HTTP API, on TCP or a Unix socket.
+
+    POST   /jobs                 {"prompt": ..., "repo_url": ..., "local_repo_path": ...} -> 202 job
+    GET    /jobs                 all known jobs
+    GET    /jobs/<id>            status (and result once finished)
+    GET    /jobs/<id>/events     ?since=<seq> events after <seq>, for polling
+    GET    /jobs/<id>/stream     the job's events as NDJSON, streamed until it finishes
+    DELETE /jobs/<id>            cancel a queued or running job
+    GET    /health, GET /metrics (Prometheus text of finished jobs)
+
+Jobs run non-interactively (no clarification phase).
+
+A web page can send requests to a local port too, so the server only accepts requests whose
+Host header names a loopback address (when it listens on one), POST bodies must be sent as
+`Content-Type: application/json` (which browsers can't do cross-origin without a CORS preflight
+this server never grants), and with a `token` every request but /health needs
+`Authorization: Bearer <token>`.
+"""
+import asyncio
+import hmac
+import ipaddress
+import json
+import os
+import time
+import uuid
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+from src.event_sink import AgentEvent
+from src.metrics import prometheus_text
+from src.multi_agent import AgentResult, MultiAgentTask
+
+MAX_BODY_BYTES = 1024 * 1024
+
+@dataclass
+class Job:
+    job_id: str
+    prompt: str
+    repo_url: Optional[str] = None
+    local_repo_path: Optional[str] = None
+    status: str = "queued"  # queued / running / succeeded / failed / cancelled
+    created: float = field(default_factory=time.time)
+    started: Optional[float] = None
+    finished: Optional[float] = None
+    error: Optional[str] = None
+    result: Optional[AgentResult] = None
+    # (seq, event dict); the oldest entries are dropped past JobManager.max_events_per_job
+    events: Deque[Tuple[int, Dict[str, Any]]] = field(default_factory=deque)
+    next_seq: int = 1
+
+    def __post_init__(self):
+        self._updated = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("succeeded", "failed", "cancelled")
+
+    def add_event(self, event: Dict[str, Any]):
+        self.events.append((self.next_seq, event))
+        self.next_seq += 1
+        self._notify()
+
+    def _notify(self):
+        # Wake everyone waiting on the current event, then start a new one
+        updated, self._updated = self._updated, asyncio.Event()
+        updated.set()
+
+    def events_since(self, seq: int) -> List[Dict[str, Any]]:
+        return [{"seq": s, **e} for s, e in self.events if s > seq]
+
+    def changed(self) -> asyncio.Event:
+        """Set on the job's next change; take it before reading the state it guards."""
+        return self._updated
+
+    def to_dict(self, include_result: bool = True) -> Dict[str, Any]:
+        out = {
+            "job_id": self.job_id,
+            "status": self.status,
+            "prompt": self.prompt,
+            "repo_url": self.repo_url,
+            "local_repo_path": self.local_repo_path,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "error": self.error,
+            "last_seq": self.next_seq - 1,
+        }
+        if include_result and self.result is not None:
+            out["result"] = {
+                "success": self.result.success,
+                "code": self.result.code,
+                "messages": self.result.messages,
+                "metrics": self.result.metrics.to_dict() if self.result.metrics else None,
+                "branch": self.result.branch,
+                "patch": self.result.patch.decode("utf-8", errors="replace") if self.result.patch else None,
+            }
+        return out
+
+class JobManager:
+    """FIFO job queue in front of a shared `MultiAgentTask`, with `concurrency` jobs running at once."""
+    def __init__(self, task: MultiAgentTask, concurrency: int = 2, max_events_per_job: int = 5000, max_finished_jobs: int = 200):
+        """
+        :param max_events_per_job: Events kept per job for polling/streaming (the oldest are dropped)
+        :param max_finished_jobs: Finished jobs kept for status queries before the oldest are forgotten
+        """
+        if concurrency < 1:
+            raise ValueError("concurrency must be >= 1")
+        self.task = task
+        self.concurrency = concurrency
+        self.max_events_per_job = max_events_per_job
+        self.max_finished_jobs = max_finished_jobs
+        self.jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._workers: List[asyncio.Task] = []
+
+    def start(self):
+        if not self._workers:
+            self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def stop(self):
+        running = [job._task for job in self.jobs.values() if job._task is not None]
+        for job in list(self.jobs.values()):
+            if not job.done:
+                self.cancel(job.job_id)
+        # Let cancelled jobs release their sessions before the workers go away
+        await asyncio.gather(*running, return_exceptions=True)
+        for w in self._workers:
+            w.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def submit(self, prompt: str, repo_url: Optional[str] = None, local_repo_path: Optional[str] = None) -> Job:
+        job = Job(uuid.uuid4().hex[:12], prompt, repo_url, local_repo_path)
+        job.events = deque(maxlen=self.max_events_per_job)
+        self.jobs[job.job_id] = job
+        self._queue.put_nowait(job)
+        self._forget_finished()
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> bool:
+        job = self.jobs.get(job_id)
+        if job is None or job.done:
+            return False
+        if job._task is not None:
+            job._task.cancel()
+        else:
+            # Still queued: the worker skips it
+            self._finish(job, "cancelled")
+        return True
+
+    def _forget_finished(self):
+        finished = [j for j in self.jobs.values() if j.done]
+        for job in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+            del self.jobs[job.job_id]
+
+    def _finish(self, job: Job, status: str, error: Optional[str] = None):
+        job.status = status
+        job.error = error
+        job.finished = time.time()
+        job._notify()
+
+    async def _run_job(self, job: Job):
+        async for event in self.task.run_stream(job.prompt, repo_url=job.repo_url, local_repo_path=job.local_repo_path):
+            if event.kind == "result":
+                job.result = event.data["result"]
+                event = AgentEvent(event.kind, event.task_id, event.agent, event.text,
+                                   {k: v for k, v in event.data.items() if k != "result"}, event.timestamp)
+            job.add_event(event.to_dict())
+
+    async def _worker(self):
+        while True:
+            job: Job = await self._queue.get()
+            if job.done:
+                continue
+            job.status = "running"
+            job.started = time.time()
+            job._notify()
+            job._task = asyncio.create_task(self._run_job(job))
+            try:
+                await job._task
+            except asyncio.CancelledError:
+                if not job._task.cancelled():
+                    # The worker itself is being stopped
+                    job._task.cancel()
+                    self._finish(job, "cancelled")
+                    raise
+                self._finish(job, "cancelled")
+            except Exception as e:
+                self._finish(job, "failed", str(e))
+            else:
+                self._finish(job, "succeeded" if job.result and job.result.success else "failed")
+            finally:
+                job._task = None
+            self._forget_finished()
+
+class HttpError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+_REASONS = {200: "OK", 202: "Accepted", 400: "Bad Request", 401: "Unauthorized", 403: "Forbidden", 404: "Not Found",
+            405: "Method Not Allowed", 409: "Conflict", 413: "Payload Too Large", 415: "Unsupported Media Type",
+            500: "Internal Server Error"}
+
+# Seconds between keepalive lines on an idle event stream
+STREAM_HEARTBEAT = 15.0
+
+def _is_loopback(host: str) -> bool:
+    """Whether `host` (a name or address, optionally with a port, IPv6 in brackets) is a loopback address."""
+    host = host.strip().lower()
+    if host.startswith("["):
+        host = host[1:host.find("]")] if "]" in host else host[1:]
+    elif host.count(":") == 1:
+        host = host.rsplit(":", 1)[0]
+    if host == "localhost" or host.endswith(".localhost"):
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+class DaemonServer:
+    """Minimal HTTP/1.1 front end for a `JobManager` (one request per connection)."""
+    def __init__(self, manager: JobManager, host: str = "127.0.0.1", port: int = 8765, unix_socket: Optional[str] = None,
+                 token: Optional[str] = None):
+        """
+        :param unix_socket: (可選) Listen on this Unix socket path instead of host:port
+        :param token: (可選) Bearer token every request but /health must carry; required to listen on a non-loopback host
+        """
+        if not unix_socket and not token and not _is_loopback(host):
+            raise ValueError(f"Listening on {host} (not a loopback address) requires a token.")
+        self.manager = manager
+        self.host = host
+        self.port = port
+        self.unix_socket = unix_socket
+        self.token = token
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    @property
+    def address(self) -> str:
+        if self.unix_socket:
+            return f"unix:{self.unix_socket}"
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self):
+        self.manager.start()
+        if self.unix_socket:
+            if os.path.exists(self.unix_socket):
+                os.unlink(self.unix_socket)
+            self._server = await asyncio.start_unix_server(self._handle, path=self.unix_socket)
+        else:
+            self._server = await asyncio.start_server(self._handle, self.host, self.port)
+            # Port 0 picks a free port
+            self.port = self._server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self):
+        if self._server is None:
+            await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        await self.manager.stop()
+        if self.unix_socket and os.path.exists(self.unix_socket):
+            os.unlink(self.unix_socket)
+
+    # --- HTTP plumbing ---
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> Tuple[str, str, Dict[str, str], bytes]:
+        request_line = (await reader.readline()).decode("latin-1").strip()
+        parts = request_line.split()
+        if len(parts) != 3:
+            raise HttpError(400, "Malformed request line.")
+        method, target, _ = parts
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode("latin-1")
+            if line in ("\r\n", "\n", ""):
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        raw_length = headers.get("content-length") or "0"
+        if not raw_length.isdigit():
+            raise HttpError(400, "Malformed Content-Length header.")
+        length = int(raw_length)
+        if length > MAX_BODY_BYTES:
+            raise HttpError(413, "Request body too large.")
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), target, headers, body
+
+    @staticmethod
+    async def _respond(writer: asyncio.StreamWriter, status: int, payload: Any, content_type: str = "application/json"):
+        body = payload if isinstance(payload, bytes) else (
+            payload.encode("utf-8") if isinstance(payload, str) else json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+        )
+        head = (
+            f"HTTP/1.1 {status} {_REASONS.get(status, '')}\r\n"
+            f"Content-Type: {content_type}; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: close\r\n\r\n"
+        )
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            try:
+                method, target, headers, body = await self._read_request(reader)
+                self._check_request(method, target, headers)
+                await self._route(writer, method, target, body)
+            except HttpError as e:
+                await self._respond(writer, e.status, {"error": str(e)})
+            except (ConnectionError, asyncio.IncompleteReadError):
+                pass
+            except Exception as e:
+                await self._respond(writer, 500, {"error": str(e)})
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    def _check_request(self, method: str, target: str, headers: Dict[str, str]):
+        # Browsers let any page reach a local port; a foreign Host header means DNS rebinding
+        if not self.unix_socket and _is_loopback(self.host) and not _is_loopback(headers.get("host", "")):
+            raise HttpError(403, "Host header must name a loopback address.")
+        if self.token and urlsplit(target).path.rstrip("/") != "/health":
+            scheme, _, credentials = headers.get("authorization", "").partition(" ")
+            if scheme.lower() != "bearer" or not hmac.compare_digest(credentials.strip().encode("utf-8"), self.token.encode("utf-8")):
+                raise HttpError(401, "Missing or invalid bearer token.")
+        if method == "POST" and headers.get("content-type", "").split(";")[0].strip().lower() != "application/json":
+            raise HttpError(415, "POST bodies must be sent as Content-Type: application/json.")
+
+    # --- Routes ---
+
+    def _job(self, job_id: str) -> Job:
+        job = self.manager.get(job_id)
+        if job is None:
+            raise HttpError(404, f"Unknown job: {job_id}")
+        return job
+
+    @staticmethod
+    def _since(query: Dict[str, List[str]]) -> int:
+        try:
+            return int(query.get("since", ["0"])[0])
+        except ValueError:
+            raise HttpError(400, "'since' must be an integer.")
+
+    async def _route(self, writer: asyncio.StreamWriter, method: str, target: str, body: bytes):
+        url = urlsplit(target)
+        query = parse_qs(url.query)
+        parts = [p for p in url.path.split("/") if p]
+
+        if parts == ["health"] and method == "GET":
+            queued = sum(1 for j in self.manager.jobs.values() if j.status == "queued")
+            running = sum(1 for j in self.manager.jobs.values() if j.status == "running")
+            return await self._respond(writer, 200, {"status": "ok", "queued": queued, "running": running})
+        if parts == ["metrics"] and method == "GET":
+            finished = [j.result.metrics for j in self.manager.jobs.values() if j.result and j.result.metrics]
+            return await self._respond(writer, 200, prometheus_text(finished), content_type="text/plain; version=0.0.4")
+
+        if parts == ["jobs"]:
+            if method == "GET":
+                return await self._respond(writer, 200, [j.to_dict(include_result=False) for j in self.manager.jobs.values()])
+            if method == "POST":
+                try:
+                    data = json.loads(body or b"{}")
+                except json.JSONDecodeError as e:
+                    raise HttpError(400, f"Invalid JSON: {e}")
+                prompt = data.get("prompt") if isinstance(data, dict) else None
+                if not isinstance(prompt, str) or not prompt.strip():
+                    raise HttpError(400, "'prompt' is required.")
+                local_repo_path = data.get("local_repo_path")
+                if local_repo_path:
+                    if not os.path.isdir(local_repo_path):
+                        raise HttpError(400, f"local_repo_path does not exist: {local_repo_path}")
+                    local_repo_path = os.path.abspath(local_repo_path)
+                job = self.manager.submit(prompt, data.get("repo_url"), local_repo_path)
+                return await self._respond(writer, 202, job.to_dict())
+            raise HttpError(405, f"{method} not allowed on /jobs")
+
+        if len(parts) >= 2 and parts[0] == "jobs":
+            job = self._job(parts[1])
+            if len(parts) == 2:
+                if method == "GET":
+                    return await self._respond(writer, 200, job.to_dict())
+                if method == "DELETE":
+                    if not self.manager.cancel(job.job_id):
+                        raise HttpError(409, f"Job {job.job_id} already finished ({job.status}).")
+                    return await self._respond(writer, 200, {"job_id": job.job_id, "cancelled": True})
+            elif parts[2:] == ["events"] and method == "GET":
+                return await self._respond(writer, 200, {"status": job.status, "events": job.events_since(self._since(query))})
+            elif parts[2:] == ["stream"] and method == "GET":
+                return await self._stream(writer, job, self._since(query))
+            raise HttpError(405 if len(parts) <= 3 else 404, f"{method} not allowed on {url.path}")
+
+        raise HttpError(404, f"Not found: {url.path}")
+
+    async def _stream(self, writer: asyncio.StreamWriter, job: Job, since: int):
+        """Chunked NDJSON: one event per line, then a final status line once the job is done."""
+        writer.write((
+            "HTTP/1.1 200 OK\r\n"
+            "Content-Type: application/x-ndjson; charset=utf-8\r\n"
+            "Transfer-Encoding: chunked\r\n"
+            "Connection: close\r\n\r\n"
+        ).encode("latin-1"))
+
+        async def send(lines: List[str]):
+            if lines:
+                data = "".join(lines).encode("utf-8")
+                writer.write(f"{len(data):x}\r\n".encode("latin-1") + data + b"\r\n")
+                await writer.drain()
+
+        while True:
+            changed = job.changed()
+            finished = job.done
+            events = job.events_since(since)
+            if events:
+                since = events[-1]["seq"]
+            await send([json.dumps(e, ensure_ascii=False, default=str) + "\n" for e in events])
+            if finished:
+                break
+            try:
+                await asyncio.wait_for(changed.wait(), STREAM_HEARTBEAT)
+            except asyncio.TimeoutError:
+                # Keepalive (an empty line, which NDJSON readers skip): writing to a vanished client fails
+                await send(["\n"])
+        await send([json.dumps({"job": job.to_dict()}, ensure_ascii=False, default=str) + "\n"])
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
@@ -0,0 +1,239 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import threading
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from typing import Any, Deque, Dict, List, Literal, Optional, Set, TextIO
+
+OverflowPolicy = Literal["drop_newest", "drop_oldest", "backpressure"]
+
+@dataclass
+class AgentEvent:
+    """One structured event of a task, as written to an `EventSink`."""
+    kind: str                    # phase / assistant_delta / assistant_message / tool_start / tool_complete / verdict / info / error / result
+    task_id: str
+    agent: Optional[str] = None  # Clarifier / Worker / Reviewer / None for orchestration events
+    text: str = ""
+    data: Dict[str, Any] = field(default_factory=dict)
+    timestamp: float = field(default_factory=time.time)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+# --- Backends ---
+
+class ConsoleBackend:
+    """Renders events as the human-readable console output, one write per batch."""
+    def __init__(self, stream: Optional[TextIO] = None, stream_deltas: bool = False, show_task_ids: bool = False):
+        """
+        :param stream_deltas: Print assistant output chunk by chunk instead of once per message
+        :param show_task_ids: Prefix lines with the task id (useful with concurrent tasks)
+        """
+        self.stream = stream
+        self.stream_deltas = stream_deltas
+        self.show_task_ids = show_task_ids
+
+    def format(self, event: AgentEvent) -> str:
+        prefix = f"[{event.task_id}] " if self.show_task_ids else ""
+        if event.kind == "assistant_delta":
+            return event.text if self.stream_deltas else ""
+        if event.kind == "assistant_message":
+            return "" if self.stream_deltas else event.text
+        if event.kind == "phase":
+            return f"\n\n{prefix}--- [{event.text}] ---\n"
+        if event.kind == "tool_start":
+            return f"\n{prefix}[{event.agent}] 🛠️  Using Tool: {event.text}"
+        if event.kind == "error":
+            return f"\n{prefix}[{event.agent}] ❌ Error: {event.text}"
+        if event.kind in ("info", "verdict"):
+            return f"\n{prefix}[{event.agent or 'System'}] {event.text}"
+        return ""
+
+    async def write_batch(self, events: List[AgentEvent]):
+        text = "".join(self.format(e) for e in events)
+        if text:
+            stream = self.stream or sys.stdout
+            stream.write(text)
+            stream.flush()
+
+    async def close(self):
+        pass
+
+class JsonlBackend:
+    """Appends one JSON object per event to a file; writes happen off the event loop."""
+    def __init__(self, path: str):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+
+    def _write(self, lines: str):
+        self._file.write(lines)
+        self._file.flush()
+
+    async def write_batch(self, events: List[AgentEvent]):
+        lines = "".join(json.dumps(e.to_dict(), ensure_ascii=False, default=str) + "\n" for e in events)
+        await asyncio.to_thread(self._write, lines)
+
+    async def close(self):
+        await asyncio.to_thread(self._file.close)
+
+class MemoryBackend:
+    """Keeps the most recent `max_events` events in memory (e.g. for tests or a status endpoint)."""
+    def __init__(self, max_events: Optional[int] = 10000):
+        self.events: Deque[AgentEvent] = deque(maxlen=max_events)
+
+    async def write_batch(self, events: List[AgentEvent]):
+        self.events.extend(events)
+
+    async def close(self):
+        pass
+
+# --- Sink ---
+
+# The event loop only keeps weak references to tasks; hold running writers until they finish
+_writers: Set[asyncio.Task] = set()
+
+class EventSink:
+    """
+    Buffered, asynchronous fan-out of `AgentEvent`s to one or more backends.
+
+    `emit` never blocks: it can be called from SDK event callbacks (on or off the loop's
+    thread) and only enqueues. A writer task drains the queue in batches of up to
+    `batch_size` events (or whatever arrived within `flush_interval`), hands each batch to
+    every backend and exits once the queue is empty. When the queue is full the `policy` decides:
+        drop_newest:  the new event is dropped
+        drop_oldest:  the oldest queued event is dropped
+        backpressure: nothing is dropped; events overflow into a side buffer and producers
+                      that `await wait_for_capacity()` are held until the writer catches up
+    """
+    def __init__(self, backends: Optional[List[Any]] = None, max_queue: int = 10000, batch_size: int = 256,
+                 flush_interval: float = 0.05, policy: OverflowPolicy = "drop_oldest"):
+        """
+        :param backends: (可選) Defaults to a single `ConsoleBackend`; pass [] to discard events
+        :param flush_interval: Seconds the writer waits for more events before writing a partial batch
+        """
+        if policy not in ("drop_newest", "drop_oldest", "backpressure"):
+            raise ValueError(f"Unknown overflow policy: {policy}")
+        self.backends = backends if backends is not None else [ConsoleBackend()]
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.policy = policy
+        self.dropped = 0
+        self.written = 0
+        self._queue: Deque[AgentEvent] = deque()
+        self._overflow: Deque[AgentEvent] = deque()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+        self._writer: Optional[asyncio.Task] = None
+        self._space: Optional[asyncio.Event] = None
+        self._flush_now: Optional[asyncio.Event] = None
+        self._closed = False
+
+    def _bind(self) -> bool:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return False
+        if self._loop is not loop:
+            # First use, or a sink reused across asyncio.run calls
+            self._loop = loop
+            self._loop_thread = threading.get_ident()
+            self._writer = None
+            self._space = asyncio.Event()
+            self._space.set()
+            self._flush_now = asyncio.Event()
+        return True
+
+    def emit(self, event: AgentEvent):
+        if self._closed:
+            return
+        if self._loop is not None and threading.get_ident() != self._loop_thread:
+            try:
+                self._loop.call_soon_threadsafe(self._enqueue, event)
+            except RuntimeError:
+                # The loop is closed
+                self.dropped += 1
+            return
+        if not self._bind():
+            # No event loop (e.g. called from a plain thread before any task ran): drop rather than block
+            self.dropped += 1
+            return
+        self._enqueue(event)
+
+    def _enqueue(self, event: AgentEvent):
+        if self._overflow or len(self._queue) >= self.max_queue:
+            if self.policy == "drop_newest":
+                self.dropped += 1
+                return
+            if self.policy == "drop_oldest":
+                self._queue.popleft()
+                self.dropped += 1
+            else:
+                self._overflow.append(event)
+                self._space.clear()
+                return
+        self._queue.append(event)
+        if self._writer is None or self._writer.done():
+            self._writer = self._loop.create_task(self._run())
+            _writers.add(self._writer)
+            self._writer.add_done_callback(_writers.discard)
+
+    async def wait_for_capacity(self):
+        """Backpressure point for producers: returns once the queue has room again."""
+        if self._space is not None and self.policy == "backpressure":
+            await self._space.wait()
+
+    async def _run(self):
+        while self._queue:
+            if self.flush_interval and len(self._queue) < self.batch_size and not self._flush_now.is_set():
+                # Give a burst of events the chance to land in the same batch (cut short by `flush`)
+                try:
+                    await asyncio.wait_for(self._flush_now.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            batch = []
+            while self._queue and len(batch) < self.batch_size:
+                batch.append(self._queue.popleft())
+            # Refill from the overflow buffer in arrival order
+            while self._overflow and len(self._queue) < self.max_queue:
+                self._queue.append(self._overflow.popleft())
+            if not self._overflow:
+                self._space.set()
+            for backend in self.backends:
+                try:
+                    await backend.write_batch(batch)
+                except Exception as e:
+                    sys.stderr.write(f"[EventSink] {type(backend).__name__} failed: {e}\n")
+            self.written += len(batch)
+        self._flush_now.clear()
+
+    async def flush(self):
+        """Waits until every event emitted so far has been written."""
+        while self._writer is not None and not self._writer.done() and self._loop is asyncio.get_running_loop():
+            self._flush_now.set()
+            await asyncio.wait({self._writer})
+
+    async def close(self):
+        await self.flush()
+        self._closed = True
+        for backend in self.backends:
+            await backend.close()
+
+class TaskEventEmitter:
+    """Creates events for one task and sends them to the sink (and any extra listeners)."""
+    def __init__(self, sink: EventSink, task_id: str, listeners: Optional[List[Any]] = None):
+        self.sink = sink
+        self.task_id = task_id
+        self.listeners = listeners or []
+
+    def __call__(self, kind: str, agent: Optional[str] = None, text: str = "", **data) -> AgentEvent:
+        event = AgentEvent(kind, self.task_id, agent, text or "", data)
+        self.sink.emit(event)
+        for listener in self.listeners:
+            listener(event)
+        return event
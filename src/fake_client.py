@@ -0,0 +1,208 @@
+"""
+In-process stand-in for `CopilotClient`, for benchmarks and offline runs.
+
+Sessions answer from a script instead of a model: each turn can call the session's tools
+(through their real handlers), streams its reply as ASSISTANT_MESSAGE_DELTA events with a
+configurable latency, then emits ASSISTANT_MESSAGE, ASSISTANT_USAGE and SESSION_IDLE like
+the real SDK does.
+"""
+import asyncio
+import itertools
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional, Union
+from copilot import SessionEvent
+from copilot.generated import session_events
+from copilot.generated.session_events import SessionEventType
+from copilot.tools import ToolInvocation
+
+@dataclass
+class FakeToolCall:
+    name: str
+    arguments: Dict[str, Any] = field(default_factory=dict)
+
+@dataclass
+class FakeTurn:
+    """A scripted assistant turn: tool calls first, then the final message."""
+    content: str
+    tool_calls: List[FakeToolCall] = field(default_factory=list)
+
+# (session config, prompt, index of the turn within the session) -> reply
+FakeScript = Callable[[Dict[str, Any], str, int], Union[str, FakeTurn]]
+
+def default_script(config: Dict[str, Any], prompt: str, turn: int) -> Union[str, FakeTurn]:
+    """Clarifiers finalize the prompt as-is, Reviewers pass everything, Workers answer with a small code block."""
+    if any(t.name == "finalize_requirements" for t in config.get("tools") or []):
+        return FakeTurn("Requirements are clear.", [FakeToolCall("finalize_requirements", {"summary": prompt})])
+    if "Reviewer" in (config.get("system_message") or "").split("。")[0]:
+        return "PASS"
+    return f"```python\ndef solution():\n    # {prompt.strip().splitlines()[0][:60] if prompt.strip() else ''}\n    return 42\n```"
+
+def _make_event(event_type: SessionEventType, **fields) -> Any:
+    data_cls = getattr(session_events, "Data", None) or getattr(session_events, "SessionEventData", None)
+    try:
+        data = data_cls(**fields)
+    except TypeError:
+        # Field names differ between SDK versions; the orchestration code reads them with getattr
+        data = SimpleNamespace(**fields)
+    return SessionEvent(data=data, id=uuid.uuid4(), timestamp=datetime.now(timezone.utc), type=event_type)
+
+def _result_text(result: Any) -> str:
+    if isinstance(result, dict):
+        return result.get("textResultForLlm") or result.get("text_result_for_llm") or ""
+    return getattr(result, "text_result_for_llm", None) or str(result or "")
+
+def _prompt_of(options: Any) -> str:
+    return options["prompt"] if isinstance(options, dict) else options.prompt
+
+@dataclass
+class FakeStats:
+    sessions_created: int = 0
+    sessions_destroyed: int = 0
+    turns: int = 0
+    tool_calls: int = 0
+    # Seconds of simulated model latency (time-to-first-token + streaming), summed over all turns
+    model_time: float = 0.0
+    tool_time: float = 0.0
+    # Wall time of every turn (tools + model), keyed by the first sentence of the session's system message
+    turn_times: Dict[str, List[float]] = field(default_factory=dict)
+
+class FakeSession:
+    def __init__(self, client: "FakeCopilotClient", config: Dict[str, Any]):
+        self.client = client
+        self.config = config
+        self.session_id = str(uuid.uuid4())
+        self.prompts: List[str] = []
+        self.destroyed = False
+        self._handlers: List[Callable[[Any], None]] = []
+        self._tools = {t.name: t for t in config.get("tools") or []}
+
+    def on(self, handler: Callable[[Any], None]) -> Callable[[], None]:
+        self._handlers.append(handler)
+
+        def unsubscribe():
+            if handler in self._handlers:
+                self._handlers.remove(handler)
+        return unsubscribe
+
+    def _emit(self, event_type: SessionEventType, **fields) -> Any:
+        event = _make_event(event_type, **fields)
+        for handler in list(self._handlers):
+            handler(event)
+        return event
+
+    async def _call_tool(self, call: FakeToolCall) -> None:
+        call_id = f"call_{next(self.client._ids)}"
+        self._emit(SessionEventType.TOOL_EXECUTION_START, tool_call_id=call_id, tool_name=call.name, name=call.name, arguments=call.arguments)
+        started = time.perf_counter()
+        tool = self._tools.get(call.name)
+        if tool is None:
+            text = f"Tool '{call.name}' is not available in this session."
+        else:
+            result = await tool.handler(ToolInvocation(
+                session_id=self.session_id, tool_call_id=call_id, tool_name=call.name, arguments=call.arguments
+            ))
+            text = _result_text(result)
+        if self.client.tool_latency:
+            await asyncio.sleep(self.client.tool_latency)
+        self.client.stats.tool_time += time.perf_counter() - started
+        self.client.stats.tool_calls += 1
+        self._emit(SessionEventType.TOOL_EXECUTION_COMPLETE, tool_call_id=call_id, success=True, result=SimpleNamespace(content=text))
+
+    async def _turn(self, prompt: str) -> Any:
+        if self.destroyed:
+            raise RuntimeError("Session has been destroyed.")
+        turn_started = time.perf_counter()
+        self.prompts.append(prompt)
+        reply = self.client.script(self.config, prompt, len(self.prompts) - 1)
+        turn = reply if isinstance(reply, FakeTurn) else FakeTurn(content=reply)
+        self.client.stats.turns += 1
+
+        for call in turn.tool_calls:
+            await self._call_tool(call)
+
+        client = self.client
+        started = time.perf_counter()
+        await asyncio.sleep(client.first_token_latency)
+        chunks = [turn.content[i:i + client.chunk_size] for i in range(0, len(turn.content), client.chunk_size)] or [""]
+        for i, chunk in enumerate(chunks):
+            if i and client.chunk_latency:
+                await asyncio.sleep(client.chunk_latency)
+            self._emit(SessionEventType.ASSISTANT_MESSAGE_DELTA, delta_content=chunk)
+        client.stats.model_time += time.perf_counter() - started
+
+        role = (self.config.get("system_message") or "").split("。")[0]
+        client.stats.turn_times.setdefault(role, []).append(time.perf_counter() - turn_started)
+
+        event = self._emit(SessionEventType.ASSISTANT_MESSAGE, content=turn.content)
+        self._emit(
+            SessionEventType.ASSISTANT_USAGE, model=self.config.get("model"),
+            input_tokens=sum(len(p) for p in self.prompts) // 4 + 1, output_tokens=len(turn.content) // 4 + 1
+        )
+        self._emit(SessionEventType.SESSION_IDLE)
+        return event
+
+    async def send(self, options: Any) -> str:
+        """Starts a turn in the background, like the real `send`; SESSION_IDLE marks its end."""
+        task = asyncio.create_task(self._turn(_prompt_of(options)))
+        self.client._background.add(task)
+        task.add_done_callback(self.client._background.discard)
+        return str(uuid.uuid4())
+
+    async def send_and_wait(self, options: Any, timeout: Optional[float] = None) -> Any:
+        return await asyncio.wait_for(self._turn(_prompt_of(options)), timeout)
+
+    async def destroy(self):
+        if not self.destroyed:
+            self.destroyed = True
+            self.client.stats.sessions_destroyed += 1
+            self._handlers.clear()
+
+class FakeCopilotClient:
+    """
+    Drop-in for `CopilotClient` in `MultiAgentTask`, `SessionPool` and the examples.
+    """
+    def __init__(self, script: Optional[FakeScript] = None, first_token_latency: float = 0.0, chunk_latency: float = 0.0,
+                 chunk_size: int = 64, tool_latency: float = 0.0, create_latency: float = 0.0):
+        """
+        :param script: (可選) Produces each reply; defaults to `default_script`
+        :param first_token_latency: Seconds before the first delta of every turn
+        :param chunk_latency: Seconds between streamed deltas of `chunk_size` characters
+        :param tool_latency: Extra seconds added to every tool call (on top of the tool's real work)
+        :param create_latency: Seconds `create_session` takes
+        """
+        self.script = script or default_script
+        self.first_token_latency = first_token_latency
+        self.chunk_latency = chunk_latency
+        self.chunk_size = max(chunk_size, 1)
+        self.tool_latency = tool_latency
+        self.create_latency = create_latency
+        self.stats = FakeStats()
+        self.sessions: List[FakeSession] = []
+        self._ids = itertools.count(1)
+        self._background = set()
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        for session in self.sessions:
+            await session.destroy()
+
+    async def __aenter__(self) -> "FakeCopilotClient":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+    async def create_session(self, config: Dict[str, Any]) -> FakeSession:
+        if self.create_latency:
+            await asyncio.sleep(self.create_latency)
+        session = FakeSession(self, config)
+        self.sessions.append(session)
+        self.stats.sessions_created += 1
+        return session
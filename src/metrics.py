@@ -0,0 +1,231 @@
+import json
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+from copilot import SessionEvent
+from copilot.generated.session_events import SessionEventType
+
+@dataclass
+class PhaseMetric:
+    name: str                     # clarify / work / pre_review / review / compact
+    attempt: int = 0
+    agent: Optional[str] = None
+    model: Optional[str] = None   # Model of the agent's session
+    started: float = 0.0          # Seconds since the task started
+    duration: float = 0.0
+    ttft: Optional[float] = None  # Time to first token of the phase's (first) model turn
+    bytes_in: int = 0             # Prompt bytes sent to the model
+    bytes_out: int = 0            # Reply bytes received
+    cached: bool = False          # Reply replayed from the response cache
+    tokens_in: int = 0            # Tokens reported by the model during the phase
+    tokens_out: int = 0
+
+@dataclass
+class ToolCallMetric:
+    tool: str
+    agent: str
+    duration: float
+    bytes_out: int = 0
+
+@dataclass
+class TaskMetrics:
+    """Structured timings of one `MultiAgentTask.run`, returned on `AgentResult.metrics`."""
+    task_id: str = field(default_factory=lambda: uuid.uuid4().hex[:12])
+    duration: float = 0.0
+    phases: List[PhaseMetric] = field(default_factory=list)
+    tool_calls: List[ToolCallMetric] = field(default_factory=list)
+    # agent -> {"input": n, "output": n}, as reported by ASSISTANT_USAGE events
+    tokens: Dict[str, Dict[str, int]] = field(default_factory=dict)
+
+    def __post_init__(self):
+        self._t0 = time.perf_counter()
+
+    def begin_phase(self, name: str, attempt: int = 0, agent: Optional[str] = None, model: Optional[str] = None) -> PhaseMetric:
+        metric = PhaseMetric(name=name, attempt=attempt, agent=agent, model=model, started=time.perf_counter() - self._t0)
+        self.phases.append(metric)
+        return metric
+
+    def end_phase(self, metric: PhaseMetric):
+        metric.duration = time.perf_counter() - self._t0 - metric.started
+
+    @contextmanager
+    def phase(self, name: str, attempt: int = 0, agent: Optional[str] = None, model: Optional[str] = None) -> Iterator[PhaseMetric]:
+        metric = self.begin_phase(name, attempt, agent, model)
+        try:
+            yield metric
+        finally:
+            self.end_phase(metric)
+
+    def finish(self):
+        self.duration = time.perf_counter() - self._t0
+
+    @property
+    def elapsed(self) -> float:
+        """Seconds since the task started."""
+        return time.perf_counter() - self._t0
+
+    def total_tokens(self, chars_per_token: float = 4.0) -> int:
+        """
+        Input + output tokens of all agents so far. Without usage events from the SDK it is
+        estimated from the bytes of prompts and replies (which leaves out the conversation history).
+        """
+        reported = sum(usage["input"] + usage["output"] for usage in self.tokens.values())
+        if reported:
+            return reported
+        return int(sum(p.bytes_in + p.bytes_out for p in self.phases) / chars_per_token)
+
+    def by_role(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """
+        agent -> model -> {"phases", "seconds", "ttft" (mean), "tokens_in", "tokens_out", "cached"}, summed over
+        the agent's phases, for comparing the latency and cost of the models each role ran on.
+        """
+        roles: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        ttfts: Dict[tuple, List[float]] = {}
+        for p in self.phases:
+            if p.agent is None:
+                continue
+            model = p.model or "unknown"
+            entry = roles.setdefault(p.agent, {}).setdefault(
+                model, {"phases": 0, "seconds": 0.0, "ttft": None, "tokens_in": 0, "tokens_out": 0, "cached": 0}
+            )
+            entry["phases"] += 1
+            entry["seconds"] += p.duration
+            entry["tokens_in"] += p.tokens_in
+            entry["tokens_out"] += p.tokens_out
+            entry["cached"] += int(p.cached)
+            if p.ttft is not None:
+                ttfts.setdefault((p.agent, model), []).append(p.ttft)
+        for (agent, model), values in ttfts.items():
+            roles[agent][model]["ttft"] = sum(values) / len(values)
+        return roles
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data["roles"] = self.by_role()
+        return data
+
+    def to_json(self, **kwargs) -> str:
+        return json.dumps(self.to_dict(), ensure_ascii=False, **kwargs)
+
+    def to_prometheus(self, prefix: str = "multi_agent") -> str:
+        return prometheus_text([self], prefix)
+
+class SessionInstrument:
+    """
+    Session event handler feeding a `TaskMetrics`: time to first token and bytes of each turn
+    (credited to the current `phase`), tool latency from TOOL_EXECUTION_START/COMPLETE pairs
+    and token usage.
+    """
+    def __init__(self, metrics: TaskMetrics, agent: str):
+        self.metrics = metrics
+        self.agent = agent
+        self.phase: Optional[PhaseMetric] = None
+        self.ttft: Optional[float] = None
+        self._turn_started: Optional[float] = None
+        self._tools: Dict[str, tuple] = {}  # tool_call_id -> (name, start)
+
+    def sent(self, prompt: str):
+        """Call right before sending `prompt`; starts the time-to-first-token clock."""
+        self._turn_started = time.perf_counter()
+        self.ttft = None
+        if self.phase is not None:
+            self.phase.bytes_in += len(prompt.encode("utf-8"))
+
+    def replayed(self, response: str):
+        if self.phase is not None:
+            self.phase.cached = True
+            self.phase.bytes_out += len(response.encode("utf-8"))
+
+    def on_event(self, event: SessionEvent):
+        data = getattr(event, "data", None)
+        now = time.perf_counter()
+        if event.type in (getattr(SessionEventType, "ASSISTANT_MESSAGE_DELTA", None), SessionEventType.ASSISTANT_MESSAGE):
+            if self._turn_started is not None and self.ttft is None:
+                self.ttft = now - self._turn_started
+                if self.phase is not None and self.phase.ttft is None:
+                    self.phase.ttft = self.ttft
+            if event.type == SessionEventType.ASSISTANT_MESSAGE and self.phase is not None:
+                self.phase.bytes_out += len((getattr(data, "content", None) or "").encode("utf-8"))
+        elif event.type == SessionEventType.TOOL_EXECUTION_START:
+            call_id = getattr(data, "tool_call_id", None)
+            name = getattr(data, "tool_name", None) or getattr(data, "name", None) or "unknown"
+            if call_id:
+                self._tools[call_id] = (name, now)
+        elif event.type == SessionEventType.TOOL_EXECUTION_COMPLETE:
+            started = self._tools.pop(getattr(data, "tool_call_id", None), None)
+            if started:
+                result = getattr(data, "result", None)
+                content = getattr(result, "content", None) if result is not None else None
+                size = len(content.encode("utf-8")) if isinstance(content, str) else 0
+                self.metrics.tool_calls.append(ToolCallMetric(started[0], self.agent, now - started[1], size))
+        elif event.type == getattr(SessionEventType, "ASSISTANT_USAGE", None):
+            usage = self.metrics.tokens.setdefault(self.agent, {"input": 0, "output": 0})
+            input_tokens = int(getattr(data, "input_tokens", None) or 0)
+            output_tokens = int(getattr(data, "output_tokens", None) or 0)
+            usage["input"] += input_tokens
+            usage["output"] += output_tokens
+            if self.phase is not None:
+                self.phase.tokens_in += input_tokens
+                self.phase.tokens_out += output_tokens
+
+    def attach(self, session: Any) -> Callable[[], None]:
+        return session.on(self.on_event)
+
+def _labels(**labels) -> str:
+    parts = []
+    for key, value in labels.items():
+        if value is None:
+            continue
+        escaped = str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+        parts.append(f'{key}="{escaped}"')
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def prometheus_text(tasks: Iterable[TaskMetrics], prefix: str = "multi_agent") -> str:
+    """Renders task metrics in the Prometheus text exposition format."""
+    tasks = list(tasks)
+    series: Dict[str, tuple] = {}  # metric name -> (type, help, [lines])
+
+    def add(name: str, kind: str, help_text: str, labels: str, value: float):
+        series.setdefault(f"{prefix}_{name}", (kind, help_text, []))[2].append(f"{prefix}_{name}{labels} {value:g}")
+
+    for task in tasks:
+        add("task_duration_seconds", "gauge", "Wall time of the task.", _labels(task=task.task_id), task.duration)
+        for p in task.phases:
+            labels = _labels(task=task.task_id, phase=p.name, attempt=p.attempt, agent=p.agent)
+            add("phase_duration_seconds", "gauge", "Wall time of one phase.", labels, p.duration)
+            if p.ttft is not None:
+                add("phase_ttft_seconds", "gauge", "Time to first token of the phase's model turn.", labels, p.ttft)
+            add("phase_bytes_in", "gauge", "Prompt bytes sent during the phase.", labels, p.bytes_in)
+            add("phase_bytes_out", "gauge", "Reply bytes received during the phase.", labels, p.bytes_out)
+
+        by_tool: Dict[tuple, List[ToolCallMetric]] = {}
+        for call in task.tool_calls:
+            by_tool.setdefault((call.tool, call.agent), []).append(call)
+        for (tool, agent), calls in sorted(by_tool.items()):
+            labels = _labels(task=task.task_id, tool=tool, agent=agent)
+            series.setdefault(f"{prefix}_tool_duration_seconds", ("summary", "Tool execution latency.", []))[2].extend([
+                f"{prefix}_tool_duration_seconds_sum{labels} {sum(c.duration for c in calls):g}",
+                f"{prefix}_tool_duration_seconds_count{labels} {len(calls)}",
+            ])
+
+        for agent, usage in sorted(task.tokens.items()):
+            for direction, count in usage.items():
+                add("tokens_total", "counter", "Tokens reported by the model.", _labels(task=task.task_id, agent=agent, direction=direction), count)
+
+        for agent, models in sorted(task.by_role().items()):
+            for model, entry in sorted(models.items()):
+                labels = _labels(task=task.task_id, agent=agent, model=model)
+                add("role_duration_seconds", "gauge", "Wall time of an agent's phases on one model.", labels, entry["seconds"])
+                add("role_phases", "gauge", "Phases an agent ran on one model.", labels, entry["phases"])
+                for direction in ("in", "out"):
+                    add("role_tokens", "gauge", "Tokens an agent used on one model.",
+                        _labels(task=task.task_id, agent=agent, model=model, direction=direction), entry[f"tokens_{direction}"])
+
+    out = []
+    for name, (kind, help_text, lines) in series.items():
+        out.append(f"# HELP {name} {help_text}")
+        out.append(f"# TYPE {name} {kind}")
+        out.extend(lines)
+    return "\n".join(out) + "\n"
@@ -0,0 +1,39 @@
+"""Which model each agent role (Clarifier / Worker / Reviewer) runs on, with fallback/escalation ladders."""
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Union
+
+ROLES = ("Clarifier", "Worker", "Reviewer")
+
+ModelLadder = Union[str, Sequence[str]]
+
+@dataclass
+class ModelRouting:
+    """
+    Per-role model ladders. A role starts on the first model of its ladder and moves one
+    rung up when a session on its current model can't be created (fallback) or when the
+    retry policy escalates a task whose Worker and Reviewer keep disagreeing, e.g. the
+    Reviewer on a small model rejecting the same thing over and over. A role without a
+    ladder uses the task's default model.
+
+        ModelRouting(clarifier="gpt-5 mini", worker="gpt-5", reviewer=["gpt-5 mini", "gpt-5"])
+    """
+    clarifier: Optional[ModelLadder] = None
+    worker: Optional[ModelLadder] = None
+    reviewer: Optional[ModelLadder] = None
+
+    def ladder(self, role: str, default: str) -> List[str]:
+        """The models of `role` ("Clarifier" / "Worker" / "Reviewer"), cheapest first."""
+        if role not in ROLES:
+            raise ValueError(f"Unknown role: {role}")
+        models = getattr(self, role.lower())
+        if not models:
+            return [default]
+        return [models] if isinstance(models, str) else list(models)
+
+    @classmethod
+    def parse(cls, clarifier: Optional[str] = None, worker: Optional[str] = None, reviewer: Optional[str] = None) -> "ModelRouting":
+        """From comma-separated ladders (e.g. command line flags): `"gpt-5 mini,gpt-5"`."""
+        def split(value: Optional[str]) -> Optional[List[str]]:
+            models = [m.strip() for m in (value or "").split(",") if m.strip()]
+            return models or None
+        return cls(split(clarifier), split(worker), split(reviewer))
@@ -1,40 +1,428 @@
 #!/usr/bin/env python3
 import asyncio
-from typing import Optional, List, Callable, Awaitable
+import difflib
+import itertools
+import os
+import threading
+import time
+import warnings
+from collections import deque
+from typing import Any, Optional, List, Callable, Awaitable, AsyncIterator, Deque, Iterable, Tuple, Union
 from dataclasses import dataclass
 from copilot import CopilotClient, MessageOptions, SessionEvent
 from copilot.generated.session_events import SessionEventType
 from src.skills.repository import RepositorySkill
 from src.skills.filesystem import FileSystemSkill
+from src.skills.code_search import CodeSearchSkill
 from src.skills.clarification import ClarificationSkill
+from src.session_pool import SessionPool
+from src import workspace
+from src.context_budget import COMPACTION_PROMPT, ContextBudget, ContextTracker
+from src.prereview import PreReviewGate, files_modified_since
+from src.speculative import CandidateWorkspace
+from src.response_cache import CacheMissError, CachedConversation, ResponseCache
+from src.metrics import SessionInstrument, TaskMetrics
+from src.event_sink import AgentEvent, EventSink, TaskEventEmitter
+from src.checkpoint import CheckpointStore, TaskCheckpoint
+from src.task_workspace import KEEPALIVE_INTERVAL, TaskWorkspace
+from src.repo_map import RepoMapCache
+from src.retry_policy import ESCALATE, STOP, AttemptRecord, RetryPolicy
+from src.model_routing import ModelRouting
 
 @dataclass
 class AgentResult:
     success: bool
     code: str
     messages: List[str]  # History logs
+    metrics: Optional[TaskMetrics] = None  # Phase timings, TTFT, tool latency, bytes and tokens
+    patch: Optional[bytes] = None          # Changes of an isolated task (binary git diff, `git apply` at the repo root)
+    branch: Optional[str] = None           # Branch of the source repository holding them as a commit, if published
+
+@dataclass
+class BatchJob:
+    """A single unit of work for `MultiAgentTask.run_many`."""
+    prompt: str
+    repo_url: Optional[str] = None
+    local_repo_path: Optional[str] = None
+    job_id: Optional[str] = None
+
+@dataclass
+class BatchResult:
+    job: BatchJob
+    result: AgentResult
+    elapsed: float  # Wall time of this job in seconds
+
+# First-prompt prefix for sessions that join a task resumed from a checkpoint
+RESUME_PREAMBLE = "[This task was interrupted and resumed; earlier attempts ran in a previous session.]\n\n"
+# First-prompt prefix for sessions that take a task over on another model (escalation)
+HANDOVER_PREAMBLE = "[You are taking this task over; earlier attempts ran in another session.]\n\n"
 
 class MultiAgentTask:
-    def __init__(self, client: CopilotClient, model: str = "gpt-5 mini"):
+    # Upper bound on the workspace diff embedded in a single reviewer prompt
+    MAX_REVIEW_DIFF_CHARS = 20000
+
+    def __init__(self, client: CopilotClient, model: str = "gpt-5 mini", session_pool: Optional[SessionPool] = None, incremental_review: bool = True,
+                 context_budget: Optional[ContextBudget] = None, pre_review: Optional[PreReviewGate] = None, enable_pre_review: bool = True,
+                 response_cache: Optional[ResponseCache] = None, event_sink: Optional[EventSink] = None,
+                 max_log_messages: Optional[int] = None, checkpoint_store: Optional[CheckpointStore] = None,
+                 isolate_workspaces: bool = False, branch_prefix: Optional[str] = "agent/",
+                 repo_map: Optional[RepoMapCache] = None, enable_repo_map: bool = True, repo_map_chars: int = 6000,
+                 retry_policy: Optional[RetryPolicy] = None, model_routing: Optional[ModelRouting] = None):
+        """
+        :param session_pool: (可選) Shared pool to lease Worker/Reviewer sessions from.
+                             Defaults to a private pool that creates a fresh session per task.
+        :param incremental_review: After the first attempt, send only what changed since the previous
+                                   attempt (both sessions already have the rest in their history).
+        :param context_budget: (可選) Token budget per Clarifier/Worker/Reviewer session. Once a session's
+                               estimated context crosses the threshold it is summarized and replaced.
+        :param pre_review: (可選) Local checks run on the files each Worker attempt changed; failures go
+                           straight back to the Worker without a Reviewer round trip. Defaults to
+                           syntax + import checks only (pass a gate with `test_command` to run tests too).
+        :param enable_pre_review: Set to False to always send Worker output to the Reviewer.
+        :param response_cache: (可選) Replays identical Worker/Reviewer turns (same model, system message,
+                               conversation, prompt and workspace snapshot) from disk instead of calling the model.
+        :param event_sink: (可選) Where agent output, tool calls, phases and verdicts go. Defaults to a sink
+                           that prints them to the console; share one sink between tasks to tag and
+                           interleave their events by task id (e.g. into a JSONL file).
+        :param max_log_messages: (可選) Keep only the last N entries of `AgentResult.messages`, so a long
+                                 task's history doesn't grow without bound (use `run_stream` for the full record).
+        :param checkpoint_store: (可選) Records each task's progress after every step (clarified requirements,
+                                 Worker output, feedback, workspace snapshot) so `resume(task_id)` can continue
+                                 it after a crash without repeating finished LLM turns.
+        :param isolate_workspaces: Run each task in its own git worktree (sharing the repository's, or the
+                                   remote's mirror's, object store) instead of in the repository itself, so
+                                   concurrent tasks on one repository don't see each other's edits. The changes
+                                   come back as `AgentResult.patch` (and `AgentResult.branch`); the worktree is removed.
+        :param branch_prefix: (可選) Successful isolated tasks on a local repository are also committed to
+                              `<branch_prefix><task_id>` there; None returns the patch only.
+        :param repo_map: (可選) Cache of repository maps (file tree + top-level signatures per commit) put into
+                         the Clarifier's and Worker's system messages so they start oriented. Defaults to one
+                         under `workspaces/.cache/repo_maps`.
+        :param enable_repo_map: Set to False to leave the map out of the system messages.
+        :param repo_map_chars: Size bound of the injected map; larger repositories get a coarser map.
+        :param retry_policy: (可選) Decides whether a failed attempt gets another one (attempt cap, time/token
+                             budgets, escalation or early stop when attempts stop converging). Defaults to
+                             4 attempts without budgets.
+        :param model_routing: (可選) Model ladder per role (Clarifier / Worker / Reviewer), e.g. a small model for
+                              clarifying and reviewing. Roles without one use `model`. A role falls back to its next
+                              model when a session can't be created, and moves up one model when the retry policy
+                              escalates.
+        """
         self.client = client
         self.model = model
-        self.max_retries = 3
+        self.session_pool = session_pool or SessionPool(client)
+        self.incremental_review = incremental_review
+        self.context_budget = context_budget or ContextBudget()
+        self.pre_review = (pre_review or PreReviewGate()) if enable_pre_review else None
+        self.response_cache = response_cache
+        self.event_sink = event_sink or EventSink()
+        self.max_log_messages = max_log_messages
+        self.checkpoint_store = checkpoint_store
+        self.isolate_workspaces = isolate_workspaces
+        self.branch_prefix = branch_prefix
+        self.repo_map = (repo_map or RepoMapCache()) if enable_repo_map else None
+        self.repo_map_chars = repo_map_chars
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.model_routing = model_routing or ModelRouting()
+
+    @property
+    def max_retries(self) -> int:
+        """Deprecated: retries after the first attempt, i.e. `retry_policy.max_attempts - 1`."""
+        warnings.warn("MultiAgentTask.max_retries is deprecated; use retry_policy.max_attempts", DeprecationWarning, stacklevel=2)
+        return self.retry_policy.max_attempts - 1
+
+    @max_retries.setter
+    def max_retries(self, value: int):
+        warnings.warn("MultiAgentTask.max_retries is deprecated; use retry_policy.max_attempts", DeprecationWarning, stacklevel=2)
+        self.retry_policy.max_attempts = value + 1
+
+    def close(self):
+        """Releases the pre-review gate's process pool (it is started again if the task object is reused)."""
+        if self.pre_review is not None:
+            self.pre_review.close()
+
+    def _models(self, role: str) -> List[str]:
+        return self.model_routing.ladder(role, self.model)
+
+    def _worker_config(self, working_dir: Optional[str], repo_map: str = "", model: Optional[str] = None) -> dict:
+        # Worker gets the tools (skills) to interact with the world
+        repo_skill = RepositorySkill()
+        fs_skill = FileSystemSkill()
+        search_skill = CodeSearchSkill()
+
+        worker_sys_msg = "你是 Worker Agent。你擁有操作 Git 儲存庫與檔案系統技能。"
+        worker_sys_msg += "\n修改既有檔案時，請優先使用 `apply_edit` (unified diff 或 search/replace)，不要用 `write_file` 重寫整個檔案。"
+        worker_sys_msg += "\n需要閱讀多個檔案時，請用 `read_files` 一次讀取 (可傳入 glob，例如 `src/**/*.py`)，不要逐一呼叫 `read_file`。"
+        if working_dir:
+            worker_sys_msg += f"\n**工作目標目錄**: `{working_dir}`。請直接在此目錄進行操作，不需要 Clone。"
+        else:
+            worker_sys_msg += "\n若使用者提供儲存庫 URL，請務必先使用工具將其 clone 下來。"
+        if repo_map:
+            worker_sys_msg += f"\n\n{repo_map}"
+
+        return {
+            "model": model or self._models("Worker")[0],
+            "system_message": worker_sys_msg,
+            "tools": repo_skill.get_tools() + fs_skill.get_tools() + search_skill.get_tools(),
+            # ASSISTANT_MESSAGE_DELTA events for `run_stream`
+            "streaming": True,
+            # Set permissions for tools (allow cloning)
+            "on_permission_request": lambda req, meta: {"kind": "allowed"}
+        }
+
+    def _reviewer_config(self, model: Optional[str] = None) -> dict:
+        # Reviewer doesn't need the tools, just needs to read the code (conceptual)
+        # But in a real scenario, Reviewer might also want to search files.
+        # For this demo, let's keep Reviewer focused on text analysis or give it read access if we had a FileSystem skill.
+        return {
+            "model": model or self._models("Reviewer")[0],
+            "system_message": "你是 Reviewer Agent。你的任務是驗證 Worker 產生的程式碼是否完全符合 User Prompt 的要求。如果符合，請只回答 'PASS'。如果不符合或有錯誤，請具體指出問題。",
+            "streaming": True,
+            "on_permission_request": lambda req, meta: {"kind": "allowed"}
+        }
+
+    async def prewarm(self, count: int = 1, local_repo_path: Optional[str] = None):
+        """
+        Pre-creates Worker/Reviewer sessions in the pool so the next `run` doesn't pay session setup.
+        :param local_repo_path: (可選) The repository the upcoming tasks will target (the Worker's
+                                system message, and therefore its pool key, depends on it)
+        """
+        repo_map = await self._repo_map_text(local_repo_path)
+        await asyncio.gather(
+            self.session_pool.warm(self._worker_config(local_repo_path, repo_map), count),
+            self.session_pool.warm(self._reviewer_config(), count)
+        )
+
+    async def _repo_map_text(self, working_dir: Optional[str]) -> str:
+        """The size-bounded repository map for system messages ("" without a git workspace or on errors)."""
+        if self.repo_map is None or not working_dir:
+            return ""
+        try:
+            repo_map = await asyncio.to_thread(self.repo_map.get, working_dir)
+        except Exception:
+            return ""
+        if repo_map is None:
+            return ""
+        return "以下是儲存庫結構與主要定義 (HEAD 版本)，請先參考它再決定要讀取哪些檔案：\n" + repo_map.render(self.repo_map_chars)
+
+    @staticmethod
+    def _output_diff(previous: str, current: str) -> str:
+        return "\n".join(difflib.unified_diff(
+            previous.splitlines(), current.splitlines(),
+            fromfile="previous_attempt", tofile="current_attempt", lineterm=""
+        ))
+
+    async def _snapshot(self, working_dir: Optional[str]) -> Optional[str]:
+        if not working_dir:
+            return None
+        try:
+            return await asyncio.to_thread(workspace.snapshot_tree, working_dir)
+        except Exception:
+            return None
+
+    async def _changed_files(self, working_dir: str, base_tree: Optional[str], since: float) -> List[str]:
+        """Files changed since the attempt started: a git tree diff, or an mtime scan outside git."""
+        if base_tree:
+            current_tree = await self._snapshot(working_dir)
+            if current_tree:
+                return await asyncio.to_thread(workspace.changed_files, working_dir, base_tree, current_tree)
+        return await asyncio.to_thread(files_modified_since, working_dir, since)
+
+    def _incremental_reviewer_prompt(self, previous_code: str, current_code: str, workspace_diff: Optional[str]) -> str:
+        output_diff = self._output_diff(previous_code, current_code)
+        # A diff of a complete rewrite can be bigger than the output itself
+        if len(output_diff) >= len(current_code):
+            output_section = f"Revised Worker Output (full):\n{current_code}"
+        else:
+            output_section = f"Changes to the Worker Output since the previous attempt (unified diff):\n{output_diff or '(no change)'}"
+
+        workspace_section = ""
+        if workspace_diff is not None:
+            workspace_section = f"\n\nWorkspace changes since the previous attempt (git diff):\n{workspace_diff or '(none)'}"
+
+        return f"""
+The Worker has revised its work based on your previous feedback.
+
+{output_section}{workspace_section}
+
+Task: Using the original request and the previous output from earlier in this conversation, check if the revised code/action meets the request. If yes, say 'PASS'. If no, explain why.
+"""
+
+    @staticmethod
+    def _full_reviewer_prompt(final_requirements: str, repo_url: Optional[str], current_code: str) -> str:
+        return f"""
+Original User Request: {final_requirements}
+(Note: The task might involve a repository: {repo_url})
+
+Worker Generated Code / Output:
+{current_code}
+
+Task: Check if the code/action meets the request. If yes, say 'PASS'. If no, explain why.
+"""
+
+    async def _send(self, session, config: dict, prompt: str, conversation: Optional[CachedConversation] = None,
+                    working_dir: Optional[str] = None, agent_name: str = "", record_changes: bool = True,
+                    instrument: Optional[SessionInstrument] = None, emit: Optional[TaskEventEmitter] = None) -> Optional[str]:
+        """
+        Sends one turn and returns the assistant's reply (None if there was none), going through
+        the response cache when enabled.
+        :param conversation: (可選) Cache state of this session; None means "don't cache this turn"
+        :param working_dir: (可選) Workspace the turn runs against; the turn is only cached when it is a
+                            git repository, whose snapshot becomes part of the key
+        :param record_changes: Record the workspace changes made during the turn and re-apply them on replay
+        :param instrument: (可選) Metrics collector of this session (its current phase gets the turn's bytes/TTFT)
+        :param emit: (可選) Event emitter of the task
+        """
+        cache = self.response_cache
+        key = None
+        base_tree = None
+        if cache is not None and conversation is not None:
+            if working_dir:
+                base_tree = await self._snapshot(working_dir)
+            if base_tree or not working_dir:
+                key = cache.make_key(config["model"], config.get("system_message", ""), conversation.history, prompt, base_tree or "")
+
+        if key is not None and cache.mode != "record":
+            entry = await asyncio.to_thread(cache.get, key)
+            if entry is not None:
+                response, patch = entry
+                try:
+                    if patch:
+                        await asyncio.to_thread(workspace.apply_patch, working_dir, patch)
+                    conversation.replayed(prompt, response)
+                    if instrument:
+                        instrument.replayed(response)
+                    if emit:
+                        emit("info", agent_name, f"♻️  Replayed from cache:\n{response}", cached=True)
+                    return response
+                except Exception as e:
+                    if emit:
+                        emit("info", agent_name, f"Cached changes no longer apply ({e}), calling the model.")
+            if cache.mode == "replay":
+                raise CacheMissError(f"No recorded response for this {agent_name or 'agent'} turn.")
+
+        live_prompt = (conversation.transcript() if conversation else "") + prompt
+        # Don't start another turn while the sink is saturated (only waits with the backpressure policy)
+        await self.event_sink.wait_for_capacity()
+        if instrument:
+            instrument.sent(live_prompt)
+        event = await session.send_and_wait(MessageOptions(prompt=live_prompt))
+        if not (event and event.type == SessionEventType.ASSISTANT_MESSAGE):
+            return None
+        response = event.data.content
+        if conversation is not None:
+            conversation.sent(prompt, response)
+        if key is not None:
+            patch = b""
+            if base_tree and record_changes:
+                after_tree = await self._snapshot(working_dir)
+                if after_tree:
+                    patch = await asyncio.to_thread(workspace.binary_diff, working_dir, base_tree, after_tree)
+            await asyncio.to_thread(cache.put, key, config["model"], response, patch)
+        return response
+
+    def _attach(self, session, agent_name: str, tracker: ContextTracker, instrument: Optional[SessionInstrument],
+                emit: TaskEventEmitter) -> List[Callable[[], None]]:
+        """Attaches logging, context tracking and metrics. Returns the handlers' unsubscribe functions."""
+        handlers = [self._setup_logging(session, agent_name, emit), tracker.attach(session)]
+        if instrument:
+            handlers.append(instrument.attach(session))
+        return handlers
+
+    async def _open_session(self, role: str, rung: int, make_config: Callable[[str], dict], emit: TaskEventEmitter,
+                            pooled: bool = True) -> Tuple[Any, dict, int]:
+        """
+        Leases (or, with `pooled=False`, creates) a session for `role` on the model at `rung` of its ladder,
+        falling back to the next models if that fails. Returns (session, config, rung).
+        """
+        models = self._models(role)
+        for i in range(rung, len(models)):
+            config = make_config(models[i])
+            try:
+                session = await (self.session_pool.acquire(config) if pooled else self.client.create_session(config))
+                return session, config, i
+            except Exception as e:
+                if i + 1 >= len(models):
+                    raise
+                emit("error", role, f"Model {models[i]} unavailable ({e}), falling back to {models[i + 1]}.")
+        raise ValueError(f"{role} has no model at rung {rung}")
+
+    async def _escalate_session(self, role: str, session, config: dict, rung: int, make_config: Callable[[str], dict],
+                                handlers: List[Callable[[], None]], tracker: ContextTracker, instrument: SessionInstrument,
+                                emit: TaskEventEmitter) -> Tuple[Any, dict, int, List[Callable[[], None]]]:
+        """
+        Moves `role` to the next model of its ladder: leases a session on it and gives the old one back.
+        Returns (session, config, rung, handlers), unchanged if there is no next model or none could be created.
+        """
+        models = self._models(role)
+        if rung + 1 >= len(models):
+            return session, config, rung, handlers
+        try:
+            new_session, new_config, new_rung = await self._open_session(role, rung + 1, make_config, emit)
+        except Exception as e:
+            emit("error", role, f"Escalation failed ({e}), staying on {models[rung]}.")
+            return session, config, rung, handlers
+        for unsubscribe in handlers:
+            if callable(unsubscribe):
+                unsubscribe()
+        # Its history is of no use to anyone else
+        await self.session_pool.release(session, discard=True)
+        tracker.reset()
+        emit("info", role, f"⬆️  Escalated from {models[rung]} to {models[new_rung]}.", model=models[new_rung])
+        return new_session, new_config, new_rung, self._attach(new_session, role, tracker, instrument, emit)
+
+    async def _compact_session(self, session, config: dict, agent_name: str, tracker: ContextTracker, pooled: bool,
+                               instrument: Optional[SessionInstrument] = None, emit: Optional[TaskEventEmitter] = None):
+        """
+        Asks `session` to summarize the task so far, replaces it with a fresh session (dropping the
+        accumulated tool outputs) and returns (new_session, preamble) where the preamble carries the
+        summary into the next prompt.
+        """
+        if emit:
+            emit("info", agent_name, f"🗜️  Compacting context (~{tracker.tokens} tokens)...", tokens=tracker.tokens)
+        summary = ""
+        try:
+            if instrument:
+                instrument.sent(COMPACTION_PROMPT)
+            event = await session.send_and_wait(MessageOptions(prompt=COMPACTION_PROMPT))
+            if event and event.type == SessionEventType.ASSISTANT_MESSAGE:
+                summary = (event.data.content or "")[:self.context_budget.max_summary_chars]
+        except Exception as e:
+            if emit:
+                emit("error", agent_name, f"Summary failed ({e}), continuing without it.")
+
+        if pooled:
+            await self.session_pool.release(session, discard=True)
+            new_session = await self.session_pool.acquire(config)
+        else:
+            await session.destroy()
+            new_session = await self.client.create_session(config)
+
+        tracker.reset(summary)
+        tracker.compactions += 1
+        preamble = f"[Summary of this task so far (earlier context was compacted)]\n{summary}\n\n" if summary else ""
+        return new_session, preamble
+
+    def _setup_logging(self, session, agent_name: str, emit: TaskEventEmitter) -> Callable[[], None]:
+        """Forwards the session's output to the event sink as it happens. Returns a function that detaches it."""
+        delta_type = getattr(SessionEventType, "ASSISTANT_MESSAGE_DELTA", None)
 
-    def _setup_logging(self, session, agent_name: str):
-        """Attaches a real-time logger to the session."""
         def on_event(event: SessionEvent):
+            data = getattr(event, "data", None)
             if event.type == SessionEventType.ASSISTANT_MESSAGE:
-                # Stream the content
-                print(event.data.content, end="", flush=True)
+                emit("assistant_message", agent_name, getattr(data, "content", None) or "")
+            elif delta_type is not None and event.type == delta_type:
+                emit("assistant_delta", agent_name, getattr(data, "delta_content", None) or "")
             elif event.type == SessionEventType.TOOL_EXECUTION_START:
-                if getattr(event.data, 'name', None):
-                    print(f"\n[{agent_name}] 🛠️  Using Tool: {event.data.name}")
-            elif event.type == SessionEventType.SESSION_ERROR:
-                print(f"\n[{agent_name}] ❌ Error: {event.data.message}")
+                name = getattr(data, "tool_name", None) or getattr(data, "name", None)
+                if name:
+                    emit("tool_start", agent_name, name, tool_call_id=getattr(data, "tool_call_id", None))
             elif event.type == SessionEventType.TOOL_EXECUTION_COMPLETE:
-                pass # Already logged start
-        
-        session.on(on_event)
+                emit("tool_complete", agent_name, tool_call_id=getattr(data, "tool_call_id", None), success=getattr(data, "success", None))
+            elif event.type == SessionEventType.SESSION_ERROR:
+                emit("error", agent_name, getattr(data, "message", None) or "")
+
+        return session.on(on_event)
 
     async def run(self, user_prompt: str, repo_url: Optional[str] = None, local_repo_path: Optional[str] = None, ask_user_func: Optional[Callable[[str], Awaitable[str]]] = None) -> AgentResult:
         """
@@ -43,11 +431,228 @@ class MultiAgentTask:
         :param repo_url: (可選) 要 Clone 的 Repo URL
         :param local_repo_path: (可選) 已存在的本地 Repo 路徑
         """
-        logs = []
+        return await self._result_of(self.run_stream(user_prompt, repo_url, local_repo_path, ask_user_func))
+
+    async def resume(self, task_id: str, ask_user_func: Optional[Callable[[str], Awaitable[str]]] = None) -> AgentResult:
+        """
+        Continues a task from its last checkpoint (needs `checkpoint_store`): finished steps are not
+        repeated, the workspace is reset to the checkpoint's snapshot and fresh sessions get the state
+        they need in their first prompt. A finished task just returns its recorded outcome.
+        :param task_id: `AgentResult.metrics.task_id` of the interrupted run (or `CheckpointStore.list("running")`)
+        :param ask_user_func: (可選) Only used if the task was interrupted during clarification
+        """
+        return await self._result_of(self.resume_stream(task_id, ask_user_func))
+
+    @staticmethod
+    async def _result_of(stream: AsyncIterator[AgentEvent]) -> AgentResult:
+        try:
+            async for event in stream:
+                if event.kind == "result":
+                    return event.data["result"]
+        finally:
+            await stream.aclose()
+        raise RuntimeError("Task ended without a result.")
+
+    def run_stream(self, user_prompt: str, repo_url: Optional[str] = None, local_repo_path: Optional[str] = None,
+                   ask_user_func: Optional[Callable[[str], Awaitable[str]]] = None, max_buffered_deltas: int = 1000,
+                   task_id: Optional[str] = None) -> AsyncIterator[AgentEvent]:
+        """
+        Runs the task like `run`, yielding its `AgentEvent`s as they happen: "phase", "assistant_delta",
+        "assistant_message", "tool_start" / "tool_complete", "verdict", "info" / "error" and finally
+        "result", whose data["result"] is the `AgentResult`. The same events also go to the event sink.
+        Closing the generator early (`aclose`, or cancelling the consumer) cancels the task.
+        :param max_buffered_deltas: Events waiting for a slow consumer beyond which further
+                                    "assistant_delta" events are dropped ("assistant_message" still
+                                    carries the full text; no other kind is ever dropped)
+        :param task_id: (可選) Id for the task (events, metrics and checkpoint); random by default
+        """
+        run = self._run_isolated if self.isolate_workspaces else self._run
+        return self._stream(
+            lambda metrics, emit: run(metrics, emit, user_prompt, repo_url, local_repo_path, ask_user_func),
+            max_buffered_deltas, task_id
+        )
+
+    def resume_stream(self, task_id: str, ask_user_func: Optional[Callable[[str], Awaitable[str]]] = None,
+                      max_buffered_deltas: int = 1000) -> AsyncIterator[AgentEvent]:
+        """`resume` as a stream of events, like `run_stream`."""
+        async def resume_task(metrics: TaskMetrics, emit: TaskEventEmitter) -> AgentResult:
+            if self.checkpoint_store is None:
+                raise ValueError("resume() needs a checkpoint_store.")
+            checkpoint = await asyncio.to_thread(self.checkpoint_store.load, task_id)
+            if checkpoint is None:
+                raise KeyError(f"No checkpoint for task {task_id}")
+            task_ws = await asyncio.to_thread(TaskWorkspace.open, checkpoint.working_dir) if checkpoint.working_dir else None
+            if task_ws is not None and checkpoint.status == "running":
+                # Interrupted isolated task: continue in its worktree, then collect and remove it as usual
+                return await self._run_isolated(metrics, emit, checkpoint.user_prompt, checkpoint.repo_url, None,
+                                                ask_user_func, checkpoint, task_ws)
+            if task_ws is not None:
+                # Finished task whose worktree was left behind (e.g. the process died while removing it)
+                await asyncio.to_thread(task_ws.cleanup)
+            return await self._run(metrics, emit, checkpoint.user_prompt, checkpoint.repo_url, checkpoint.working_dir,
+                                   ask_user_func, checkpoint)
+
+        return self._stream(resume_task, max_buffered_deltas, task_id)
+
+    async def _stream(self, start: Callable[[TaskMetrics, TaskEventEmitter], Awaitable[AgentResult]], max_buffered_deltas: int,
+                      task_id: Optional[str] = None) -> AsyncIterator[AgentEvent]:
+        metrics = TaskMetrics(task_id=task_id) if task_id else TaskMetrics()
+        loop = asyncio.get_running_loop()
+        loop_thread = threading.get_ident()
+        pending: Deque[AgentEvent] = deque()
+        ready = asyncio.Event()
+
+        def push(event: AgentEvent):
+            if event.kind == "assistant_delta" and len(pending) >= max_buffered_deltas:
+                return
+            pending.append(event)
+            ready.set()
+
+        def listen(event: AgentEvent):
+            if threading.get_ident() != loop_thread:
+                loop.call_soon_threadsafe(push, event)
+            else:
+                push(event)
+
+        emit = TaskEventEmitter(self.event_sink, metrics.task_id, [listen])
+        task = asyncio.create_task(start(metrics, emit))
+        task.add_done_callback(lambda _: ready.set())
+        try:
+            while True:
+                await ready.wait()
+                ready.clear()
+                while pending:
+                    yield pending.popleft()
+                if task.done():
+                    break
+            result = task.result()
+        finally:
+            if not task.done():
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+            metrics.finish()
+
+        result.metrics = metrics
+        summary = {"success": result.success, "duration": metrics.duration}
+        self.event_sink.emit(AgentEvent("result", metrics.task_id, text="PASS" if result.success else "FAIL", data=summary))
+        # Callers print the result right after; let the agent output land first
+        await self.event_sink.flush()
+        yield AgentEvent("result", metrics.task_id, text="PASS" if result.success else "FAIL", data={**summary, "result": result})
+
+    @staticmethod
+    async def _create_task_workspace(task_id: str, repo_url: Optional[str], local_repo_path: Optional[str]) -> Optional[TaskWorkspace]:
+        if local_repo_path:
+            return await asyncio.to_thread(TaskWorkspace.from_repository, local_repo_path, task_id)
+        if repo_url:
+            mirror = await RepositorySkill().prepare_mirror(repo_url)
+            return await asyncio.to_thread(TaskWorkspace.from_mirror, mirror, task_id=task_id)
+        return None
+
+    def _cleanup_unless_resumable(self, task_ws: TaskWorkspace, task_id: str):
+        if self.checkpoint_store is not None:
+            try:
+                checkpoint = self.checkpoint_store.load(task_id)
+            except Exception:
+                return  # Can't tell: leave it to `TaskWorkspace.prune_stale`
+            if checkpoint is not None and checkpoint.status == "running":
+                return
+        task_ws.cleanup()
+
+    @staticmethod
+    async def _keep_workspace_alive(task_ws: TaskWorkspace):
+        # A long task (or one waiting for the user) must not look abandoned to `prune_stale`, e.g. of another process
+        while True:
+            await asyncio.to_thread(task_ws.touch)
+            await asyncio.sleep(KEEPALIVE_INTERVAL)
+
+    async def _run_isolated(self, metrics: TaskMetrics, emit: TaskEventEmitter, user_prompt: str, repo_url: Optional[str],
+                            local_repo_path: Optional[str], ask_user_func: Optional[Callable[[str], Awaitable[str]]],
+                            checkpoint: Optional[TaskCheckpoint] = None, task_ws: Optional[TaskWorkspace] = None) -> AgentResult:
+        """`_run` inside a task worktree; the changes come back as `AgentResult.patch` / `.branch`."""
+        if task_ws is None:
+            task_ws = await self._create_task_workspace(metrics.task_id, repo_url, local_repo_path)
+            if task_ws is None:
+                # Nothing to isolate (no repository, or a directory that isn't a git repository): run in place
+                return await self._run(metrics, emit, user_prompt, repo_url, local_repo_path, ask_user_func, checkpoint)
+        emit("info", None, f"Working in task worktree {task_ws.path}", workspace=task_ws.path)
+
+        keepalive = asyncio.create_task(self._keep_workspace_alive(task_ws))
+        try:
+            result = await self._run(metrics, emit, user_prompt, repo_url, task_ws.path, ask_user_func, checkpoint)
+        except BaseException:
+            # Keep an interrupted task's worktree only when it can be resumed from its checkpoint
+            await asyncio.shield(asyncio.to_thread(self._cleanup_unless_resumable, task_ws, metrics.task_id))
+            raise
+        finally:
+            keepalive.cancel()
+
+        try:
+            result.patch = await asyncio.to_thread(task_ws.patch) or None
+            # Mirrors prune branches they don't have upstream on every fetch, so those tasks return the patch only
+            if result.success and result.patch and self.branch_prefix is not None and not task_ws.bare:
+                branch = f"{self.branch_prefix}{metrics.task_id}"
+                title = (user_prompt.strip().splitlines() or [branch])[0][:72]
+                await asyncio.to_thread(task_ws.publish_branch, branch, title)
+                result.branch = branch
+                result.messages.append(f"[Workspace] Changes committed to branch {branch} of {task_ws.source}.")
+        except Exception as e:
+            result.messages.append(f"[Workspace] Could not collect the task's changes: {e}")
+        finally:
+            await asyncio.to_thread(task_ws.cleanup)
+        if result.patch:
+            emit("info", None, f"Changes: {len(result.patch)} bytes of patch" + (f", branch {result.branch}" if result.branch else ""),
+                 patch_bytes=len(result.patch), branch=result.branch)
+        return result
+
+    async def _save_checkpoint(self, checkpoint: Optional[TaskCheckpoint], emit: TaskEventEmitter, **changes):
+        """Updates `checkpoint` and persists it; a failing store is reported but never fails the task."""
+        if checkpoint is None or self.checkpoint_store is None:
+            return
+        for name, value in changes.items():
+            setattr(checkpoint, name, value)
+        try:
+            await asyncio.to_thread(self.checkpoint_store.save, checkpoint)
+        except Exception as e:
+            emit("error", None, f"Checkpoint not saved ({e}).")
+
+    async def _restore_workspace(self, working_dir: str, tree: str, logs: Deque[str]):
+        """Puts the workspace back to a checkpoint snapshot, dropping whatever an interrupted turn left behind."""
+        current = await self._snapshot(working_dir)
+        if not current or current == tree:
+            return
+        try:
+            patch = await asyncio.to_thread(workspace.binary_diff, working_dir, current, tree)
+            await asyncio.to_thread(workspace.apply_patch, working_dir, patch)
+            logs.append("[Resume] Workspace reset to the checkpoint snapshot.")
+        except Exception as e:
+            logs.append(f"[Resume] Could not reset the workspace to the checkpoint ({e}); continuing with the current files.")
+
+    async def _run(self, metrics: TaskMetrics, emit: TaskEventEmitter, user_prompt: str, repo_url: Optional[str], local_repo_path: Optional[str],
+                   ask_user_func: Optional[Callable[[str], Awaitable[str]]], checkpoint: Optional[TaskCheckpoint] = None) -> AgentResult:
+        logs: Deque[str] = deque(maxlen=self.max_log_messages)
         final_requirements = user_prompt
+        working_dir = local_repo_path
+
+        resumed = checkpoint is not None
+        if resumed:
+            if checkpoint.status != "running":
+                return AgentResult(checkpoint.status == "succeeded", checkpoint.current_code, [f"[Resume] Task {checkpoint.task_id} already {checkpoint.status}."])
+            logs.append(f"[Resume] Resuming task {checkpoint.task_id} after step '{checkpoint.phase}' (attempt {checkpoint.attempt}).")
+            emit("info", None, f"Resuming after step '{checkpoint.phase}' (attempt {checkpoint.attempt})", phase=checkpoint.phase, attempt=checkpoint.attempt)
+            final_requirements = checkpoint.final_requirements or user_prompt
+            if working_dir and checkpoint.workspace_tree:
+                await self._restore_workspace(working_dir, checkpoint.workspace_tree, logs)
+        elif self.checkpoint_store is not None:
+            checkpoint = TaskCheckpoint(metrics.task_id, user_prompt, repo_url, local_repo_path)
+            await self._save_checkpoint(checkpoint, emit)
+
+        repo_map = ""
+        if working_dir and self.repo_map is not None:
+            with metrics.phase("repo_map"):
+                repo_map = await self._repo_map_text(working_dir)
 
         # --- Phase 0: Clarification (Event-Driven) ---
-        if ask_user_func:
+        if ask_user_func and not (resumed and checkpoint.phase != "started"):
             logs.append("[Clarification] Starting clarification phase...")
             
             clarification_done = asyncio.Event()
@@ -60,9 +665,7 @@ class MultiAgentTask:
             # Initialize Skills
             repo_skill = RepositorySkill()
             fs_skill = FileSystemSkill()
-            
-            # Helper to handle cloning if needed
-            working_dir = local_repo_path
+            search_skill = CodeSearchSkill()
             
             if repo_url and not working_dir:
                  # Clone first if we have a URL but no path yet
@@ -74,30 +677,44 @@ class MultiAgentTask:
             clar_skill = ClarificationSkill(ask_user_func, on_requirements_ready)
             
             # Clarifier gets FS tools to inspect repo if needed
-            clarifier_tools = clar_skill.get_tools() + fs_skill.get_tools() + repo_skill.get_tools()
+            clarifier_tools = clar_skill.get_tools() + fs_skill.get_tools() + search_skill.get_tools() + repo_skill.get_tools()
             
             system_msg_extras = ""
             if working_dir:
                 system_msg_extras = f"**目前工作目錄 (CWD)**: `{working_dir}`\n請務必只讀取/修改此目錄下的檔案。"
+                if repo_map:
+                    system_msg_extras += f"\n\n{repo_map}\n"
             elif repo_url:
                 system_msg_extras = f"**任務目標**: 請先 Clone `{repo_url}`，然後將工作目錄鎖定在 Clone 下來的資料夾。"
 
-            clarifier_session = await self.client.create_session({
-                "model": self.model,
-                "system_message": (
-                    "你是需求分析師。你的任務是確保使用者的需求完全明確且可執行。"
-                    f"{system_msg_extras}\n"
-                    "重要：如果不確定檔案內容，請使用 `list_directory` 或 `read_file` 查看。\n"
-                    "如果使用者的 Prompt 太模糊，請使用 `ask_user` 工具向使用者發問。"
-                    "一旦資訊充足，請使用 `finalize_requirements` 工具提交完整的需求總結。"
-                ),
-                "tools": clarifier_tools,
-                "on_permission_request": lambda req, meta: {"kind": "allowed"}
-            })
+            def clarifier_config_for(model: str) -> dict:
+                return {
+                    "model": model,
+                    "system_message": (
+                        "你是需求分析師。你的任務是確保使用者的需求完全明確且可執行。"
+                        f"{system_msg_extras}\n"
+                        "重要：如果不確定檔案內容，請使用 `list_directory` 或 `read_file` 查看；要找特定程式碼或定義時，優先使用 `search_code`。\n"
+                        "如果使用者的 Prompt 太模糊，請使用 `ask_user` 工具向使用者發問。"
+                        "一旦資訊充足，請使用 `finalize_requirements` 工具提交完整的需求總結。"
+                    ),
+                    "tools": clarifier_tools,
+                    "streaming": True,
+                    "on_permission_request": lambda req, meta: {"kind": "allowed"}
+                }
+            clarify_phase = metrics.begin_phase("clarify", agent="Clarifier")
+            try:
+                clarifier_session, clarifier_config, _ = await self._open_session("Clarifier", 0, clarifier_config_for, emit, pooled=False)
+            except BaseException:
+                metrics.end_phase(clarify_phase)
+                raise
+            clarify_phase.model = clarifier_config["model"]
+            clarifier_tracker = ContextTracker(self.context_budget)
+            clarifier_instrument = SessionInstrument(metrics, "Clarifier")
+            clarifier_instrument.phase = clarify_phase
             
             # Setup logging and idle detection
-            self._setup_logging(clarifier_session, "Clarifier")
-            print(f"\n--- [Clarifier Analysis] ---")
+            self._attach(clarifier_session, "Clarifier", clarifier_tracker, clarifier_instrument, emit)
+            emit("phase", "Clarifier", "Clarifier Analysis", phase="clarify")
 
             session_idle = asyncio.Event()
             def on_idle(event: SessionEvent):
@@ -108,7 +725,10 @@ class MultiAgentTask:
             # Start the conversation
             try:
                 # Initial message
-                await clarifier_session.send(MessageOptions(prompt=f"User Request: {user_prompt}"))
+                clarifier_prompt = f"User Request: {user_prompt}"
+                clarifier_tracker.add_text(clarifier_prompt)
+                clarifier_instrument.sent(clarifier_prompt)
+                await clarifier_session.send(MessageOptions(prompt=clarifier_prompt))
                 
                 # Loop until requirements are finalized
                 while not clarification_done.is_set():
@@ -120,6 +740,8 @@ class MultiAgentTask:
                         ], 
                         return_when=asyncio.FIRST_COMPLETED
                     )
+                    for waiter in pending:
+                        waiter.cancel()
                     
                     if clarification_done.is_set():
                         break
@@ -130,22 +752,34 @@ class MultiAgentTask:
                         # and is now waiting for user input.
                         # We use the provided callback to get input.
                         response = await ask_user_func(" (Please answer the agent's question above)")
+
+                        preamble = ""
+                        if clarifier_tracker.over_budget:
+                            clarifier_session, preamble = await self._compact_session(
+                                clarifier_session, clarifier_config, "Clarifier", clarifier_tracker, pooled=False,
+                                instrument=clarifier_instrument, emit=emit
+                            )
+                            # The summary turn itself goes idle; don't mistake that for a new question
+                            session_idle.clear()
+                            self._attach(clarifier_session, "Clarifier", clarifier_tracker, clarifier_instrument, emit)
+                            clarifier_session.on(on_idle)
+                            logs.append(f"[Clarification] Context compacted (#{clarifier_tracker.compactions}).")
+                            preamble += f"Original User Request: {user_prompt}\n\nUser's latest answer:\n"
                         
                         # Send user response back to agent
-                        await clarifier_session.send(MessageOptions(prompt=response))
+                        clarifier_tracker.add_text(preamble + response)
+                        clarifier_instrument.sent(preamble + response)
+                        await clarifier_session.send(MessageOptions(prompt=preamble + response))
 
                 logs.append(f"[Clarification] Requirements finalized: {final_requirements[:100]}...")
             except asyncio.TimeoutError:
                 logs.append("[Clarification] Timed out waiting for clarification.")
-                return AgentResult(False, "", logs + ["Clarification timed out."])
+                logs.append("Clarification timed out.")
+                return AgentResult(False, "", list(logs))
             finally:
                 await clarifier_session.destroy()
-
-        # Initialize Skills (if not already done)
-        repo_skill = RepositorySkill()
-        fs_skill = FileSystemSkill()
-        
-        worker_tools = repo_skill.get_tools() + fs_skill.get_tools()
+                metrics.end_phase(clarify_phase)
+            await self._save_checkpoint(checkpoint, emit, phase="clarify", final_requirements=final_requirements)
 
         # Construct Prompt
         if working_dir:
@@ -158,94 +792,416 @@ class MultiAgentTask:
                 f"Please clone the repository at '{repo_url}' using the available tool first.\n"
                 f"Once cloned, analyze the codebase and fulfill the user request:\n\n{final_requirements}"
             )
-
-        # 1. 初始化 Sessions
-        # Worker gets the tools (skills) to interact with the world
-        
-        worker_sys_msg = "你是 Worker Agent。你擁有操作 Git 儲存庫與檔案系統技能。"
-        if working_dir:
-            worker_sys_msg += f"\n**工作目標目錄**: `{working_dir}`。請直接在此目錄進行操作，不需要 Clone。"
         else:
-            worker_sys_msg += "\n若使用者提供儲存庫 URL，請務必先使用工具將其 clone 下來。"
+            final_prompt = final_requirements
 
-        session_config = {
-            "model": self.model,
-            "system_message": worker_sys_msg,
-            "tools": worker_tools,
-            "on_permission_request": lambda req, meta: {"kind": "allowed"}
-        }
-        
-        # Reviewer doesn't need the tools, just needs to read the code (conceptual)
-        # But in a real scenario, Reviewer might also want to search files.
-        # For this demo, let's keep Reviewer focused on text analysis or give it read access if we had a FileSystem skill.
-        reviewer_config = {
-            "model": self.model,
-            "system_message": "你是 Reviewer Agent。你的任務是驗證 Worker 產生的程式碼是否完全符合 User Prompt 的要求。如果符合，請只回答 'PASS'。如果不符合或有錯誤，請具體指出問題。",
-            "on_permission_request": lambda req, meta: {"kind": "allowed"}
-        }
+        # 1. 初始化 Sessions (leased from the pool)
+        worker_config_for = lambda model: self._worker_config(working_dir, repo_map, model)
+        worker_session, worker_config, worker_rung = await self._open_session("Worker", 0, worker_config_for, emit)
+        try:
+            reviewer_session, reviewer_config, reviewer_rung = await self._open_session("Reviewer", 0, self._reviewer_config, emit)
+        except Exception:
+            await self.session_pool.release(worker_session, discard=True)
+            raise
         
-        # Set permissions for tools (allow cloning)
-        session_config["on_permission_request"] = lambda req, meta: {"kind": "allowed"}
+        # Setup logging and context tracking (detached again before the sessions go back to the pool)
+        worker_tracker = ContextTracker(self.context_budget)
+        reviewer_tracker = ContextTracker(self.context_budget)
+        worker_instrument = SessionInstrument(metrics, "Worker")
+        reviewer_instrument = SessionInstrument(metrics, "Reviewer")
+        worker_handlers = self._attach(worker_session, "Worker", worker_tracker, worker_instrument, emit)
+        reviewer_handlers = self._attach(reviewer_session, "Reviewer", reviewer_tracker, reviewer_instrument, emit)
 
-        worker_session = await self.client.create_session(session_config)
-        reviewer_session = await self.client.create_session(reviewer_config)
-        
-        # Setup logging
-        self._setup_logging(worker_session, "Worker")
-        self._setup_logging(reviewer_session, "Reviewer")
+        # The Worker's tools act outside any workspace we could snapshot when it clones by itself
+        worker_conversation = CachedConversation() if working_dir or not repo_url else None
+        reviewer_conversation = CachedConversation()
 
         current_code = ""
         feedback = ""
-        
+        healthy = True
+        # Workspace snapshot (git tree) taken after the previously reviewed attempt, for incremental review
+        last_tree = None
+        # Output the Reviewer saw last; attempts rejected by the pre-review gate never reach it
+        reviewed_code = ""
+        reviews = 0
+
+        start_attempt = 0
+        skip_worker_turn = False
+        # Failed attempts of this run, for the retry policy
+        history: List[AttemptRecord] = []
+        escalation_hint = ""
+        stop_reason = ""
+        # Sessions that haven't seen this task yet although earlier attempts ran (i.e. after a resume)
+        worker_fresh = reviewer_fresh = resumed
+        # Sessions that took the task over on another model
+        worker_handover = reviewer_handover = False
+        if resumed and checkpoint.phase in ("work", "pre_review", "review"):
+            current_code, feedback = checkpoint.current_code, checkpoint.feedback
+            reviewed_code, reviews = checkpoint.reviewed_code, checkpoint.reviews
+            if checkpoint.phase == "work":
+                # The Worker turn finished but its output was never checked: continue with the checks
+                start_attempt, skip_worker_turn = checkpoint.attempt - 1, True
+            else:
+                start_attempt = checkpoint.attempt
+
+        # The time budget covers the attempts only, not the wait for the user's answers during clarification
+        work_started = metrics.elapsed
         try:
-            for attempt in range(self.max_retries + 1):
+            for attempt in itertools.count(start_attempt):
+                if attempt > 0 and not skip_worker_turn:
+                    decision = await asyncio.to_thread(
+                        self.retry_policy.decide, history, attempt, metrics.elapsed - work_started, metrics.total_tokens()
+                    )
+                    if decision.action == STOP:
+                        stop_reason = decision.reason
+                        logs.append(f"[Retry] Stopping: {decision.reason}.")
+                        emit("info", None, f"Stopping: {decision.reason}", phase="retry", attempt=attempt, reason=decision.reason)
+                        break
+                    if decision.action == ESCALATE:
+                        escalation_hint = decision.hint
+                        logs.append(f"[Retry] Escalating: {decision.reason}.")
+                        emit("info", None, f"Escalating: {decision.reason}", phase="retry", attempt=attempt, reason=decision.reason)
+                        worker_session, worker_config, rung, worker_handlers = await self._escalate_session(
+                            "Worker", worker_session, worker_config, worker_rung, worker_config_for,
+                            worker_handlers, worker_tracker, worker_instrument, emit
+                        )
+                        if rung != worker_rung:
+                            worker_rung, worker_handover = rung, True
+                            if worker_conversation:
+                                worker_conversation.unsent.clear()
+                            logs.append(f"[Routing] Worker escalated to {worker_config['model']}.")
+                        if history and history[-1].source == "review":
+                            # The Reviewer keeps rejecting: let a larger model judge too
+                            reviewer_session, reviewer_config, rung, reviewer_handlers = await self._escalate_session(
+                                "Reviewer", reviewer_session, reviewer_config, reviewer_rung, self._reviewer_config,
+                                reviewer_handlers, reviewer_tracker, reviewer_instrument, emit
+                            )
+                            if rung != reviewer_rung:
+                                reviewer_rung, reviewer_handover = rung, True
+                                reviewer_conversation.unsent.clear()
+                                logs.append(f"[Routing] Reviewer escalated to {reviewer_config['model']}.")
+
                 logs.append(f"--- Attempt {attempt + 1} ---")
-                
-                # --- Worker Phase ---
-                if attempt == 0:
-                    worker_prompt = f"User Request: {final_prompt}"
+                attempt_tokens = metrics.total_tokens()
+                escalated = bool(escalation_hint)
+                if skip_worker_turn:
+                    # Resumed right after this attempt's Worker turn: its output comes from the checkpoint
+                    skip_worker_turn = False
+                    gate_base_tree, attempt_started = checkpoint.base_tree, checkpoint.attempt_started or time.time()
+                    logs.append("[Resume] Worker output of this attempt restored from the checkpoint.")
                 else:
-                    worker_prompt = f"Previous Code:\n{current_code}\n\nReviewer Feedback: {feedback}\n\nPlease fix the code."
+                    gate_base_tree = None
+                    attempt_started = time.time()
+                    if working_dir and (self.pre_review or checkpoint):
+                        gate_base_tree = await self._snapshot(working_dir)
+                
+                    # --- Worker Phase ---
+                    worker_preamble = ""
+                    if attempt > 0 and worker_tracker.over_budget:
+                        for unsubscribe in worker_handlers:
+                            if callable(unsubscribe):
+                                unsubscribe()
+                        with metrics.phase("compact", attempt + 1, "Worker", worker_config["model"]) as phase:
+                            worker_instrument.phase = phase
+                            worker_session, worker_preamble = await self._compact_session(
+                                worker_session, worker_config, "Worker", worker_tracker, pooled=True, instrument=worker_instrument, emit=emit
+                            )
+                        worker_handlers = self._attach(worker_session, "Worker", worker_tracker, worker_instrument, emit)
+                        if worker_conversation:
+                            # The next prompt carries the full state, replayed turns included
+                            worker_conversation.unsent.clear()
+                        logs.append(f"[Context] Worker context compacted (#{worker_tracker.compactions}).")
+
+                    if worker_fresh and not worker_preamble and attempt > 0:
+                        worker_preamble = RESUME_PREAMBLE
+                    elif worker_handover and not worker_preamble:
+                        worker_preamble = HANDOVER_PREAMBLE
 
-                logs.append(f"[Workering] Generating code...")
-                print(f"\n\n--- [Worker Attempt {attempt + 1}] ---")
-                # 這裡為了簡化，使用 send_and_wait 並假設回傳的是訊息
-                # 在實際 SDK 中，send_and_wait 回傳的是最後一個事件 (通常是 assistant message)
-                worker_event = await worker_session.send_and_wait(MessageOptions(prompt=worker_prompt))
+                    if attempt == 0:
+                        worker_prompt = f"User Request: {final_prompt}"
+                    elif worker_preamble:
+                        # Fresh session: it no longer has the previous output in its history
+                        worker_prompt = f"{worker_preamble}User Request: {final_prompt}\n\nPrevious Code:\n{current_code}\n\nReviewer Feedback: {feedback}\n\nPlease fix the code."
+                    elif self.incremental_review:
+                        # The Worker session already holds its previous output; only the feedback is new
+                        worker_prompt = f"Reviewer Feedback: {feedback}\n\nPlease fix the code."
+                    else:
+                        worker_prompt = f"Previous Code:\n{current_code}\n\nReviewer Feedback: {feedback}\n\nPlease fix the code."
+                    if escalation_hint:
+                        worker_prompt += f"\n\n{escalation_hint}"
+                        escalation_hint = ""
+
+                    logs.append(f"[Workering] Generating code... (prompt: {len(worker_prompt.encode('utf-8'))} bytes)")
+                    emit("phase", "Worker", f"Worker Attempt {attempt + 1}", phase="work", attempt=attempt + 1)
+                    # 這裡為了簡化，使用 send_and_wait 並假設回傳的是訊息
+                    # 在實際 SDK 中，send_and_wait 回傳的是最後一個事件 (通常是 assistant message)
+                    worker_tracker.add_text(worker_prompt)
+                    with metrics.phase("work", attempt + 1, "Worker", worker_config["model"]) as phase:
+                        worker_instrument.phase = phase
+                        worker_reply = await self._send(
+                            worker_session, worker_config, worker_prompt, worker_conversation, working_dir, "Worker", instrument=worker_instrument, emit=emit
+                        )
                 
-                if worker_event and worker_event.type == SessionEventType.ASSISTANT_MESSAGE:
-                    current_code = worker_event.data.content
-                    logs.append(f"[Worker Output]:\n{current_code[:200]}...") # Log 簡短版
-                else:
-                    logs.append("[Worker Error] No response.")
-                    return AgentResult(False, "", logs)
+                    if worker_reply is not None:
+                        current_code = worker_reply
+                        logs.append(f"[Worker Output]:\n{current_code[:200]}...") # Log 簡短版
+                    else:
+                        logs.append("[Worker Error] No response.")
+                        await self._save_checkpoint(checkpoint, emit, status="failed")
+                        return AgentResult(False, "", list(logs))
+                    worker_fresh = worker_handover = False
+                    await self._save_checkpoint(
+                        checkpoint, emit, phase="work", attempt=attempt + 1, current_code=current_code, base_tree=gate_base_tree,
+                        workspace_tree=await self._snapshot(working_dir) if checkpoint else None, attempt_started=attempt_started
+                    )
+
+                # --- Pre-Review Phase (local, no LLM) ---
+                if self.pre_review and working_dir and os.path.isdir(working_dir):
+                    with metrics.phase("pre_review", attempt + 1):
+                        changed = await self._changed_files(working_dir, gate_base_tree, attempt_started)
+                        report = await self.pre_review.run(working_dir, changed)
+                    logs.append(f"[Pre-Review] {len(changed)} changed file(s), {len(report.checked)} checked in {report.elapsed:.2f}s: {'OK' if report.passed else f'{len(report.failures)} problem(s)'}")
+                    for warning in report.warnings:
+                        logs.append(f"[Pre-Review Warning] {warning}")
+                    if not report.passed:
+                        feedback = report.as_feedback()
+                        logs.append(f"[Pre-Review Output]: {feedback}")
+                        emit("phase", "Pre-Review", f"Pre-Review Attempt {attempt + 1}", phase="pre_review", attempt=attempt + 1)
+                        emit("verdict", "Pre-Review", feedback, passed=False, attempt=attempt + 1, failures=len(report.failures))
+                        await self._save_checkpoint(checkpoint, emit, phase="pre_review", attempt=attempt + 1, feedback=feedback)
+                        history.append(AttemptRecord(
+                            attempt + 1, current_code, feedback, "pre_review", await self._snapshot(working_dir),
+                            time.time() - attempt_started, metrics.total_tokens() - attempt_tokens, escalated
+                        ))
+                        continue
 
                 # --- Reviewer Phase ---
-                reviewer_prompt = f"""
-Original User Request: {final_requirements}
-(Note: The task might involve a repository: {repo_url})
+                reviewer_preamble = ""
+                if attempt > 0 and reviewer_tracker.over_budget:
+                    for unsubscribe in reviewer_handlers:
+                        if callable(unsubscribe):
+                            unsubscribe()
+                    with metrics.phase("compact", attempt + 1, "Reviewer", reviewer_config["model"]) as phase:
+                        reviewer_instrument.phase = phase
+                        reviewer_session, reviewer_preamble = await self._compact_session(
+                            reviewer_session, reviewer_config, "Reviewer", reviewer_tracker, pooled=True, instrument=reviewer_instrument, emit=emit
+                        )
+                    reviewer_handlers = self._attach(reviewer_session, "Reviewer", reviewer_tracker, reviewer_instrument, emit)
+                    reviewer_conversation.unsent.clear()
+                    logs.append(f"[Context] Reviewer context compacted (#{reviewer_tracker.compactions}).")
+                if reviewer_fresh and not reviewer_preamble and reviews > 0:
+                    reviewer_preamble = RESUME_PREAMBLE
+                elif reviewer_handover and not reviewer_preamble:
+                    reviewer_preamble = HANDOVER_PREAMBLE
 
-Worker Generated Code / Output:
-{current_code}
+                if reviews == 0 or not self.incremental_review or reviewer_preamble:
+                    reviewer_prompt = reviewer_preamble + self._full_reviewer_prompt(final_requirements, repo_url, current_code)
+                    if reviews > 0 and self.incremental_review:
+                        last_tree = await self._snapshot(working_dir)
+                else:
+                    workspace_diff = None
+                    current_tree = await self._snapshot(working_dir)
+                    if last_tree and current_tree:
+                        workspace_diff = await asyncio.to_thread(
+                            workspace.diff_trees, working_dir, last_tree, current_tree, self.MAX_REVIEW_DIFF_CHARS
+                        )
+                    reviewer_prompt = self._incremental_reviewer_prompt(reviewed_code, current_code, workspace_diff)
+                    last_tree = current_tree
+                if self.incremental_review and reviews == 0:
+                    # Baseline for the next attempt's workspace diff
+                    last_tree = await self._snapshot(working_dir)
 
-Task: Check if the code/action meets the request. If yes, say 'PASS'. If no, explain why.
-"""
-                logs.append(f"[Reviewing] Validating code...")
-                print(f"\n\n--- [Reviewer Attempt {attempt + 1}] ---")
-                reviewer_event = await reviewer_session.send_and_wait(MessageOptions(prompt=reviewer_prompt))
+                logs.append(f"[Reviewing] Validating code... (prompt: {len(reviewer_prompt.encode('utf-8'))} bytes)")
+                emit("phase", "Reviewer", f"Reviewer Attempt {attempt + 1}", phase="review", attempt=attempt + 1)
+                reviewer_tracker.add_text(reviewer_prompt)
+                with metrics.phase("review", attempt + 1, "Reviewer", reviewer_config["model"]) as phase:
+                    reviewer_instrument.phase = phase
+                    reviewer_reply = await self._send(
+                        reviewer_session, reviewer_config, reviewer_prompt, reviewer_conversation, working_dir, "Reviewer",
+                        record_changes=False, instrument=reviewer_instrument, emit=emit
+                    )
+                reviewed_code = current_code
+                reviews += 1
+                reviewer_fresh = reviewer_handover = False
                 
-                if reviewer_event and reviewer_event.type == SessionEventType.ASSISTANT_MESSAGE:
-                    feedback = reviewer_event.data.content
+                passed = False
+                if reviewer_reply is not None:
+                    feedback = reviewer_reply
                     logs.append(f"[Reviewer Output]: {feedback}")
-                    
-                    if "PASS" in feedback:
-                        logs.append("[Success] Review Passed!")
-                        return AgentResult(True, current_code, logs)
+                    passed = "PASS" in feedback
+                    emit("verdict", "Reviewer", "PASS" if passed else "FAIL", passed=passed, attempt=attempt + 1, feedback=feedback)
                 else:
                     logs.append("[Reviewer Error] No response.")
-            
-            return AgentResult(False, current_code, logs)
+                await self._save_checkpoint(
+                    checkpoint, emit, phase="review", attempt=attempt + 1, feedback=feedback, reviewed_code=reviewed_code,
+                    reviews=reviews, status="succeeded" if passed else "running"
+                )
+                if passed:
+                    logs.append("[Success] Review Passed!")
+                    return AgentResult(True, current_code, list(logs))
+                history.append(AttemptRecord(
+                    attempt + 1, current_code, feedback, "review", await self._snapshot(working_dir),
+                    time.time() - attempt_started, metrics.total_tokens() - attempt_tokens, escalated
+                ))
+
+            await self._save_checkpoint(checkpoint, emit, status="failed", stop_reason=stop_reason)
+            return AgentResult(False, current_code, list(logs))
 
+        except BaseException:
+            # A session interrupted mid-turn is not safe to reuse
+            healthy = False
+            raise
+        finally:
+            for unsubscribe in worker_handlers + reviewer_handlers:
+                if callable(unsubscribe):
+                    unsubscribe()
+            await self.session_pool.release(worker_session, discard=not healthy)
+            await self.session_pool.release(reviewer_session, discard=not healthy)
+
+    async def run_speculative(self, user_prompt: str, repo_url: Optional[str] = None, local_repo_path: Optional[str] = None, candidates: int = 3) -> AgentResult:
+        """
+        Trades tokens for latency: runs `candidates` Worker/Reviewer loops in parallel, each on its own
+        copy of the workspace, and keeps the first one the Reviewer passes. The other candidates are
+        cancelled and only the winner's changes are applied to the real workspace.
+        (No clarification phase; pass already-clarified requirements.)
+        :param user_prompt: 使用者的需求
+        :param repo_url: (可選) 要 Clone 的 Repo URL (cloned once up front, shared by all candidates)
+        :param local_repo_path: (可選) 已存在的本地 Repo 路徑
+        :param candidates: Number of candidates to run in parallel
+        """
+        if candidates < 1:
+            raise ValueError("candidates must be >= 1")
+        logs = []
+        working_dir = local_repo_path
+        if repo_url and not working_dir:
+            working_dir = await RepositorySkill().checkout(repo_url)
+            logs.append(f"[Speculative] Cloned {repo_url} to {working_dir}")
+        if working_dir:
+            working_dir = os.path.abspath(working_dir)
+
+        copies: List[Optional[CandidateWorkspace]] = [None] * candidates
+        if working_dir:
+            base_tree = await self._snapshot(working_dir)
+
+            def create_copies() -> List[CandidateWorkspace]:
+                # One at a time: concurrent `git worktree add` on the same repository contend for its locks
+                created = []
+                try:
+                    for _ in range(candidates):
+                        created.append(CandidateWorkspace.create(working_dir, base_tree))
+                except Exception:
+                    for c in created:
+                        c.cleanup()
+                    raise
+                return created
+
+            copies = await asyncio.to_thread(create_copies)
+        logs.append(f"[Speculative] Started {candidates} candidates.")
+
+        async def run_candidate(index: int) -> Tuple[int, AgentResult]:
+            copy = copies[index]
+            # Candidates already have private copies; apply_to_source needs their changes in place
+            return index, await self._result_of(self._stream(
+                lambda metrics, emit: self._run(metrics, emit, user_prompt, None, copy.path if copy else None, None), 1000
+            ))
+
+        tasks = [asyncio.create_task(run_candidate(i)) for i in range(candidates)]
+        winner = None
+        last_result = None
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                try:
+                    index, result = await next_done
+                except Exception as e:
+                    logs.append(f"[Speculative] A candidate failed: {e}")
+                    continue
+                logs.extend(f"[Candidate {index + 1}] {m}" for m in result.messages)
+                last_result = result
+                if result.success:
+                    winner = index
+                    logs.append(f"[Speculative] Candidate {index + 1} passed review first; cancelling the others.")
+                    break
+        finally:
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        try:
+            if winner is None:
+                logs.append("[Speculative] No candidate passed review.")
+                return AgentResult(False, last_result.code if last_result else "", logs)
+
+            code = last_result.code
+            metrics = last_result.metrics
+            copy = copies[winner]
+            if copy:
+                code = code.replace(copy.path, working_dir)
+                try:
+                    await asyncio.to_thread(copy.apply_to_source)
+                    logs.append(f"[Speculative] Applied candidate {winner + 1}'s changes to {working_dir}.")
+                except Exception as e:
+                    logs.append(f"[Speculative] Could not apply candidate {winner + 1}'s changes: {e}")
+                    return AgentResult(False, code, logs, metrics)
+            return AgentResult(True, code, logs, metrics)
+        finally:
+            for c in copies:
+                if c:
+                    await asyncio.to_thread(c.cleanup)
+
+    async def run_many(self, jobs: Iterable[Union[BatchJob, Tuple[str, Optional[str]]]], concurrency: int = 4, timeout: Optional[float] = None) -> AsyncIterator[BatchResult]:
+        """
+        Runs many jobs concurrently and yields results as they complete.
+        :param jobs: `BatchJob`s or `(prompt, repo)` tuples; `repo` is a local path if it exists, otherwise a URL
+        :param concurrency: Maximum number of jobs running at the same time
+        :param timeout: (可選) Per-job timeout in seconds
+        """
+        if concurrency < 1:
+            raise ValueError("concurrency must be >= 1")
+
+        # Jobs are started strictly in submission order (FIFO), so a long job never starves later ones
+        # of a slot for longer than it takes one of the running jobs to finish.
+        queue: asyncio.Queue = asyncio.Queue()
+        for i, job in enumerate(jobs):
+            if not isinstance(job, BatchJob):
+                prompt, repo = job
+                if repo and os.path.isdir(repo):
+                    job = BatchJob(prompt, local_repo_path=os.path.abspath(repo))
+                else:
+                    job = BatchJob(prompt, repo_url=repo)
+            if job.job_id is None:
+                job.job_id = str(i)
+            queue.put_nowait(job)
+
+        total = queue.qsize()
+        results: asyncio.Queue = asyncio.Queue()
+
+        async def run_job(job: BatchJob) -> AgentResult:
+            try:
+                return await asyncio.wait_for(
+                    self.run(job.prompt, repo_url=job.repo_url, local_repo_path=job.local_repo_path),
+                    timeout
+                )
+            except asyncio.TimeoutError:
+                return AgentResult(False, "", [f"[Batch] Job {job.job_id} timed out after {timeout}s."])
+            except Exception as e:
+                return AgentResult(False, "", [f"[Batch] Job {job.job_id} failed: {e}"])
+
+        async def worker():
+            while True:
+                try:
+                    job = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                started = time.perf_counter()
+                result = await run_job(job)
+                await results.put(BatchResult(job, result, time.perf_counter() - started))
+
+        workers = [asyncio.create_task(worker()) for _ in range(min(concurrency, total))]
+        try:
+            for _ in range(total):
+                yield await results.get()
         finally:
-            await worker_session.destroy()
-            await reviewer_session.destroy()
+            # Consumer stopped early (break / aclose): don't leave jobs running in the background
+            for w in workers:
+                w.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
@@ -0,0 +1,228 @@
+import os
+import ast
+import sys
+import time
+import asyncio
+import importlib.util
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from typing import List, Optional, Sequence, Tuple, Union
+from src.skills.ignore import walk
+
+@dataclass
+class PreReviewReport:
+    passed: bool
+    checked: List[str] = field(default_factory=list)
+    failures: List[str] = field(default_factory=list)
+    # Problems that don't fail the gate (e.g. third-party imports not installed in this interpreter)
+    warnings: List[str] = field(default_factory=list)
+    elapsed: float = 0.0
+
+    def as_feedback(self) -> str:
+        return "Automated pre-review checks failed (the Reviewer was not consulted):\n" + "\n".join(f"- {f}" for f in self.failures)
+
+def _guarded_by_import_error(node: ast.Try) -> bool:
+    for handler in node.handlers:
+        names = []
+        if handler.type is None:
+            return True
+        for t in (handler.type.elts if isinstance(handler.type, ast.Tuple) else [handler.type]):
+            names.append(getattr(t, "id", None) or getattr(t, "attr", None))
+        if {"ImportError", "ModuleNotFoundError", "Exception", "BaseException"} & set(names):
+            return True
+    return False
+
+def _module_level_imports(tree: ast.Module) -> List[ast.stmt]:
+    """Imports executed unconditionally at import time (skips try/except ImportError and `if` blocks)."""
+    imports = []
+    for node in tree.body:
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            imports.append(node)
+        elif isinstance(node, ast.Try) and not _guarded_by_import_error(node):
+            imports.extend(n for n in node.body if isinstance(n, (ast.Import, ast.ImportFrom)))
+    return imports
+
+def _module_exists(path: str) -> bool:
+    """Whether `path` (without extension) is a package directory, a Python source/stub or an extension module."""
+    if os.path.isdir(path) or os.path.exists(path + ".py") or os.path.exists(path + ".pyi"):
+        return True
+    parent, name = os.path.split(path)
+    try:
+        return any(n.startswith(name + ".") and n.endswith((".so", ".pyd")) for n in os.listdir(parent))
+    except OSError:
+        return False
+
+def _installed(top: str) -> bool:
+    if top in sys.builtin_module_names or top in getattr(sys, "stdlib_module_names", ()):
+        return True
+    try:
+        # Only the top-level name: find_spec on a dotted name would import the parent package
+        return importlib.util.find_spec(top) is not None
+    except (ImportError, ValueError):
+        return False
+
+def check_python_file(root: str, rel: str, check_imports: bool = True) -> Tuple[List[str], List[str]]:
+    """
+    Parses/compiles one file and checks its module-level imports. Returns (failures, warnings).
+    Imports of the workspace's own modules must resolve; third-party imports that aren't installed
+    in this interpreter are only warnings (the workspace's dependencies needn't be installed here).
+    Runs in a worker process.
+    """
+    path = os.path.join(root, rel)
+    try:
+        with open(path, "rb") as f:
+            source = f.read()
+    except OSError as e:
+        return [f"{rel}: cannot read file: {e}"], []
+    try:
+        tree = ast.parse(source, filename=rel)
+        compile(tree, rel, "exec")
+    except SyntaxError as e:
+        return [f"{rel}:{e.lineno}: SyntaxError: {e.msg}"], []
+    except ValueError as e:
+        return [f"{rel}: {e}"], []
+
+    if not check_imports:
+        return [], []
+    failures, warnings = [], []
+    file_dir = os.path.dirname(path)
+    search_dirs = [file_dir, root, os.path.join(root, "src")]
+    for node in _module_level_imports(tree):
+        if isinstance(node, ast.ImportFrom):
+            if node.level:
+                # Relative import: the target must exist next to (or above) this file
+                base = file_dir
+                for _ in range(node.level - 1):
+                    base = os.path.dirname(base)
+                target = os.path.join(base, *(node.module or "").split(".")) if node.module else base
+                if not (os.path.exists(target + ".py") or os.path.isdir(target)):
+                    failures.append(f"{rel}:{node.lineno}: unresolved relative import '{'.' * node.level}{node.module or ''}'")
+                continue
+            names = [node.module] if node.module else []
+        else:
+            names = [alias.name for alias in node.names]
+        for name in names:
+            top = name.split(".")[0]
+            if top in sys.builtin_module_names or top in getattr(sys, "stdlib_module_names", ()):
+                continue
+            local = next((d for d in search_dirs if _module_exists(os.path.join(d, top))), None)
+            if local is not None:
+                # One of the workspace's own packages: the whole dotted path has to exist there
+                if not _module_exists(os.path.join(local, *name.split("."))):
+                    failures.append(f"{rel}:{node.lineno}: unresolved import '{name}'")
+            elif not _installed(top):
+                warnings.append(f"{rel}:{node.lineno}: import '{name}' is neither in the workspace nor installed here")
+    return failures, warnings
+
+def files_modified_since(root: str, since: float) -> List[str]:
+    """Fallback change detection for non-git workspaces: files whose mtime is newer than `since`."""
+    changed = []
+    for rel, is_dir, _ in walk(root):
+        if not is_dir:
+            try:
+                if os.stat(os.path.join(root, rel)).st_mtime >= since:
+                    changed.append(rel)
+            except OSError:
+                pass
+    return changed
+
+class PreReviewGate:
+    """
+    Cheap local checks on the files a Worker attempt changed, run before paying for a Reviewer
+    round trip: Python files are parsed/compiled and their imports resolved in a process pool,
+    then an optional test command runs in the workspace.
+    """
+    def __init__(self, test_command: Optional[Union[str, List[str]]] = None, test_timeout: float = 300.0,
+                 check_imports: bool = True, max_workers: Optional[int] = None):
+        """
+        :param test_command: (可選) Command run in the workspace once the static checks pass
+                             (e.g. "python -m pytest -q -x"); a non-zero exit code fails the gate
+        :param test_timeout: Seconds before the test command is killed and reported as a failure
+        :param check_imports: Also verify that module-level imports of the workspace's own modules resolve
+                              (third-party imports that aren't installed here are reported as warnings)
+        :param max_workers: (可選) Size of the process pool used for the per-file checks
+        """
+        self.test_command = test_command
+        self.test_timeout = test_timeout
+        self.check_imports = check_imports
+        self.max_workers = max_workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+        # Set once the pool broke: later runs check in this process
+        self._in_process = False
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # Not plain fork: a worker forked while another thread is starting a git subprocess would
+            # inherit that subprocess's exec-status pipe and hang it (tasks run git in worker threads)
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else None
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=multiprocessing.get_context(method))
+        return self._pool
+
+    async def _run_tests(self, working_dir: str) -> Optional[str]:
+        if isinstance(self.test_command, str):
+            proc = await asyncio.create_subprocess_shell(
+                self.test_command, cwd=working_dir,
+                stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT
+            )
+        else:
+            proc = await asyncio.create_subprocess_exec(
+                *self.test_command, cwd=working_dir,
+                stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT
+            )
+        try:
+            output, _ = await asyncio.wait_for(proc.communicate(), self.test_timeout)
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+            return f"Test command timed out after {self.test_timeout}s."
+        if proc.returncode != 0:
+            tail = output.decode("utf-8", errors="replace")[-3000:]
+            return f"Test command failed (exit code {proc.returncode}):\n{tail}"
+        return None
+
+    async def run(self, working_dir: str, files: Sequence[str]) -> PreReviewReport:
+        """
+        :param working_dir: Workspace root
+        :param files: Changed files, relative to `working_dir`
+        """
+        started = time.perf_counter()
+        python_files = [f for f in files if f.endswith(".py") and os.path.isfile(os.path.join(working_dir, f))]
+        report = PreReviewReport(passed=True, checked=list(python_files))
+
+        if python_files:
+            results = None
+            if not self._in_process:
+                loop = asyncio.get_running_loop()
+                try:
+                    results = await asyncio.gather(*[
+                        loop.run_in_executor(self._executor(), check_python_file, working_dir, f, self.check_imports)
+                        for f in python_files
+                    ])
+                except (BrokenProcessPool, OSError):
+                    # The pool can't start or lost a worker (e.g. a caller script without a __main__ guard
+                    # under forkserver): drop it and check in this process from now on
+                    self.close()
+                    self._in_process = True
+            if results is None:
+                results = await asyncio.gather(*[
+                    asyncio.to_thread(check_python_file, working_dir, f, self.check_imports) for f in python_files
+                ])
+            for failures, warnings in results:
+                report.failures.extend(failures)
+                report.warnings.extend(warnings)
+
+        if not report.failures and self.test_command and files:
+            failure = await self._run_tests(working_dir)
+            if failure:
+                report.failures.append(failure)
+
+        report.passed = not report.failures
+        report.elapsed = time.perf_counter() - started
+        return report
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
@@ -0,0 +1,263 @@
+"""Repository map (file tree + top-level signatures) per git commit, cached on disk."""
+import os
+import ast
+import json
+import hashlib
+import threading
+import subprocess
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+from src.skills.code_search import SYMBOL_PATTERNS
+
+MAP_VERSION = 1
+# Larger blobs are listed without signatures
+MAX_PARSED_FILE_BYTES = 512 * 1024
+MAX_SIGNATURES_PER_FILE = 40
+MAX_SIGNATURE_CHARS = 160
+
+# Extensions the regex patterns understand well enough to be worth a signature list
+CODE_EXTENSIONS = {
+    ".js", ".jsx", ".mjs", ".cjs", ".ts", ".tsx", ".go", ".rs", ".java", ".kt", ".kts", ".scala",
+    ".cs", ".swift", ".c", ".h", ".cc", ".cpp", ".hpp", ".rb", ".php",
+}
+
+def _git(path: str, args: List[str], input: Optional[bytes] = None) -> bytes:
+    result = subprocess.run(["git"] + args, cwd=path, capture_output=True, input=input)
+    if result.returncode != 0:
+        raise subprocess.CalledProcessError(result.returncode, ["git"] + args, result.stdout, result.stderr)
+    return result.stdout
+
+def _clip(text: str) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= MAX_SIGNATURE_CHARS else text[:MAX_SIGNATURE_CHARS - 3] + "..."
+
+def _python_signatures(source: str) -> List[str]:
+    """Top-level functions, classes (with their methods, indented) and constants."""
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError):
+        return []
+
+    def function(node, indent: str = "") -> str:
+        prefix = "async def" if isinstance(node, ast.AsyncFunctionDef) else "def"
+        returns = f" -> {ast.unparse(node.returns)}" if node.returns else ""
+        return indent + _clip(f"{prefix} {node.name}({ast.unparse(node.args)}){returns}")
+
+    signatures = []
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            signatures.append(function(node))
+        elif isinstance(node, ast.ClassDef):
+            bases = ", ".join(ast.unparse(b) for b in node.bases + node.keywords)
+            signatures.append(_clip(f"class {node.name}({bases})" if bases else f"class {node.name}"))
+            signatures.extend(
+                function(child, "  ") for child in node.body
+                if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef))
+                and (not child.name.startswith("_") or child.name == "__init__")
+            )
+        elif isinstance(node, (ast.Assign, ast.AnnAssign)):
+            targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+            names = [t.id for t in targets if isinstance(t, ast.Name) and t.id.isupper()]
+            signatures.extend(f"{name} = ..." for name in names)
+    return signatures
+
+def _regex_signatures(source: str) -> List[str]:
+    """Definition lines at (or near) the top level, via the code search patterns."""
+    signatures = []
+    for line in source.splitlines():
+        if len(line) - len(line.lstrip()) > 4:
+            continue  # Nested definitions
+        for _, pattern in SYMBOL_PATTERNS:
+            if pattern.match(line):
+                indent = "  " if line[:1].isspace() else ""
+                signatures.append(indent + _clip(line.strip().rstrip("{").rstrip()))
+                break
+    return signatures
+
+def extract_signatures(path: str, data: bytes) -> List[str]:
+    """Signature lines of one file (empty for binary, oversized or unsupported files)."""
+    if len(data) > MAX_PARSED_FILE_BYTES or b"\0" in data[:8192]:
+        return []
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in CODE_EXTENSIONS and ext not in (".py", ".pyi"):
+        return []
+    source = data.decode("utf-8", errors="replace")
+    signatures = _python_signatures(source) if ext in (".py", ".pyi") else _regex_signatures(source)
+    if len(signatures) > MAX_SIGNATURES_PER_FILE:
+        signatures = signatures[:MAX_SIGNATURES_PER_FILE] + [f"... ({len(signatures) - MAX_SIGNATURES_PER_FILE} more)"]
+    return signatures
+
+@dataclass
+class RepoMap:
+    root: str
+    commit: str
+    files: Dict[str, Tuple[str, List[str]]]  # relpath -> (blob id, signatures)
+
+    def render(self, max_chars: int = 8000) -> str:
+        """
+        The map as text of at most `max_chars`: every file with its signatures if that fits,
+        otherwise every path with top-level signatures for as many files as fit, otherwise
+        as many paths as fit.
+        """
+        paths = sorted(self.files)
+        header = f"Repository map of {self.root} (commit {self.commit[:12]}, {len(paths)} files):"
+        lines = [header]
+        for path in paths:
+            lines.append(path)
+            lines.extend(f"    {sig}" for sig in self.files[path][1])
+        text = "\n".join(lines)
+        if len(text) <= max_chars:
+            return text
+
+        budget = max_chars - len(header) - sum(1 + len(p) for p in paths)
+        if budget >= 0:
+            lines = [header]
+            for path in paths:
+                lines.append(path)
+                block = [f"    {sig}" for sig in self.files[path][1] if not sig.startswith("  ")]
+                cost = sum(1 + len(line) for line in block)
+                if block and cost <= budget:
+                    lines.extend(block)
+                    budget -= cost
+            return "\n".join(lines)
+
+        lines = [header]
+        used = len(header)
+        for i, path in enumerate(paths):
+            more = f"... ({len(paths) - i} more files)"
+            if used + 1 + len(path) + 1 + len(more) > max_chars:
+                lines.append(more)
+                break
+            lines.append(path)
+            used += 1 + len(path)
+        return "\n".join(lines)[:max_chars]
+
+class RepoMapCache:
+    """
+    Builds `RepoMap`s of git workspaces and keeps them on disk, one JSON file per
+    (repository, commit, sub-directory). Task worktrees of the same repository share
+    the cache. A new commit only parses the blobs that changed: unchanged files are
+    taken from the repository's most recent map. The map describes HEAD, not
+    uncommitted edits.
+    """
+    def __init__(self, cache_dir: str = os.path.join("workspaces", ".cache", "repo_maps"), max_maps_per_repo: int = 8):
+        """
+        :param max_maps_per_repo: Maps kept per repository (older commits are deleted)
+        """
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_maps_per_repo = max_maps_per_repo
+        # One lock per map file: tasks on the same commit build it once, other repositories don't wait
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+
+    def _repo_dir(self, path: str) -> str:
+        common_dir = os.path.abspath(os.path.join(path, _git(path, ["rev-parse", "--git-common-dir"]).decode().strip()))
+        return os.path.join(self.cache_dir, hashlib.sha1(common_dir.encode("utf-8")).hexdigest()[:12])
+
+    def _tree(self, path: str) -> Dict[str, Tuple[str, int]]:
+        """relpath -> (blob id, size) of HEAD below `path`."""
+        files = {}
+        out = _git(path, ["ls-tree", "-r", "-l", "-z", "HEAD", "."])
+        for entry in out.split(b"\0"):
+            if not entry:
+                continue
+            meta, rel = entry.split(b"\t", 1)
+            _, kind, blob, size = meta.split()
+            if kind == b"blob":
+                files[rel.decode("utf-8", errors="replace")] = (blob.decode(), int(size) if size.isdigit() else 0)
+        return files
+
+    @staticmethod
+    def _read_blobs(path: str, blobs: List[str]) -> Dict[str, bytes]:
+        if not blobs:
+            return {}
+        out = _git(path, ["cat-file", "--batch"], input="".join(b + "\n" for b in blobs).encode())
+        contents = {}
+        pos = 0
+        for blob in blobs:
+            nl = out.index(b"\n", pos)
+            header = out[pos:nl].split()
+            pos = nl + 1
+            if len(header) < 3 or header[1] == b"missing":
+                continue
+            size = int(header[2])
+            contents[blob] = out[pos:pos + size]
+            pos += size + 1  # Content is followed by a newline
+        return contents
+
+    def _load(self, map_path: str) -> Optional[dict]:
+        try:
+            with open(map_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return data if data.get("version") == MAP_VERSION else None
+
+    def _known_signatures(self, repo_dir: str) -> Dict[str, List[str]]:
+        """blob id -> signatures from the repository's cached maps (other commits and sub-directories)."""
+        known: Dict[str, List[str]] = {}
+        try:
+            names = [n for n in os.listdir(repo_dir) if n.endswith(".json")]
+        except OSError:
+            return known
+        for name in names:
+            data = self._load(os.path.join(repo_dir, name))
+            if data is not None:
+                known.update((blob, sigs) for blob, sigs in data["files"].values())
+        return known
+
+    def _prune(self, repo_dir: str):
+        try:
+            names = sorted(
+                (n for n in os.listdir(repo_dir) if n.endswith(".json")),
+                key=lambda n: os.path.getmtime(os.path.join(repo_dir, n)), reverse=True
+            )
+        except OSError:
+            return
+        for name in names[self.max_maps_per_repo:]:
+            try:
+                os.unlink(os.path.join(repo_dir, name))
+            except OSError:
+                pass
+
+    def get(self, path: str) -> Optional[RepoMap]:
+        """Map of HEAD below `path`; None if `path` isn't inside a git repository with commits."""
+        path = os.path.abspath(path)
+        try:
+            commit = _git(path, ["rev-parse", "--verify", "HEAD^{commit}"]).decode().strip()
+            prefix = _git(path, ["rev-parse", "--show-prefix"]).decode().strip()
+            repo_dir = self._repo_dir(path)
+        except (subprocess.CalledProcessError, OSError):
+            return None
+        suffix = f"-{hashlib.sha1(prefix.encode('utf-8')).hexdigest()[:8]}.json"
+        map_path = os.path.join(repo_dir, commit + suffix)
+
+        with self._locks_guard:
+            lock = self._locks.setdefault(map_path, threading.Lock())
+        with lock:
+            data = self._load(map_path)
+            if data is not None:
+                os.utime(map_path)  # Recently used maps survive pruning
+                return RepoMap(path, commit, {rel: (blob, sigs) for rel, (blob, sigs) in data["files"].items()})
+
+            tree = self._tree(path)
+            known = self._known_signatures(repo_dir)
+            missing = sorted({
+                blob for rel, (blob, size) in tree.items()
+                if blob not in known and size <= MAX_PARSED_FILE_BYTES
+                and os.path.splitext(rel)[1].lower() in CODE_EXTENSIONS | {".py", ".pyi"}
+            })
+            contents = self._read_blobs(path, missing)
+            files = {}
+            for rel, (blob, _) in tree.items():
+                if blob not in known:
+                    known[blob] = extract_signatures(rel, contents[blob]) if blob in contents else []
+                files[rel] = (blob, known[blob])
+
+            os.makedirs(repo_dir, exist_ok=True)
+            tmp_path = map_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": MAP_VERSION, "commit": commit, "prefix": prefix, "files": files}, f)
+            os.replace(tmp_path, map_path)
+            self._prune(repo_dir)
+            return RepoMap(path, commit, files)
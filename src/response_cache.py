@@ -0,0 +1,135 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import List, Literal, Optional, Tuple
+
+CacheMode = Literal["read_write", "record", "replay"]
+
+class CacheMissError(Exception):
+    """Raised in replay mode when a turn has no recorded response."""
+
+class ResponseCache:
+    """
+    On-disk (SQLite) cache of Worker/Reviewer turns.
+
+    A turn is keyed by model, system message, the conversation so far, the prompt and
+    the workspace snapshot it ran against. Besides the reply, the cache stores the patch
+    the turn's tool calls made to the workspace, so replaying a turn reproduces its file
+    changes too. Entries expire after `ttl` seconds and the least recently used ones are
+    evicted beyond `max_entries`.
+
+    Modes:
+        read_write: replay hits, call the model on misses and record them (default)
+        record:     always call the model and (re)record the response
+        replay:     only replay; a miss raises `CacheMissError` (deterministic runs)
+    """
+    def __init__(self, path: str = os.path.join("workspaces", ".cache", "responses.sqlite"), mode: CacheMode = "read_write",
+                 max_entries: int = 10000, ttl: Optional[float] = 7 * 24 * 3600):
+        """
+        :param ttl: (可選) Seconds an entry stays valid; None keeps entries until evicted by `max_entries`
+        """
+        if mode not in ("read_write", "record", "replay"):
+            raise ValueError(f"Unknown cache mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, model TEXT, response TEXT NOT NULL, patch BLOB, "
+                "created REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses(last_used)")
+
+    @staticmethod
+    def make_key(model: str, system_message: str, history: str, prompt: str, workspace_state: str) -> str:
+        digest = hashlib.sha256()
+        for part in (model, system_message, history, prompt, workspace_state):
+            data = (part or "").encode("utf-8")
+            # Length-prefixed so ("ab", "c") and ("a", "bc") hash differently
+            digest.update(len(data).to_bytes(8, "big"))
+            digest.update(data)
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[Tuple[str, bytes]]:
+        """Returns (response, workspace patch) or None."""
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT response, patch, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.ttl is not None and row[2] < now - self.ttl:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return row[0], bytes(row[1] or b"")
+
+    def put(self, key: str, model: str, response: str, patch: bytes = b""):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, patch, created, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, response, sqlite3.Binary(patch), now, now)
+            )
+            self._evict_locked(now)
+
+    def _evict_locked(self, now: float):
+        if self.ttl is not None:
+            self._conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+        self._conn.execute(
+            "DELETE FROM responses WHERE key IN ("
+            "SELECT key FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM responses")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+class CachedConversation:
+    """
+    Cache bookkeeping for one session: a digest of the turns so far (part of every key) and
+    the turns that were replayed from the cache, which the live session has never seen and
+    must be told about before its next real turn.
+    """
+    def __init__(self):
+        self.history = ""
+        self.unsent: List[Tuple[str, str]] = []
+
+    def _advance(self, prompt: str, response: str):
+        self.history = ResponseCache.make_key("", "", self.history, prompt, response)
+
+    def replayed(self, prompt: str, response: str):
+        self._advance(prompt, response)
+        self.unsent.append((prompt, response))
+
+    def sent(self, prompt: str, response: str):
+        self._advance(prompt, response)
+        self.unsent.clear()
+
+    def transcript(self) -> str:
+        """Prefix for the next live prompt carrying the replayed turns."""
+        if not self.unsent:
+            return ""
+        turns = "\n\n".join(f"[User]\n{p}\n\n[Assistant]\n{r}" for p, r in self.unsent)
+        return f"[Earlier turns of this conversation]\n{turns}\n\n[Current turn]\n"
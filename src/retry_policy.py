@@ -0,0 +1,125 @@
+"""When a task whose attempt failed gets another one: attempt cap, wall-clock/token budgets and convergence checks."""
+import difflib
+from dataclasses import dataclass
+from typing import List, Optional
+
+RETRY = "retry"
+ESCALATE = "escalate"
+STOP = "stop"
+
+# Longer texts are compared on their head and tail only (SequenceMatcher is quadratic in the worst case)
+MAX_COMPARED_CHARS = 8000
+
+ESCALATION_HINT = (
+    "Your recent attempts are not converging ({reason}). Do not repeat the previous approach: re-read the "
+    "relevant files, work out why the feedback above still applies, and fix its root cause differently."
+)
+
+def _normalize(text: str) -> str:
+    text = " ".join(text.split())
+    if len(text) > MAX_COMPARED_CHARS:
+        half = MAX_COMPARED_CHARS // 2
+        text = text[:half] + text[-half:]
+    return text
+
+def similar(a: str, b: str, threshold: float) -> bool:
+    """Whether `a` and `b` are near-identical (difflib ratio >= `threshold`, whitespace ignored)."""
+    a, b = _normalize(a), _normalize(b)
+    if a == b:
+        return True
+    if not a or not b:
+        return False
+    matcher = difflib.SequenceMatcher(None, a, b)
+    # Cheap upper bounds first
+    return matcher.real_quick_ratio() >= threshold and matcher.quick_ratio() >= threshold and matcher.ratio() >= threshold
+
+@dataclass
+class AttemptRecord:
+    """A failed attempt, as the retry policy sees it."""
+    attempt: int                          # 1-based
+    output: str                           # Worker output
+    feedback: str                         # Reviewer / pre-review feedback it got
+    source: str                           # review / pre_review
+    workspace_tree: Optional[str] = None  # Workspace snapshot after the attempt (None without a git workspace)
+    duration: float = 0.0                 # Seconds
+    tokens: int = 0                       # Tokens the attempt used (all agents)
+    escalated: bool = False               # Ran after an escalation
+
+@dataclass
+class RetryDecision:
+    action: str            # retry / escalate / stop
+    reason: str = ""
+    hint: str = ""         # escalate: appended to the Worker's next prompt
+
+class RetryPolicy:
+    """
+    Decides after every failed attempt whether the task gets another one. Besides the attempt
+    cap, it stops when the task's wall-clock or token budget is spent, or would be by the next
+    attempt (judged by the mean cost of the attempts so far), and it watches for attempts that
+    don't converge: the Worker handing in near-identical output with an unchanged workspace,
+    or the same feedback coming back twice in a row. The first time that happens the task
+    escalates (the Worker is told to change its approach and, with a `ModelRouting` ladder,
+    the agents move to larger models); once the escalations are used up, it stops.
+
+    Subclass and override `decide` for other strategies.
+    """
+    def __init__(self, max_attempts: int = 4, max_seconds: Optional[float] = None, max_tokens: Optional[int] = None,
+                 similarity_threshold: float = 0.95, escalate: bool = True, max_escalations: int = 1):
+        """
+        :param max_attempts: Worker attempts per task, the first one included
+        :param max_seconds: (可選) Wall-clock budget of a task run's attempts (clarification, which waits for
+                            the user, doesn't count)
+        :param max_tokens: (可選) Token budget of a task run (input + output of all agents)
+        :param similarity_threshold: difflib ratio from which two outputs (or two feedbacks) count as the same
+        :param escalate: Set to False to stop at the first non-converging attempt instead of escalating
+        :param max_escalations: Escalations per task run (e.g. one per extra rung of the model ladders)
+        """
+        self.max_attempts = max_attempts
+        self.max_seconds = max_seconds
+        self.max_tokens = max_tokens
+        self.similarity_threshold = similarity_threshold
+        self.escalate = escalate
+        self.max_escalations = max_escalations
+
+    def _over_budget(self, history: List[AttemptRecord], elapsed: float, tokens: int) -> Optional[str]:
+        if self.max_seconds is not None:
+            if elapsed >= self.max_seconds:
+                return f"time budget of {self.max_seconds:g}s spent"
+            durations = [r.duration for r in history if r.duration > 0]
+            if durations and elapsed + sum(durations) / len(durations) > self.max_seconds:
+                return f"another attempt would exceed the time budget of {self.max_seconds:g}s"
+        if self.max_tokens is not None:
+            if tokens >= self.max_tokens:
+                return f"token budget of {self.max_tokens} spent"
+            used = [r.tokens for r in history if r.tokens > 0]
+            if used and tokens + sum(used) / len(used) > self.max_tokens:
+                return f"another attempt would exceed the token budget of {self.max_tokens}"
+        return None
+
+    def _stalled(self, previous: AttemptRecord, last: AttemptRecord) -> Optional[str]:
+        if (similar(previous.output, last.output, self.similarity_threshold)
+                and (last.workspace_tree is None or last.workspace_tree == previous.workspace_tree)):
+            return "the Worker's output and workspace did not change"
+        if previous.source == last.source and similar(previous.feedback, last.feedback, self.similarity_threshold):
+            return "the same feedback came back again"
+        return None
+
+    def decide(self, history: List[AttemptRecord], attempts: int, elapsed: float, tokens: int) -> RetryDecision:
+        """
+        :param history: Failed attempts of this run, oldest first (empty right after a resume)
+        :param attempts: Attempts made so far, including those before a resume
+        :param elapsed: Seconds since the run's first attempt started
+        :param tokens: Tokens used since the run started
+        """
+        if attempts >= self.max_attempts:
+            return RetryDecision(STOP, f"{attempts} attempt(s) made")
+        reason = self._over_budget(history, elapsed, tokens)
+        if reason:
+            return RetryDecision(STOP, reason)
+        if len(history) >= 2:
+            reason = self._stalled(history[-2], history[-1])
+            if reason:
+                if not self.escalate or sum(r.escalated for r in history) >= self.max_escalations:
+                    return RetryDecision(STOP, f"not converging: {reason}")
+                return RetryDecision(ESCALATE, reason, ESCALATION_HINT.format(reason=reason))
+        return RetryDecision(RETRY)
@@ -0,0 +1,261 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+from copilot import CopilotClient
+
+logger = logging.getLogger(__name__)
+
+PoolKey = Tuple[Optional[str], Optional[str], Tuple[str, ...]]
+
+@dataclass
+class _PooledSession:
+    session: Any
+    key: PoolKey
+    config: Dict[str, Any]
+    uses: int = 0
+    last_used: float = field(default_factory=time.monotonic)
+
+class SessionPool:
+    """
+    Keeps Copilot sessions warm and leases them out per task, instead of
+    creating and destroying a session for every run.
+
+    Sessions are keyed by (model, system message, toolset). A session that has
+    served `max_uses` tasks is recycled: it is destroyed and a fresh replacement
+    is created in the background, so that `min_idle` spares per key are always
+    ready and the next lease doesn't pay the setup cost.
+
+    The defaults (`max_uses=1`, `min_idle=1`) trade one extra live session per
+    key for isolation: a session keeps the whole conversation of the task it
+    served, so reusing it would leak that history into the next task's context
+    (and grow its token usage). Raise `max_uses` only for agents whose sessions
+    carry no task state worth hiding; set `min_idle=0` to create sessions on
+    demand only.
+    """
+    def __init__(self, client: CopilotClient, max_size: int = 16, max_uses: int = 1, idle_timeout: float = 300.0, min_idle: int = 1):
+        """
+        Args:
+            client: The started CopilotClient used to create sessions.
+            max_size: Cap on sessions alive at once (idle + leased + being created).
+            max_uses: How many tasks a session may serve before it is recycled.
+            idle_timeout: Seconds an idle session may sit in the pool before it is evicted.
+            min_idle: Number of idle sessions to keep warm per key once that key has been seen
+                (0 to create sessions on demand only).
+        """
+        if max_size < 1:
+            raise ValueError("max_size must be >= 1")
+        self.client = client
+        self.max_size = max_size
+        self.max_uses = max(1, max_uses)
+        self.idle_timeout = idle_timeout
+        self.min_idle = min_idle
+
+        self._idle: Dict[PoolKey, List[_PooledSession]] = {}
+        self._leased: Dict[int, _PooledSession] = {}
+        self._total = 0
+        self._cond = asyncio.Condition()
+        self._background: Set[asyncio.Task] = set()
+        self._warming: Dict[PoolKey, int] = {}  # key -> spares being created in the background
+        self._closed = False
+
+    @staticmethod
+    def key_for(config: Dict[str, Any]) -> PoolKey:
+        tools = config.get("tools") or []
+        tool_names = tuple(sorted(getattr(t, "name", None) or repr(t) for t in tools))
+        return (config.get("model"), config.get("system_message"), tool_names)
+
+    @property
+    def size(self) -> int:
+        """Number of sessions currently alive (idle + leased + being created)."""
+        return self._total
+
+    def idle_count(self, config: Optional[Dict[str, Any]] = None) -> int:
+        if config is None:
+            return sum(len(v) for v in self._idle.values())
+        return len(self._idle.get(self.key_for(config), []))
+
+    async def warm(self, config: Dict[str, Any], count: int = 1) -> int:
+        """Pre-creates up to `count` idle sessions for `config`. Returns how many were created."""
+        key = self.key_for(config)
+        created = 0
+        for _ in range(count):
+            async with self._cond:
+                if self._closed or self._total >= self.max_size:
+                    break
+                self._total += 1
+            try:
+                session = await self.client.create_session(config)
+            except Exception:
+                await self._forget_slot()
+                raise
+            async with self._cond:
+                self._idle.setdefault(key, []).append(_PooledSession(session, key, config))
+                self._cond.notify_all()
+            created += 1
+        return created
+
+    async def acquire(self, config: Dict[str, Any]) -> Any:
+        """Leases a session matching `config`, creating one if no idle session is available."""
+        key = self.key_for(config)
+        to_destroy: List[_PooledSession] = []
+        entry: Optional[_PooledSession] = None
+
+        async with self._cond:
+            while True:
+                if self._closed:
+                    raise RuntimeError("SessionPool is closed")
+                expired = self._pop_expired_locked()
+                self._total -= len(expired)
+                to_destroy.extend(expired)
+                idle = self._idle.get(key)
+                if idle:
+                    entry = idle.pop()
+                    break
+                if self._total < self.max_size:
+                    self._total += 1
+                    break
+                # Pool is full: take over the slot of the least recently used idle session of another key
+                victim = self._pop_lru_idle_locked()
+                if victim:
+                    to_destroy.append(victim)
+                    break
+                await self._cond.wait()
+
+        for stale in to_destroy:
+            await self._destroy(stale.session)
+
+        if entry is None:
+            try:
+                session = await self.client.create_session(config)
+            except Exception:
+                await self._forget_slot()
+                raise
+            entry = _PooledSession(session, key, config)
+
+        self._leased[id(entry.session)] = entry
+        self._top_up(config)
+        return entry.session
+
+    async def release(self, session: Any, discard: bool = False):
+        """
+        Returns a leased session to the pool.
+        :param discard: Destroy the session instead of reusing it (e.g. after an error mid-turn)
+        """
+        entry = self._leased.pop(id(session), None)
+        if entry is None:
+            # Not ours (or already released): just clean it up
+            await self._destroy(session)
+            return
+
+        entry.uses += 1
+        entry.last_used = time.monotonic()
+        if not discard and not self._closed and entry.uses < self.max_uses:
+            async with self._cond:
+                self._idle.setdefault(entry.key, []).append(entry)
+                self._cond.notify_all()
+            return
+
+        await self._destroy(entry.session)
+        await self._forget_slot()
+        self._top_up(entry.config)
+
+    @asynccontextmanager
+    async def lease(self, config: Dict[str, Any]) -> AsyncIterator[Any]:
+        session = await self.acquire(config)
+        try:
+            yield session
+        except BaseException:
+            await self.release(session, discard=True)
+            raise
+        else:
+            await self.release(session)
+
+    async def evict_idle(self) -> int:
+        """Destroys idle sessions older than `idle_timeout`. Returns how many were evicted."""
+        async with self._cond:
+            expired = self._pop_expired_locked()
+            self._total -= len(expired)
+            self._cond.notify_all()
+        for entry in expired:
+            await self._destroy(entry.session)
+        return len(expired)
+
+    async def close(self):
+        """Destroys all idle sessions. Leased sessions are destroyed when they are released."""
+        self._closed = True
+        for task in list(self._background):
+            task.cancel()
+        await asyncio.gather(*self._background, return_exceptions=True)
+        async with self._cond:
+            idle = [e for entries in self._idle.values() for e in entries]
+            self._idle.clear()
+            self._total -= len(idle)
+            self._cond.notify_all()
+        for entry in idle:
+            await self._destroy(entry.session)
+
+    # --- Internals ---
+
+    def _pop_expired_locked(self) -> List[_PooledSession]:
+        if self.idle_timeout is None:
+            return []
+        deadline = time.monotonic() - self.idle_timeout
+        expired = []
+        for key in list(self._idle):
+            keep = []
+            for entry in self._idle[key]:
+                (expired if entry.last_used < deadline else keep).append(entry)
+            if keep:
+                self._idle[key] = keep
+            else:
+                del self._idle[key]
+        return expired
+
+    def _pop_lru_idle_locked(self) -> Optional[_PooledSession]:
+        candidates = [(e.last_used, key, i) for key, entries in self._idle.items() for i, e in enumerate(entries)]
+        if not candidates:
+            return None
+        _, key, i = min(candidates, key=lambda c: c[0])
+        entry = self._idle[key].pop(i)
+        if not self._idle[key]:
+            del self._idle[key]
+        return entry
+
+    async def _forget_slot(self, count: int = 1):
+        async with self._cond:
+            self._total -= count
+            self._cond.notify_all()
+
+    async def _destroy(self, session: Any):
+        try:
+            await session.destroy()
+        except Exception as e:
+            logger.warning("Failed to destroy session: %s", e)
+
+    def _top_up(self, config: Dict[str, Any]):
+        """Starts creating spares in the background until `config`'s key has `min_idle` idle sessions."""
+        if self._closed or self.min_idle < 1:
+            return
+        key = self.key_for(config)
+        missing = self.min_idle - len(self._idle.get(key, [])) - self._warming.get(key, 0)
+        if missing > 0:
+            self._warming[key] = self._warming.get(key, 0) + missing
+            self._spawn(self._warm_spares(config, key, missing))
+
+    async def _warm_spares(self, config: Dict[str, Any], key: PoolKey, count: int):
+        try:
+            await self.warm(config, count)
+        except Exception as e:
+            logger.warning("Failed to warm a session: %s", e)
+        finally:
+            self._warming[key] -= count
+            if self._warming[key] <= 0:
+                del self._warming[key]
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
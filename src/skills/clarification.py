@@ -1,6 +1,6 @@
 from typing import Callable, Awaitable, Optional
 from pydantic import BaseModel, Field
-from copilot.tools import define_tool
+from src.skills.tooling import skill_tool
 
 # Pydantic Models
 class AskUserParams(BaseModel):
@@ -23,7 +23,7 @@ class ClarificationSkill:
         self._ask_user = ask_user_callback
         self._on_ready = on_ready_callback
 
-    @define_tool(description="Ask the user a specific question to clarify requirements.")
+    @skill_tool(description="Ask the user a specific question to clarify requirements.")
     async def ask_user(self, params: AskUserParams) -> str:
         """
         Asks the user a question and waits for their response.
@@ -32,7 +32,8 @@ class ClarificationSkill:
         response = await self._ask_user(params.question)
         return response
 
-    @define_tool(description="Call this when the user's requirements are fully clarified and clear.")
+    # Runs on the event loop: the callback sets the task's asyncio.Event
+    @skill_tool(description="Call this when the user's requirements are fully clarified and clear.", offload=False)
     def finalize_requirements(self, params: FinalizeReqParams) -> str:
         """
         Signals that the clarification phase is complete.
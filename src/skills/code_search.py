@@ -0,0 +1,422 @@
+import os
+import re
+import json
+import time
+import stat
+import sqlite3
+import hashlib
+import threading
+import subprocess
+from collections import OrderedDict
+from typing import Dict, List, Literal, Optional, Set, Tuple
+from pydantic import BaseModel, Field
+from src.skills.tooling import skill_tool
+from src.skills.ignore import DEFAULT_EXCLUDES, IgnoreRules, walk
+
+# --- Parameter Models ---
+
+class SearchCodeParams(BaseModel):
+    path: str = Field(..., description="Absolute path to the repository / workspace root to search.")
+    query: str = Field(..., description="A regular expression, a literal string, or an identifier (see `mode`).")
+    mode: Literal["regex", "literal", "symbol"] = Field("regex", description="'regex' or 'literal' search file contents; 'symbol' finds where an identifier is defined.")
+    case_sensitive: bool = Field(True, description="Whether the match is case sensitive.")
+    max_results: int = Field(50, description="Maximum number of hits to return.")
+
+MAX_INDEXED_FILE_BYTES = 1024 * 1024
+INDEX_VERSION = 2
+# Searches within this many seconds of a refresh reuse it (e.g. a burst of parallel searches)
+REFRESH_INTERVAL = 1.0
+# Indexes kept in memory at once
+MAX_OPEN_INDEXES = 8
+
+_DEFAULT_RULES = IgnoreRules(DEFAULT_EXCLUDES)
+
+def _default_excluded(rel: str) -> bool:
+    """Whether `walk` would skip `rel` because of DEFAULT_EXCLUDES (checked on every path component)."""
+    parts = rel.split("/")
+    return any(_DEFAULT_RULES.match("/".join(parts[:i + 1]), i < len(parts) - 1) for i in range(len(parts)))
+
+# Language-agnostic definition patterns: (kind, regex with the name in group 1)
+SYMBOL_PATTERNS = [
+    ("function", re.compile(r"^\s*(?:async\s+)?def\s+([A-Za-z_]\w*)")),
+    ("class", re.compile(r"^\s*(?:export\s+)?(?:default\s+)?(?:abstract\s+)?(?:public\s+|private\s+|internal\s+)?(?:static\s+)?(?:class|interface|struct|enum|trait|record)\s+([A-Za-z_]\w*)")),
+    ("function", re.compile(r"^\s*(?:export\s+)?(?:default\s+)?(?:async\s+)?function\s*\*?\s*([A-Za-z_$][\w$]*)")),
+    ("function", re.compile(r"^\s*(?:pub(?:\([^)]*\))?\s+)?(?:async\s+)?fn\s+([A-Za-z_]\w*)")),
+    ("function", re.compile(r"^func\s+(?:\([^)]*\)\s*)?([A-Za-z_]\w*)")),
+    ("type", re.compile(r"^type\s+([A-Za-z_]\w*)")),
+    ("variable", re.compile(r"^\s*(?:export\s+)?(?:const|let|var)\s+([A-Za-z_$][\w$]*)\s*=")),
+    ("constant", re.compile(r"^([A-Z_][A-Z0-9_]*)\s*(?::[^=]*)?=")),
+]
+
+def _extract_symbols(text: str) -> List[Tuple[str, int, str]]:
+    symbols = []
+    for lineno, line in enumerate(text.splitlines(), 1):
+        for kind, pattern in SYMBOL_PATTERNS:
+            m = pattern.match(line)
+            if m:
+                symbols.append((m.group(1), lineno, kind))
+                break
+    return symbols
+
+def _trigrams(text: str) -> Set[str]:
+    text = text.lower()
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+def _required_literals(pattern: str) -> List[str]:
+    """
+    Literal runs that every match of `pattern` must contain. Conservative: when
+    unsure (alternation, lookarounds, ...) returns nothing, which means "scan all files".
+    """
+    if "|" in pattern or re.search(r"\(\?(?!:)", pattern):
+        return []
+    runs: List[str] = []
+    cur = ""
+    depth = 0
+    i = 0
+    while i < len(pattern):
+        ch = pattern[i]
+        if ch == "\\":
+            nxt = pattern[i + 1] if i + 1 < len(pattern) else ""
+            if nxt and not nxt.isalnum() and depth == 0:
+                cur += nxt
+            else:
+                runs.append(cur)
+                cur = ""
+            i += 2
+            continue
+        if ch in "*?{":
+            # Quantifier makes the previous character optional
+            runs.append(cur[:-1])
+            cur = ""
+            if ch == "{":
+                close = pattern.find("}", i)
+                i = len(pattern) if close == -1 else close
+            i += 1
+            continue
+        if ch == "[":
+            runs.append(cur)
+            cur = ""
+            close = pattern.find("]", i + 2)
+            i = len(pattern) if close == -1 else close + 1
+            continue
+        if ch in "()":
+            # Text inside groups may be optional or repeated; only trust top-level literals
+            runs.append(cur)
+            cur = ""
+            depth += 1 if ch == "(" else -1
+            i += 1
+            continue
+        if ch in ".^$+" or depth > 0:
+            runs.append(cur)
+            cur = ""
+            i += 1
+            continue
+        cur += ch
+        i += 1
+    runs.append(cur)
+    return [r for r in runs if len(r) >= 3]
+
+class _WorkspaceIndex:
+    """
+    Trigram + symbol index of one workspace, refreshed incrementally from file mtimes and
+    persisted row by row (SQLite), so a refresh only writes the files that changed.
+
+    Refreshes are cheap in a git workspace: while HEAD stays the same, only the paths `git status`
+    reports as changed (now or at the previous refresh) are stat'ed instead of the whole tree.
+    Searches within `REFRESH_INTERVAL` seconds of a refresh reuse it.
+    """
+
+    def __init__(self, root: str, index_path: str):
+        self.root = root
+        self.index_path = index_path
+        # relpath -> (mtime_ns, size, trigrams, symbols)
+        self.files: Dict[str, Tuple[int, int, Set[str], List[Tuple[str, int, str]]]] = {}
+        self.postings: Dict[str, Set[str]] = {}
+        self.symbols: Dict[str, List[Tuple[str, int, str]]] = {}
+        self.lock = threading.Lock()
+        self.head: Optional[str] = None  # HEAD the indexed files were last checked against (git workspaces)
+        self.dirty: Set[str] = set()     # Paths `git status` reported at the last refresh
+        self.refreshed_at: Optional[float] = None
+        self._conn: Optional[sqlite3.Connection] = None
+        self._load()
+
+    def _load(self):
+        try:
+            os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+            self._conn = sqlite3.connect(self.index_path, check_same_thread=False)
+            with self._conn:
+                self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS files ("
+                    "rel TEXT PRIMARY KEY, mtime INTEGER NOT NULL, size INTEGER NOT NULL, grams TEXT NOT NULL, symbols TEXT NOT NULL)"
+                )
+                meta = dict(self._conn.execute("SELECT key, value FROM meta"))
+                if meta.get("version") != str(INDEX_VERSION) or meta.get("root") != self.root:
+                    self._conn.execute("DELETE FROM files")
+                    self._conn.execute("DELETE FROM meta")
+                    self._conn.executemany("INSERT INTO meta (key, value) VALUES (?, ?)",
+                                           [("version", str(INDEX_VERSION)), ("root", self.root)])
+                    return
+                rows = self._conn.execute("SELECT rel, mtime, size, grams, symbols FROM files").fetchall()
+        except (OSError, sqlite3.Error):
+            # Unusable index file: index in memory only
+            self.close()
+            return
+        for rel, mtime, size, grams, symbols in rows:
+            self._add(rel, mtime, size, {grams[i:i + 3] for i in range(0, len(grams), 3)}, [tuple(s) for s in json.loads(symbols)])
+        self.head = meta.get("head") or None
+        self.dirty = set(json.loads(meta.get("dirty", "[]")))
+
+    def _save(self, changed: List[str]):
+        if self._conn is None:
+            return
+        rows = []
+        for rel in changed:
+            if rel in self.files:
+                mtime, size, grams, symbols = self.files[rel]
+                rows.append((rel, mtime, size, "".join(sorted(grams)), json.dumps(symbols)))
+        try:
+            with self._conn:
+                self._conn.executemany("DELETE FROM files WHERE rel = ?", [(rel,) for rel in changed if rel not in self.files])
+                self._conn.executemany("INSERT OR REPLACE INTO files (rel, mtime, size, grams, symbols) VALUES (?, ?, ?, ?, ?)", rows)
+                self._conn.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                                       [("head", self.head or ""), ("dirty", json.dumps(sorted(self.dirty)))])
+        except sqlite3.Error:
+            pass
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _add(self, rel: str, mtime: int, size: int, grams: Set[str], symbols: List[Tuple[str, int, str]]):
+        self.files[rel] = (mtime, size, grams, symbols)
+        for g in grams:
+            self.postings.setdefault(g, set()).add(rel)
+        for name, line, kind in symbols:
+            self.symbols.setdefault(name, []).append((rel, line, kind))
+
+    def _remove(self, rel: str):
+        _, _, grams, symbols = self.files.pop(rel)
+        for g in grams:
+            files = self.postings.get(g)
+            if files:
+                files.discard(rel)
+                if not files:
+                    del self.postings[g]
+        for name, _, _ in symbols:
+            remaining = [s for s in self.symbols.get(name, []) if s[0] != rel]
+            if remaining:
+                self.symbols[name] = remaining
+            else:
+                self.symbols.pop(name, None)
+
+    def _walk(self) -> Dict[str, Tuple[int, int]]:
+        found: Dict[str, Tuple[int, int]] = {}
+        # Same rules as list_directory: .gitignore plus the default excludes (.git, node_modules, ...)
+        for rel, is_dir, _ in walk(self.root):
+            if is_dir:
+                continue
+            try:
+                st = os.stat(os.path.join(self.root, rel))
+            except OSError:
+                continue
+            if st.st_size <= MAX_INDEXED_FILE_BYTES:
+                found[rel] = (st.st_mtime_ns, st.st_size)
+        return found
+
+    def _stat_paths(self, paths: Set[str]) -> Dict[str, Tuple[int, int]]:
+        """`_walk` restricted to `paths`."""
+        found: Dict[str, Tuple[int, int]] = {}
+        for rel in paths:
+            try:
+                st = os.stat(os.path.join(self.root, rel))
+            except OSError:
+                continue
+            if stat.S_ISREG(st.st_mode) and st.st_size <= MAX_INDEXED_FILE_BYTES:
+                found[rel] = (st.st_mtime_ns, st.st_size)
+        return found
+
+    def _git_status(self) -> Optional[Tuple[str, Set[str]]]:
+        """(HEAD, paths that differ from it) if the root is a git work tree, else None."""
+        if not os.path.exists(os.path.join(self.root, ".git")):
+            return None
+        try:
+            head = subprocess.run(["git", "-C", self.root, "rev-parse", "HEAD"], capture_output=True, text=True, timeout=30)
+            status = subprocess.run(["git", "-C", self.root, "status", "--porcelain", "-z", "--untracked-files=all", "--no-renames"],
+                                    capture_output=True, timeout=60)
+        except (OSError, subprocess.SubprocessError):
+            return None
+        if head.returncode != 0 or status.returncode != 0:
+            return None
+        # Entries are "XY path"; directories (e.g. submodules) end with a slash
+        dirty = {entry[3:].rstrip("/") for entry in status.stdout.decode("utf-8", errors="surrogateescape").split("\0") if len(entry) > 3}
+        return head.stdout.strip(), {rel for rel in dirty if not _default_excluded(rel)}
+
+    def read_text(self, rel: str) -> Optional[str]:
+        try:
+            with open(os.path.join(self.root, rel), "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        if b"\0" in data[:8192]:
+            return None
+        return data.decode("utf-8", errors="replace")
+
+    def refresh(self, force: bool = False) -> int:
+        """
+        Re-indexes new/changed files and drops deleted ones. Returns the number of files updated.
+        :param force: Refresh even within `REFRESH_INTERVAL` of the last refresh
+        """
+        now = time.monotonic()
+        if not force and self.refreshed_at is not None and now - self.refreshed_at < REFRESH_INTERVAL:
+            return 0
+        status = self._git_status()
+        if status is not None and self.head is not None and status[0] == self.head:
+            # Same commit: a file can only have changed if it is dirty now or was at the last refresh
+            suspects = status[1] | self.dirty
+            current = self._stat_paths(suspects)
+            gone = [r for r in suspects if r in self.files and r not in current]
+        else:
+            current = self._walk()
+            gone = [r for r in self.files if r not in current]
+        head, dirty = status if status is not None else (None, set())
+
+        changed = []
+        for rel in gone:
+            self._remove(rel)
+            changed.append(rel)
+        for rel, (mtime, size) in current.items():
+            known = self.files.get(rel)
+            if known and known[0] == mtime and known[1] == size:
+                continue
+            if known:
+                self._remove(rel)
+            text = self.read_text(rel)
+            if text is None:
+                # Binary: remember it so we don't re-read it every refresh
+                self._add(rel, mtime, size, set(), [])
+            else:
+                self._add(rel, mtime, size, _trigrams(text), _extract_symbols(text))
+            changed.append(rel)
+        if changed or head != self.head or dirty != self.dirty:
+            self.head, self.dirty = head, dirty
+            self._save(changed)
+        self.refreshed_at = time.monotonic()
+        return len(changed)
+
+    def candidates(self, literals: List[str]) -> List[str]:
+        if not literals:
+            return sorted(f for f, entry in self.files.items() if entry[2])
+        result: Optional[Set[str]] = None
+        for literal in literals:
+            for g in _trigrams(literal):
+                files = self.postings.get(g, set())
+                result = set(files) if result is None else result & files
+                if not result:
+                    return []
+        return sorted(result or [])
+
+# Indexes are shared by every CodeSearchSkill instance in the process; the least recently
+# used ones are closed (they stay on disk) beyond MAX_OPEN_INDEXES
+_indexes: "OrderedDict[str, _WorkspaceIndex]" = OrderedDict()
+_indexes_guard = threading.Lock()
+
+def _close_index(index: _WorkspaceIndex):
+    with index.lock:
+        index.close()
+
+def drop_index(root: str):
+    """Forgets the index of a workspace that no longer exists and deletes its file."""
+    root = os.path.abspath(root)
+    with _indexes_guard:
+        index = _indexes.pop(root, None)
+    if index is not None:
+        _close_index(index)
+        for suffix in ("", "-wal", "-shm", "-journal"):
+            try:
+                os.unlink(index.index_path + suffix)
+            except OSError:
+                pass
+
+class CodeSearchSkill:
+    """
+    Searches a workspace through a persistent trigram + symbol index, so the agent
+    can locate code in one call instead of walking it with list_directory/read_file.
+    """
+    def __init__(self, workspace_root: str = "workspaces"):
+        self.workspace_root = os.path.abspath(workspace_root)
+        self.index_root = os.path.join(self.workspace_root, ".index")
+
+    def _index_for(self, root: str) -> _WorkspaceIndex:
+        evicted = []
+        with _indexes_guard:
+            index = _indexes.get(root)
+            if index is None:
+                key = hashlib.sha1(root.encode("utf-8")).hexdigest()[:12]
+                index_path = os.path.join(self.index_root, f"{os.path.basename(root)}-{key}.sqlite")
+                index = _indexes[root] = _WorkspaceIndex(root, index_path)
+            _indexes.move_to_end(root)
+            while len(_indexes) > MAX_OPEN_INDEXES:
+                evicted.append(_indexes.popitem(last=False)[1])
+        # Outside the guard: closing waits for searches still running on the evicted index
+        for old in evicted:
+            _close_index(old)
+        return index
+
+    @skill_tool(description=(
+        "Search code in a repository and get `file:line: text` hits. Use mode='regex' (default) or "
+        "'literal' to search contents, or mode='symbol' to find where a function/class/variable is defined."
+    ), timeout=120, max_concurrency=4)
+    def search_code(self, params: SearchCodeParams) -> str:
+        try:
+            root = os.path.abspath(params.path)
+            if not os.path.isdir(root):
+                return f"Error: Path '{root}' is not a directory."
+
+            started = time.perf_counter()
+            index = self._index_for(root)
+            with index.lock:
+                index.refresh()
+                hits: List[str] = []
+                truncated = False
+
+                if params.mode == "symbol":
+                    matches = index.symbols.get(params.query, [])
+                    if not matches and not params.case_sensitive:
+                        wanted = params.query.lower()
+                        matches = [s for name, defs in index.symbols.items() if name.lower() == wanted for s in defs]
+                    for rel, line, kind in sorted(matches):
+                        if len(hits) >= params.max_results:
+                            truncated = True
+                            break
+                        hits.append(f"{rel}:{line}: [{kind}] {params.query}")
+                else:
+                    pattern = re.escape(params.query) if params.mode == "literal" else params.query
+                    try:
+                        regex = re.compile(pattern, 0 if params.case_sensitive else re.IGNORECASE)
+                    except re.error as e:
+                        return f"Error: Invalid regex: {e}"
+                    for rel in index.candidates(_required_literals(pattern)):
+                        text = index.read_text(rel)
+                        if text is None:
+                            continue
+                        for lineno, line in enumerate(text.splitlines(), 1):
+                            if regex.search(line):
+                                if len(hits) >= params.max_results:
+                                    truncated = True
+                                    break
+                                hits.append(f"{rel}:{lineno}: {line.strip()[:200]}")
+                        if truncated:
+                            break
+
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            if not hits:
+                return f"No matches for '{params.query}' in {root} ({elapsed_ms:.0f} ms)."
+            footer = f"\n[{len(hits)} hits{', truncated' if truncated else ''} in {elapsed_ms:.0f} ms; paths relative to {root}]"
+            return "\n".join(hits) + footer
+        except Exception as e:
+            return f"Error searching code: {e}"
+
+    def get_tools(self):
+        return [self.search_code]
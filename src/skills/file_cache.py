@@ -0,0 +1,75 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, Optional, Tuple
+
+Signature = Tuple[int, int, int]
+
+def stat_signature(st: os.stat_result) -> Signature:
+    """(mtime, size, inode): changes whenever the file is rewritten or replaced."""
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+class FileContentCache:
+    """
+    Process-wide LRU cache for file contents and directory listings.
+
+    Entries are stored with the (mtime, size, inode) signature of the path at
+    the time they were read; a lookup with a different signature is a miss and
+    drops the stale entry. The total size of cached values is bounded by
+    `max_bytes`, evicting least recently used entries first.
+    """
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Hashable, Tuple[Signature, Any, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+    def get(self, key: Hashable, signature: Signature) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[0] != signature:
+                self._pop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, signature: Signature, value: Any, nbytes: int):
+        with self._lock:
+            if key in self._entries:
+                self._pop(key)
+            if nbytes > self.max_bytes:
+                # Would evict everything else and still not fit
+                return
+            self._entries[key] = (signature, value, nbytes)
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._pop(oldest)
+
+    def invalidate(self, key: Hashable):
+        with self._lock:
+            if key in self._entries:
+                self._pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _pop(self, key: Hashable):
+        _, _, nbytes = self._entries.pop(key)
+        self._bytes -= nbytes
+
+# Shared by every FileSystemSkill instance (Clarifier, Worker, ...) unless one is given its own
+shared_file_cache = FileContentCache()
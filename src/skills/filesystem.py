@@ -1,73 +1,448 @@
 import os
 import glob
+import asyncio
+import shutil
+import mmap
+import codecs
+import hashlib
+import itertools
+import tempfile
 from typing import List, Optional
 from pydantic import BaseModel, Field
-from copilot.tools import define_tool
+from src.skills.tooling import io_executor, skill_tool
+from src.skills.file_cache import FileContentCache, shared_file_cache, stat_signature
+from src.skills.ignore import walk
+from src.skills.patch import PatchError, apply_replacements, apply_unified_diff
 
 # --- Parameter Models ---
 
 class ListDirParams(BaseModel):
     path: str = Field(..., description="Absolute path or relative path to the workspace root to list.")
+    recursive: bool = Field(False, description="List the whole tree below `path` (up to `max_depth`) instead of one level.")
+    max_depth: int = Field(3, description="Maximum depth for recursive listings (1 = direct children only).")
+    respect_gitignore: bool = Field(True, description="Skip files and directories ignored by .gitignore files.")
+    exclude: Optional[List[str]] = Field(None, description="Gitignore-style patterns to skip. Defaults to .git, node_modules, __pycache__, virtualenvs; pass [] to show everything.")
+    include_sizes: bool = Field(False, description="Include file sizes in bytes.")
+    cursor: Optional[str] = Field(None, description="Pagination cursor returned by a previous call to continue the listing.")
+    page_size: int = Field(500, description="Maximum number of entries per page.")
 
 class ReadFileParams(BaseModel):
     path: str = Field(..., description="Absolute path to the file to read.")
+    offset: Optional[int] = Field(None, description="Optional byte offset to start reading from.")
+    length: Optional[int] = Field(None, description="Optional number of bytes to read from `offset`.")
+    start_line: Optional[int] = Field(None, description="Optional first line to read (1-based). Takes precedence over offset/length.")
+    end_line: Optional[int] = Field(None, description="Optional last line to read (inclusive).")
+    max_bytes: Optional[int] = Field(None, description="Optional cap on returned bytes (cannot exceed the server-side limit).")
+    with_hash: bool = Field(False, description="Also return the sha256 of the whole file, for use as `expected_sha256` in apply_edit.")
+
+class ReadFilesParams(BaseModel):
+    paths: List[str] = Field(..., description="Files to read: absolute paths or glob patterns (e.g. '/repo/src/**/*.py'), read in the given order.")
+    base_dir: Optional[str] = Field(None, description="Optional directory that relative paths and patterns are resolved against.")
+    max_total_bytes: int = Field(200000, description="Byte budget for the whole response; files past it are listed but not read.")
+    max_bytes_per_file: int = Field(50000, description="Cap per file; longer files are truncated with a marker saying where to continue.")
+    max_files: int = Field(50, description="Maximum number of files to read.")
 
 class WriteFileParams(BaseModel):
     path: str = Field(..., description="Absolute path to the file to write.")
     content: str = Field(..., description="The content to write to the file.")
 
+class SearchReplace(BaseModel):
+    search: str = Field(..., description="Exact text to find (must be unique in the file unless replace_all is set).")
+    replace: str = Field(..., description="Text to replace it with.")
+    replace_all: bool = Field(False, description="Replace every occurrence instead of requiring a unique match.")
+
+class FileEdit(BaseModel):
+    path: str = Field(..., description="Absolute path to the file to edit (created if it doesn't exist and the edit is a diff against /dev/null).")
+    diff: Optional[str] = Field(None, description="Unified diff hunks (@@ -a,b +c,d @@ ...) to apply to this file.")
+    replacements: Optional[List[SearchReplace]] = Field(None, description="Search/replace edits, applied in order.")
+    expected_sha256: Optional[str] = Field(None, description="Optional sha256 of the current file (from read_file with_hash); the edit is rejected if the file changed.")
+
+class ApplyEditParams(BaseModel):
+    edits: List[FileEdit] = Field(..., description="Edits to apply. Either all of them are applied or none is.")
+
 class FileSystemSkill:
     """
     Provides standard file system operations.
     """
-    def __init__(self, workspace_root: str = "workspaces"):
+    # Hard cap on how much of a file a single read_file call returns
+    MAX_READ_BYTES = 256 * 1024
+    # Files at least this large are read through mmap so only the requested range is paged in
+    MMAP_THRESHOLD = 4 * 1024 * 1024
+    # Prefix inspected to decide whether a file is binary
+    SNIFF_BYTES = 8192
+    # Hard caps for a single read_files call
+    MAX_BATCH_BYTES = 1024 * 1024
+    MAX_BATCH_FILES = 200
+    # Files of one read_files call read at the same time
+    BATCH_READ_CONCURRENCY = 8
+
+    def __init__(self, workspace_root: str = "workspaces", cache: Optional[FileContentCache] = None):
         # We can enforce a jail here if we want, but for this demo let's stay flexible
         self.workspace_root = os.path.abspath(workspace_root)
+        # Process-wide by default, so every agent's skill instance shares what has already been read
+        self.cache = cache if cache is not None else shared_file_cache
 
-    @define_tool(description="List files and directories in a given path.")
+    @skill_tool(description=(
+        "List files and directories in a given path. Set recursive=true for a tree listing (respects .gitignore); "
+        "long listings are paginated with a cursor."
+    ), timeout=60, max_concurrency=4)
     def list_directory(self, params: ListDirParams) -> str:
         try:
             target_path = os.path.abspath(params.path)
             if not os.path.exists(target_path):
                 return f"Error: Path '{target_path}' does not exist."
-            
-            items = os.listdir(target_path)
-            # Add type info (File/Dir)
+            if not os.path.isdir(target_path):
+                return f"Error: Path '{target_path}' is not a directory."
+
+            offset = int(params.cursor) if params.cursor else 0
+            page_size = max(1, params.page_size)
+            max_depth = max(1, params.max_depth) if params.recursive else 1
+
+            # Directory scans are cached per directory (see ignore.scan_dir), so repeated listings cost one stat per directory
+            entries = walk(target_path, max_depth=max_depth, respect_gitignore=params.respect_gitignore, exclude=params.exclude, cache=self.cache)
+            # Fetch one extra entry to know whether there is another page
+            page = list(itertools.islice(entries, offset, offset + page_size + 1))
+            has_more = len(page) > page_size
+            page = page[:page_size]
+
             result = []
-            for item in items:
-                full_path = os.path.join(target_path, item)
-                type_str = "DIR" if os.path.isdir(full_path) else "FILE"
-                result.append(f"[{type_str}] {item}")
-            
+            for rel, is_dir, _ in page:
+                # Add type info (File/Dir)
+                line = f"[{'DIR' if is_dir else 'FILE'}] {rel}"
+                if params.include_sizes and not is_dir:
+                    try:
+                        line += f" ({os.stat(os.path.join(target_path, rel)).st_size} bytes)"
+                    except OSError:
+                        pass
+                result.append(line)
+
+            if has_more:
+                result.append(f"[list_directory: entries {offset}-{offset + len(page) - 1} shown; more available, pass cursor=\"{offset + len(page)}\"]")
             return "\n".join(result)
         except Exception as e:
             return f"Error listing directory: {e}"
 
-    @define_tool(description="Read the text content of a file.")
+    @staticmethod
+    def _looks_binary(prefix: bytes) -> bool:
+        if b"\0" in prefix:
+            return True
+        try:
+            # final=False: a multi-byte character cut off at the end of the prefix is fine
+            codecs.getincrementaldecoder("utf-8")().decode(prefix, final=False)
+        except UnicodeDecodeError:
+            return True
+        return False
+
+    @staticmethod
+    def _char_boundary(buf, pos: int, size: int) -> int:
+        # Move forward past UTF-8 continuation bytes so we never split a character
+        while pos < size and (buf[pos] & 0xC0) == 0x80:
+            pos += 1
+        return pos
+
+    def _select_range(self, buf, size: int, params: ReadFileParams, cap: int):
+        """Returns (start, end, first_line): the byte range of `buf` to return and its first line number."""
+        first_line = None
+        if params.start_line is not None or params.end_line is not None:
+            first_line = max(1, params.start_line or 1)
+            start = 0
+            for _ in range(first_line - 1):
+                nl = buf.find(b"\n", start)
+                if nl == -1:
+                    start = size
+                    break
+                start = nl + 1
+            end = start
+            line = first_line - 1
+            while end < size and end - start < cap and (params.end_line is None or line < params.end_line):
+                nl = buf.find(b"\n", end)
+                end = size if nl == -1 else nl + 1
+                line += 1
+        else:
+            start = min(max(0, params.offset or 0), size)
+            end = size if params.length is None else min(size, start + max(0, params.length))
+
+        start = self._char_boundary(buf, start, size)
+        end = max(start, min(end, start + cap))
+        if end < size:
+            # Back off to the start of a character when the cap lands inside one
+            while end > start and (buf[end] & 0xC0) == 0x80:
+                end -= 1
+        return start, end, first_line
+
+    @skill_tool(description=(
+        "Read the text content of a file. Large files are returned in chunks: use offset/length "
+        "or start_line/end_line to read a specific range; truncated results say where to continue."
+    ), timeout=60)
     def read_file(self, params: ReadFileParams) -> str:
+        return self._read(params)
+
+    def _read(self, params: ReadFileParams) -> str:
         try:
             target_path = os.path.abspath(params.path)
             if not os.path.exists(target_path):
                 return f"Error: File '{target_path}' does not exist."
-            
-            with open(target_path, 'r', encoding='utf-8') as f:
-                return f.read()
+
+            cap = self.MAX_READ_BYTES
+            if params.max_bytes is not None:
+                cap = max(1, min(cap, params.max_bytes))
+
+            st = os.stat(target_path)
+            size = st.st_size
+            if size >= self.MMAP_THRESHOLD:
+                # Too big to cache: page in only the requested range
+                with open(target_path, 'rb') as f:
+                    if self._looks_binary(f.read(self.SNIFF_BYTES)):
+                        return "Error: File is binary or not UTF-8 encoded."
+                    if size == 0:
+                        return ""
+                    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                        start, end, first_line = self._select_range(buf, size, params, cap)
+                        data = buf[start:end]
+                text = data.decode('utf-8')
+            else:
+                # Cached as [bytes, decoded text of the whole file (filled on first full read)]
+                signature = stat_signature(st)
+                entry = self.cache.get(("file", target_path), signature)
+                if entry is None:
+                    with open(target_path, 'rb') as f:
+                        entry = [f.read(), None]
+                    self.cache.put(("file", target_path), signature, entry, 2 * len(entry[0]))
+                buf = entry[0]
+                size = len(buf)
+                if self._looks_binary(buf[:self.SNIFF_BYTES]):
+                    return "Error: File is binary or not UTF-8 encoded."
+                if size == 0:
+                    return ""
+
+                start, end, first_line = self._select_range(buf, size, params, cap)
+                data = buf[start:end]
+                if start == 0 and end == size:
+                    if entry[1] is None:
+                        entry[1] = data.decode('utf-8')
+                    text = entry[1]
+                else:
+                    text = data.decode('utf-8')
+
+            full = start == 0 and end == size
+            if full and not params.with_hash:
+                return text
+
+            meta = f"sha256={self._file_sha256(target_path)}" if params.with_hash else ""
+            if full:
+                return f"{text}\n\n[read_file: {meta}]"
+
+            # Partial read: tell the agent what it got and how to continue
+            meta = f"bytes {start}-{end} of {size}" + (f", {meta}" if meta else "")
+            next_line = None
+            if first_line is not None:
+                complete_lines = data.count(b"\n")
+                # A trailing partial line still counts as shown
+                last_line = first_line + complete_lines - (1 if data.endswith(b"\n") else 0)
+                next_line = first_line + complete_lines
+                meta += f", lines {first_line}-{last_line}"
+            if end - start >= cap:
+                meta += f", truncated at max_bytes={cap}"
+            if end < size:
+                meta += f". Continue with offset={end}" + (f" or start_line={next_line}" if next_line is not None else "")
+            return f"{text}\n\n[read_file: {meta}]"
         except UnicodeDecodeError:
             return "Error: File is binary or not UTF-8 encoded."
         except Exception as e:
             return f"Error reading file: {e}"
 
-    @define_tool(description="Write text content to a file (overwrites existing).")
+    def _expand(self, params: ReadFilesParams) -> List[str]:
+        """Resolves paths and glob patterns to a de-duplicated list of paths, in request order."""
+        seen = set()
+        paths = []
+        for pattern in params.paths:
+            if params.base_dir and not os.path.isabs(pattern):
+                pattern = os.path.join(params.base_dir, pattern)
+            if glob.has_magic(pattern):
+                matches = sorted(
+                    m for m in glob.glob(pattern, recursive=True)
+                    if os.path.isfile(m) and ".git" not in m.split(os.sep)
+                )
+            else:
+                matches = [pattern]  # Missing files are reported per file
+            for m in matches:
+                m = os.path.abspath(m)
+                if m not in seen:
+                    seen.add(m)
+                    paths.append(m)
+        return paths
+
+    def _plan_batch(self, params: ReadFilesParams):
+        """Returns ([(path, byte cap)], skipped paths): the budget is spent on files in request order."""
+        paths = self._expand(params)
+        budget = max(0, min(params.max_total_bytes, self.MAX_BATCH_BYTES))
+        per_file = max(1, min(params.max_bytes_per_file, self.MAX_READ_BYTES))
+        limit = max(1, min(params.max_files, self.MAX_BATCH_FILES))
+        planned, skipped = [], []
+        for path in paths:
+            if len(planned) >= limit or budget <= 0:
+                skipped.append(path)
+                continue
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                size = 0  # Read anyway so the error is reported for this file
+            cap = min(per_file, budget)
+            planned.append((path, cap))
+            budget -= min(size, cap)
+        return planned, skipped
+
+    @skill_tool(description=(
+        "Read several files in one call: pass paths and/or glob patterns (e.g. 'src/**/*.py' with base_dir). "
+        "Files are returned in order, each under a '=== path ===' header, within a total byte budget; "
+        "truncated files end with a marker saying how to continue with read_file."
+    ), timeout=120, max_concurrency=4)
+    async def read_files(self, params: ReadFilesParams) -> str:
+        loop = asyncio.get_running_loop()
+        try:
+            planned, skipped = await loop.run_in_executor(io_executor(), self._plan_batch, params)
+        except Exception as e:
+            return f"Error resolving paths: {e}"
+        if not planned:
+            return "Error: No files matched."
+
+        semaphore = asyncio.Semaphore(self.BATCH_READ_CONCURRENCY)
+
+        async def read_one(path: str, cap: int) -> str:
+            async with semaphore:
+                return await loop.run_in_executor(io_executor(), self._read, ReadFileParams(path=path, max_bytes=cap))
+
+        contents = await asyncio.gather(*(read_one(path, cap) for path, cap in planned))
+        sections = []
+        total = 0
+        for (path, _), text in zip(planned, contents):
+            total += len(text.encode("utf-8"))
+            sections.append(f"=== {path} ===\n{text}")
+        summary = f"[read_files: {len(planned)} file(s), {total} bytes"
+        if skipped:
+            shown = ", ".join(skipped[:20]) + (f", ... ({len(skipped) - 20} more)" if len(skipped) > 20 else "")
+            summary += f"; {len(skipped)} not read (file or byte budget exhausted): {shown}"
+        sections.append(summary + "]")
+        return "\n\n".join(sections)
+
+    def _file_sha256(self, target_path: str) -> str:
+        entry = self.cache.get(("file", target_path), stat_signature(os.stat(target_path)))
+        if entry is not None:
+            return hashlib.sha256(entry[0]).hexdigest()
+        digest = hashlib.sha256()
+        with open(target_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def _atomic_write(self, target_path: str, data: bytes, text: Optional[str] = None):
+        """
+        Writes via a temp file in the same directory plus rename, so readers never see a torn file.
+        :param text: The decoded form of `data`, cached for the next read_file
+        """
+        directory = os.path.dirname(target_path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            if os.path.exists(target_path):
+                shutil.copymode(target_path, tmp_path)
+            else:
+                os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, target_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+        # Write-through: the next read_file is served from memory
+        if len(data) < self.MMAP_THRESHOLD:
+            self.cache.put(("file", target_path), stat_signature(os.stat(target_path)), [data, text], 2 * len(data))
+        else:
+            self.cache.invalidate(("file", target_path))
+
+    @skill_tool(description="Write text content to a file (overwrites existing).", timeout=60)
     def write_file(self, params: WriteFileParams) -> str:
         try:
             target_path = os.path.abspath(params.path)
-            os.makedirs(os.path.dirname(target_path), exist_ok=True)
-            
-            with open(target_path, 'w', encoding='utf-8') as f:
-                f.write(params.content)
+            # Same newline translation as writing in text mode
+            content = params.content.replace("\n", os.linesep) if os.linesep != "\n" else params.content
+            self._atomic_write(target_path, content.encode('utf-8'), content)
             return f"Successfully wrote to {target_path}"
         except Exception as e:
             return f"Error writing file: {e}"
 
+    @skill_tool(description=(
+        "Edit one or more files with unified diff hunks or search/replace pairs instead of rewriting them. "
+        "All edits are validated first and then applied atomically; if any edit fails, no file is changed."
+    ), timeout=60)
+    def apply_edit(self, params: ApplyEditParams) -> str:
+        try:
+            # Phase 1: compute every new file content without touching the disk
+            planned = []  # (path, original bytes or None, new bytes, new text)
+            seen = set()
+            for number, edit in enumerate(params.edits, 1):
+                target_path = os.path.abspath(edit.path)
+                if target_path in seen:
+                    return f"Error: Edit {number}: '{target_path}' appears more than once; combine its changes into one edit."
+                seen.add(target_path)
+                if not edit.diff and not edit.replacements:
+                    return f"Error: Edit {number}: provide `diff` or `replacements`."
+
+                original = None
+                if os.path.exists(target_path):
+                    with open(target_path, 'rb') as f:
+                        original = f.read()
+                elif edit.replacements:
+                    return f"Error: Edit {number}: File '{target_path}' does not exist."
+
+                if edit.expected_sha256:
+                    actual = hashlib.sha256(original or b"").hexdigest()
+                    if actual != edit.expected_sha256.lower():
+                        return f"Error: Edit {number}: '{target_path}' changed since it was read (sha256 {actual}); re-read it and retry."
+
+                try:
+                    # newline='' semantics: line endings are preserved exactly
+                    text = (original or b"").decode('utf-8')
+                except UnicodeDecodeError:
+                    return f"Error: Edit {number}: '{target_path}' is binary or not UTF-8 encoded."
+                try:
+                    if edit.diff:
+                        text = apply_unified_diff(text, edit.diff)
+                    if edit.replacements:
+                        text = apply_replacements(text, [(r.search, r.replace, r.replace_all) for r in edit.replacements])
+                except PatchError as e:
+                    return f"Error: Edit {number} ({target_path}): {e}"
+                planned.append((target_path, original, text.encode('utf-8'), text))
+
+            # Phase 2: commit, rolling back already-written files if a later one fails
+            committed = []
+            try:
+                for target_path, original, data, text in planned:
+                    self._atomic_write(target_path, data, text)
+                    committed.append((target_path, original))
+            except Exception:
+                for target_path, original in reversed(committed):
+                    try:
+                        if original is None:
+                            os.unlink(target_path)
+                            self.cache.invalidate(("file", target_path))
+                        else:
+                            self._atomic_write(target_path, original)
+                    except Exception as rollback_error:
+                        print(f"[Skill:FileSystem] Rollback of {target_path} failed: {rollback_error}")
+                raise
+
+            summary = []
+            for target_path, original, data, _ in planned:
+                action = "created" if original is None else "edited"
+                summary.append(f"{action} {target_path} (sha256={hashlib.sha256(data).hexdigest()})")
+            return "Successfully applied edits:\n" + "\n".join(summary)
+        except Exception as e:
+            return f"Error applying edits: {e}"
+
     def get_tools(self):
-        return [self.list_directory, self.read_file, self.write_file]
+        return [self.list_directory, self.read_file, self.read_files, self.write_file, self.apply_edit]
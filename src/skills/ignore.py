@@ -0,0 +1,154 @@
+import os
+import re
+from typing import Iterator, List, Optional, Sequence, Tuple
+from src.skills.file_cache import FileContentCache, shared_file_cache, stat_signature
+
+# Excluded from listings/indexes unless the caller passes its own exclude list
+DEFAULT_EXCLUDES = [".git", "node_modules", "__pycache__", ".venv", "venv", ".mypy_cache", ".pytest_cache", ".tox"]
+
+def _translate(pattern: str) -> str:
+    """Translates a gitignore glob (without leading/trailing slash) into a regex."""
+    res = ""
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == "*":
+            if pattern[i:i + 3] == "**/":
+                res += "(?:.*/)?"
+                i += 3
+                continue
+            if pattern[i:i + 2] == "**":
+                res += ".*"
+                i += 2
+                continue
+            res += "[^/]*"
+        elif c == "?":
+            res += "[^/]"
+        elif c == "[":
+            close = pattern.find("]", i + 1)
+            if close == -1:
+                res += "\\["
+            else:
+                cls = pattern[i + 1:close]
+                if cls.startswith("!"):
+                    cls = "^" + cls[1:]
+                res += "[" + cls.replace("\\", "\\\\") + "]"
+                i = close
+        elif c == "\\" and i + 1 < len(pattern):
+            i += 1
+            res += re.escape(pattern[i])
+        else:
+            res += re.escape(c)
+        i += 1
+    return res
+
+class IgnoreRules:
+    """
+    The patterns of one .gitignore file (or an equivalent list of patterns),
+    applied to paths below `base` (relative to the walk root, "" for the root).
+    """
+    def __init__(self, patterns: Sequence[str], base: str = ""):
+        self.base = base
+        # (regex, negated, dir_only, match_basename)
+        self.rules: List[Tuple[re.Pattern, bool, bool, bool]] = []
+        for raw in patterns:
+            line = raw.rstrip("\n").rstrip("\r")
+            if not line.strip() or line.startswith("#"):
+                continue
+            line = line.rstrip() if not line.endswith("\\ ") else line
+            negated = line.startswith("!")
+            if negated:
+                line = line[1:]
+            dir_only = line.endswith("/")
+            line = line.rstrip("/")
+            # Patterns with a leading or middle slash are relative to the .gitignore's directory
+            anchored = "/" in line
+            line = line.lstrip("/")
+            if not line:
+                continue
+            self.rules.append((re.compile("^" + _translate(line) + "$"), negated, dir_only, not anchored))
+
+    @classmethod
+    def from_file(cls, path: str, base: str, cache: Optional[FileContentCache] = None) -> Optional["IgnoreRules"]:
+        cache = cache if cache is not None else shared_file_cache
+        try:
+            signature = stat_signature(os.stat(path))
+        except OSError:
+            return None
+        rules = cache.get(("gitignore", path, base), signature)
+        if rules is None:
+            try:
+                with open(path, "r", encoding="utf-8", errors="replace") as f:
+                    rules = cls(f.readlines(), base)
+            except OSError:
+                return None
+            cache.put(("gitignore", path, base), signature, rules, 64 * (len(rules.rules) + 1))
+        return rules
+
+    def match(self, rel: str, is_dir: bool) -> Optional[bool]:
+        """True if ignored, False if explicitly re-included (`!pattern`), None if no rule applies."""
+        if self.base:
+            if not rel.startswith(self.base + "/"):
+                return None
+            rel = rel[len(self.base) + 1:]
+        name = rel.rsplit("/", 1)[-1]
+        result = None
+        for regex, negated, dir_only, match_basename in self.rules:
+            if dir_only and not is_dir:
+                continue
+            if regex.match(name if match_basename else rel):
+                result = not negated
+        return result
+
+def is_ignored(rules: Sequence[IgnoreRules], rel: str, is_dir: bool) -> bool:
+    ignored = False
+    # Deeper .gitignore files override shallower ones: last match wins
+    for r in rules:
+        verdict = r.match(rel, is_dir)
+        if verdict is not None:
+            ignored = verdict
+    return ignored
+
+def scan_dir(path: str, cache: Optional[FileContentCache] = None) -> List[Tuple[str, bool]]:
+    """
+    Sorted (name, is_dir) entries of `path`. Uses scandir's d_type instead of a stat
+    per entry, and is cached against the directory's own (mtime, size, inode).
+    Symlinks are reported as files so walks never loop.
+    """
+    cache = cache if cache is not None else shared_file_cache
+    signature = stat_signature(os.stat(path))
+    entries = cache.get(("scan", path), signature)
+    if entries is None:
+        with os.scandir(path) as it:
+            entries = sorted((e.name, e.is_dir(follow_symlinks=False)) for e in it)
+        cache.put(("scan", path), signature, entries, sum(len(n) + 16 for n, _ in entries))
+    return entries
+
+def walk(root: str, max_depth: Optional[int] = None, respect_gitignore: bool = True, exclude: Optional[Sequence[str]] = None,
+         cache: Optional[FileContentCache] = None) -> Iterator[Tuple[str, bool, int]]:
+    """
+    Depth-first, sorted walk of `root` yielding (relative_path, is_dir, depth), depth 1 being
+    the direct children. Ignored directories are not descended into.
+    :param exclude: gitignore-style patterns; None means DEFAULT_EXCLUDES
+    """
+    base_rules = [IgnoreRules(DEFAULT_EXCLUDES if exclude is None else exclude)]
+
+    def visit(rel_dir: str, depth: int, rules: List[IgnoreRules]) -> Iterator[Tuple[str, bool, int]]:
+        abs_dir = os.path.join(root, rel_dir) if rel_dir else root
+        if respect_gitignore:
+            local = IgnoreRules.from_file(os.path.join(abs_dir, ".gitignore"), rel_dir, cache)
+            if local is not None:
+                rules = rules + [local]
+        try:
+            entries = scan_dir(abs_dir, cache)
+        except OSError:
+            return
+        for name, is_dir in entries:
+            rel = f"{rel_dir}/{name}" if rel_dir else name
+            if is_ignored(rules, rel, is_dir):
+                continue
+            yield rel, is_dir, depth
+            if is_dir and (max_depth is None or depth < max_depth):
+                yield from visit(rel, depth + 1, rules)
+
+    yield from visit("", 1, base_rules)
@@ -0,0 +1,104 @@
+import re
+from dataclasses import dataclass, field
+from typing import List, Tuple
+
+class PatchError(Exception):
+    """Raised when an edit doesn't apply cleanly to the current file content."""
+
+_HUNK_HEADER = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+
+@dataclass
+class Hunk:
+    old_start: int
+    old_lines: List[str] = field(default_factory=list)
+    new_lines: List[str] = field(default_factory=list)
+
+def _split(text: str) -> Tuple[List[str], str, bool]:
+    """Returns (lines without endings, newline style, ends with newline)."""
+    newline = "\r\n" if "\r\n" in text else "\n"
+    ends_with_newline = text.endswith("\n")
+    lines = text.split(newline) if text else []
+    if ends_with_newline:
+        lines.pop()
+    return lines, newline, ends_with_newline
+
+def _join(lines: List[str], newline: str, ends_with_newline: bool) -> str:
+    if not lines:
+        return ""
+    return newline.join(lines) + (newline if ends_with_newline else "")
+
+def parse_unified_diff(diff: str) -> List[Hunk]:
+    """Parses the hunks of a single-file unified diff. File headers (---/+++) are optional."""
+    hunks: List[Hunk] = []
+    current = None
+    for line in diff.splitlines():
+        header = _HUNK_HEADER.match(line)
+        if header:
+            current = Hunk(old_start=int(header.group(1)))
+            hunks.append(current)
+            continue
+        if current is None:
+            # diff --git / index / --- / +++ lines before the first hunk
+            continue
+        if line.startswith("\\"):
+            # "\ No newline at end of file"
+            continue
+        tag, text = line[:1], line[1:]
+        if tag == " " or line == "":
+            current.old_lines.append(text)
+            current.new_lines.append(text)
+        elif tag == "-":
+            current.old_lines.append(text)
+        elif tag == "+":
+            current.new_lines.append(text)
+        else:
+            raise PatchError(f"Malformed diff line: {line!r}")
+    if not hunks:
+        raise PatchError("No hunks (@@ ... @@) found in diff.")
+    return hunks
+
+def _find(lines: List[str], needle: List[str], hint: int, strip: bool) -> int:
+    """Index of `needle` in `lines`, searching outward from `hint`; -1 if absent."""
+    if not needle:
+        return min(max(hint, 0), len(lines))
+    norm = (lambda s: s.rstrip()) if strip else (lambda s: s)
+    wanted = [norm(s) for s in needle]
+    last = len(lines) - len(needle)
+    for distance in range(0, max(last, 0) + max(hint, 0) + 2):
+        for pos in {hint - distance, hint + distance}:
+            if 0 <= pos <= last and [norm(s) for s in lines[pos:pos + len(needle)]] == wanted:
+                return pos
+    return -1
+
+def apply_unified_diff(original: str, diff: str) -> str:
+    lines, newline, ends_with_newline = _split(original)
+    if not original:
+        ends_with_newline = True
+    offset = 0  # Shift caused by hunks already applied
+    for number, hunk in enumerate(parse_unified_diff(diff), 1):
+        # A hunk without old lines (-N,0) inserts after line N; otherwise its old lines start at line N
+        hint = (hunk.old_start if not hunk.old_lines else max(hunk.old_start - 1, 0)) + offset
+        pos = _find(lines, hunk.old_lines, hint, strip=False)
+        if pos == -1:
+            # Tolerate trailing-whitespace differences in context lines
+            pos = _find(lines, hunk.old_lines, hint, strip=True)
+        if pos == -1:
+            preview = "\n".join(hunk.old_lines[:3])
+            raise PatchError(f"Hunk {number} does not match the current file content near line {hunk.old_start}:\n{preview}")
+        lines[pos:pos + len(hunk.old_lines)] = hunk.new_lines
+        offset += len(hunk.new_lines) - len(hunk.old_lines)
+    return _join(lines, newline, ends_with_newline)
+
+def apply_replacements(original: str, replacements: List[Tuple[str, str, bool]]) -> str:
+    """Applies (search, replace, replace_all) edits in order. `search` must match exactly (once unless replace_all)."""
+    text = original
+    for number, (search, replace, replace_all) in enumerate(replacements, 1):
+        if not search:
+            raise PatchError(f"Replacement {number}: empty search string.")
+        count = text.count(search)
+        if count == 0:
+            raise PatchError(f"Replacement {number}: search text not found: {search[:80]!r}")
+        if count > 1 and not replace_all:
+            raise PatchError(f"Replacement {number}: search text matches {count} times; add more context or set replace_all.")
+        text = text.replace(search, replace)
+    return text
@@ -1,53 +1,184 @@
 import os
 import shutil
+import asyncio
+import hashlib
 import subprocess
-from typing import Optional
+import threading
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
 from pydantic import BaseModel, Field
-from copilot.tools import define_tool
+from src.skills.tooling import io_executor, skill_tool
 
 # Define Parameter Models (Pydantic) for Schema Generation
 class CloneRepoParams(BaseModel):
     repo_url: str = Field(..., description="The HTTPS URL of the GitHub repository to clone")
     target_name: Optional[str] = Field(None, description="Optional custom folder name for the cloned repo")
+    depth: Optional[int] = Field(None, description="Optional: create a shallow checkout with only the last N commits")
+    partial: bool = Field(False, description="Optional: partial clone (--filter=blob:none); file contents are downloaded on demand")
+
+# One lock per mirror so concurrent clones of the same repo don't fight over the mirror's git locks
+_mirror_locks: Dict[str, threading.Lock] = {}
+_mirror_locks_guard = threading.Lock()
+
+@asynccontextmanager
+async def _mirror_lock(path: str):
+    with _mirror_locks_guard:
+        lock = _mirror_locks.setdefault(path, threading.Lock())
+    # Polled rather than blocking: the holder may be another task on this same event loop
+    while not lock.acquire(blocking=False):
+        await asyncio.sleep(0.05)
+    try:
+        yield
+    finally:
+        lock.release()
+
+async def _git(args: List[str], cwd: Optional[str] = None, capture: bool = False) -> bytes:
+    proc = await asyncio.create_subprocess_exec(
+        "git", *args,
+        cwd=cwd,
+        stdout=subprocess.PIPE if capture else subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    try:
+        stdout, _ = await proc.communicate()
+    except BaseException:
+        # Cancelled (e.g. the tool timed out): don't leave git running in the background
+        if proc.returncode is None:
+            try:
+                proc.kill()
+            except ProcessLookupError:
+                pass
+            await proc.wait()
+        raise
+    if proc.returncode:
+        raise subprocess.CalledProcessError(proc.returncode, ["git"] + args)
+    return stdout or b""
 
 class RepositorySkill:
     """
     A skill set for managing Git repositories.
+
+    Every remote is kept as a bare mirror under `workspaces/.mirrors`. The first
+    clone downloads it; later clones of the same URL only fetch new objects into
+    the mirror and create the checkout locally from it.
+
+    Git runs as asyncio subprocesses, so a long clone never blocks the event loop
+    that drives the sessions.
     """
-    
+
     def __init__(self, workspace_root: str = "workspaces"):
         self.workspace_root = os.path.join(os.getcwd(), workspace_root)
+        self.mirror_root = os.path.join(self.workspace_root, ".mirrors")
         os.makedirs(self.workspace_root, exist_ok=True)
 
-    @define_tool(description="Clones a GitHub repository to the workspace.")
-    def clone_repository(self, params: CloneRepoParams) -> str:
+    def _mirror_path(self, repo_url: str) -> str:
+        repo_name = repo_url.rstrip("/").split("/")[-1].replace(".git", "")
+        url_hash = hashlib.sha1(repo_url.encode("utf-8")).hexdigest()[:8]
+        return os.path.join(self.mirror_root, f"{repo_name}-{url_hash}.git")
+
+    async def _sync_mirror(self, repo_url: str, partial: bool) -> str:
+        """Creates the bare mirror on first use, otherwise fetches incrementally. Returns its path."""
+        mirror = self._mirror_path(repo_url)
+        async with _mirror_lock(mirror):
+            if os.path.isdir(mirror):
+                print(f"[Skill:Repository] Updating mirror of {repo_url}...")
+                await _git(["fetch", "--prune", "--tags", "origin"], cwd=mirror)
+                return mirror
+
+            print(f"[Skill:Repository] Creating mirror of {repo_url}...")
+            os.makedirs(self.mirror_root, exist_ok=True)
+            tmp_mirror = mirror + ".tmp"
+            await self._run_blocking(shutil.rmtree, tmp_mirror, True)
+            # Bare clone with heads/tags only (a full --mirror would also pull refs/pull/* on GitHub)
+            args = ["clone", "--bare"]
+            if partial:
+                args.append("--filter=blob:none")
+            await _git(args + [repo_url, tmp_mirror])
+            await _git(["config", "remote.origin.fetch", "+refs/heads/*:refs/heads/*"], cwd=tmp_mirror)
+            # Allow filtered (partial) checkouts to be created from the mirror
+            await _git(["config", "uploadpack.allowFilter", "true"], cwd=tmp_mirror)
+            os.rename(tmp_mirror, mirror)
+            return mirror
+
+    @staticmethod
+    async def _run_blocking(fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(io_executor(), fn, *args)
+
+    async def _checkout_from_mirror(self, mirror: str, repo_url: str, target_dir: str, depth: Optional[int], partial: bool):
+        try:
+            promisor = await _git(["config", "--get", "remote.origin.promisor"], cwd=mirror, capture=True)
+        except subprocess.CalledProcessError:
+            promisor = b""  # Not set
+        mirror_is_partial = promisor.strip() == b"true"
+        partial = partial or mirror_is_partial
+
+        if not depth and not partial:
+            # Plain local clone: objects are hard-linked from the mirror, no network involved
+            await _git(["clone", mirror, target_dir])
+            await _git(["remote", "set-url", "origin", repo_url], cwd=target_dir)
+            return
+
+        # --depth/--filter are ignored for plain local paths, so go through file://
+        args = ["clone", "--no-checkout"]
+        if depth:
+            args.append(f"--depth={depth}")
+        if partial:
+            args.append("--filter=blob:none")
+        mirror_url = "file://" + os.path.abspath(mirror).replace(os.sep, "/")
+        await _git(args + [mirror_url, target_dir])
+        # Point origin at the real remote before checkout, so blobs missing from a partial
+        # mirror are fetched lazily from upstream
+        await _git(["remote", "set-url", "origin", repo_url], cwd=target_dir)
+        await _git(["checkout", "-f"], cwd=target_dir)
+
+    async def prepare_mirror(self, repo_url: str, partial: bool = False) -> str:
+        """Creates or updates the bare mirror of `repo_url` and returns its path (e.g. for per-task worktrees)."""
+        return await self._sync_mirror(repo_url, partial)
+
+    async def checkout(self, repo_url: str, target_name: Optional[str] = None, depth: Optional[int] = None, partial: bool = False) -> str:
         """
-        Clones the specified repository. Returns the absolute path to the cloned directory.
+        Clones `repo_url` into the workspace (through the mirror) and returns the checkout's path.
+        Raises on failure; `clone_repository` is the tool-facing wrapper.
         """
-        repo_name = params.target_name or params.repo_url.split("/")[-1].replace(".git", "")
+        repo_name = target_name or repo_url.split("/")[-1].replace(".git", "")
         target_dir = os.path.join(self.workspace_root, repo_name)
-        
+
         # Simple cleanup for demo purposes
         if os.path.exists(target_dir):
-            try:
-                # Handle readonly files on Windows
-                def on_rm_error(func, path, exc_info):
-                    os.chmod(path, 0o777)
-                    os.unlink(path)
-                shutil.rmtree(target_dir, onerror=on_rm_error)
-            except Exception as e:
-                return f"Error cleaning up existing directory: {e}"
+            # Handle readonly files on Windows
+            def on_rm_error(func, path, exc_info):
+                os.chmod(path, 0o777)
+                os.unlink(path)
+            await self._run_blocking(lambda: shutil.rmtree(target_dir, onerror=on_rm_error))
 
+        print(f"[Skill:Repository] Cloning {repo_url}...")
+        try:
+            mirror = await self._sync_mirror(repo_url, partial)
+            await self._checkout_from_mirror(mirror, repo_url, target_dir, depth, partial)
+        except subprocess.CalledProcessError as e:
+            # Mirror unusable (e.g. corrupted or interrupted): fall back to a direct clone
+            print(f"[Skill:Repository] Mirror clone failed ({e}), cloning directly...")
+            await self._run_blocking(shutil.rmtree, target_dir, True)
+            args = ["clone"]
+            if depth:
+                args.append(f"--depth={depth}")
+            if partial:
+                args.append("--filter=blob:none")
+            await _git(args + [repo_url, target_dir])
+        return target_dir
+
+    @skill_tool(description="Clones a GitHub repository to the workspace.", timeout=1800, max_concurrency=2)
+    async def clone_repository(self, params: CloneRepoParams) -> str:
+        """
+        Clones the specified repository. Returns the absolute path to the cloned directory.
+        """
         try:
-            print(f"[Skill:Repository] Cloning {params.repo_url}...")
-            subprocess.check_call(
-                ["git", "clone", params.repo_url, target_dir],
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.DEVNULL
-            )
+            target_dir = await self.checkout(params.repo_url, params.target_name, params.depth, params.partial)
             return f"Successfully cloned environment to: {target_dir}\nYou can now read/write files in this directory."
         except subprocess.CalledProcessError as e:
             return f"Failed to clone repository: {e}"
+        except OSError as e:
+            return f"Error cleaning up existing directory: {e}"
         except Exception as e:
             return f"Unexpected error during clone: {e}"
 
@@ -0,0 +1,112 @@
+import os
+import asyncio
+import inspect
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional, get_type_hints
+from copilot.tools import define_tool
+
+# Threads shared by the blocking (sync) handlers of all skills; bounded so a burst of tool calls
+# from many sessions queues up instead of spawning a thread per call
+SKILL_IO_WORKERS = min(32, (os.cpu_count() or 1) + 4)
+
+_io_executor: Optional[ThreadPoolExecutor] = None
+_io_executor_guard = threading.Lock()
+
+def io_executor() -> ThreadPoolExecutor:
+    """The thread pool sync skill handlers run in (created on first use)."""
+    global _io_executor
+    with _io_executor_guard:
+        if _io_executor is None:
+            _io_executor = ThreadPoolExecutor(max_workers=SKILL_IO_WORKERS, thread_name_prefix="skill-io")
+        return _io_executor
+
+class skill_tool:
+    """
+    `@define_tool(description=...)` for skill methods.
+
+    `define_tool` inspects the function it decorates, so applied to a method it treats `self`
+    as the parameter model and the handler never gets the skill instance. This decorator
+    defers `define_tool` until the method is looked up on an instance and binds the handler
+    to it; each instance builds its tools once.
+
+    Tool handlers run on the event loop that also drives every session's event stream, so
+    sync methods are run in the shared skill I/O thread pool instead of being called inline;
+    async methods are awaited as they are.
+    """
+    def __init__(self, description: str, timeout: Optional[float] = None, max_concurrency: Optional[int] = None,
+                 offload: bool = True):
+        """
+        :param timeout: (可選) Seconds before the call is abandoned and the model gets an error instead
+                        (a sync handler's thread can't be interrupted; it finishes in the background)
+        :param max_concurrency: (可選) Calls of this tool running at once across all instances and sessions;
+                                further calls wait their turn
+        :param offload: Set to False for cheap sync handlers that must run on the event loop
+                        (e.g. ones that set asyncio events)
+        """
+        self.description = description
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.offload = offload
+        self.fn: Optional[Callable[..., Any]] = None
+        self.params_type = None
+        self.attr = None
+        # asyncio primitives belong to one loop; keep a semaphore per loop
+        self._semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+
+    def __call__(self, fn: Callable[..., Any]) -> "skill_tool":
+        self.fn = fn
+        hints = get_type_hints(fn)
+        params = [p for p in inspect.signature(fn).parameters if p != "self"]
+        self.params_type = hints.get(params[0]) if params else None
+        return self
+
+    def __set_name__(self, owner, name: str):
+        self.attr = name
+
+    def _semaphore(self) -> Optional[asyncio.Semaphore]:
+        if not self.max_concurrency:
+            return None
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        return semaphore
+
+    async def _invoke(self, instance, params) -> Any:
+        fn = self.fn
+        if not inspect.iscoroutinefunction(fn) and not self.offload:
+            return fn(instance, params)
+
+        async def call():
+            if inspect.iscoroutinefunction(fn):
+                return await asyncio.wait_for(fn(instance, params), self.timeout)
+            future = asyncio.get_running_loop().run_in_executor(io_executor(), fn, instance, params)
+            return await asyncio.wait_for(future, self.timeout)
+
+        semaphore = self._semaphore()
+        try:
+            if semaphore is None:
+                return await call()
+            async with semaphore:
+                return await call()
+        except asyncio.TimeoutError:
+            return f"Error: {fn.__name__} timed out after {self.timeout:g}s."
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+
+        async def handler(params, invocation):
+            return await self._invoke(instance, params)
+
+        tool = define_tool(
+            self.fn.__name__,
+            description=self.description,
+            handler=handler,
+            params_type=self.params_type
+        )
+        # Cache on the instance (this is a non-data descriptor, so the instance attribute wins from now on)
+        instance.__dict__[self.attr] = tool
+        return tool
@@ -0,0 +1,104 @@
+"""Isolated copies of a workspace for speculative (parallel) Worker candidates."""
+import os
+import filecmp
+import shutil
+import subprocess
+import tempfile
+from typing import Dict, List, Optional, Tuple
+from src import workspace
+from src.skills.code_search import drop_index
+from src.skills.ignore import walk
+
+def _git(path: str, args: List[str], check: bool = True) -> bytes:
+    result = subprocess.run(["git"] + args, cwd=path, capture_output=True)
+    if check and result.returncode != 0:
+        raise subprocess.CalledProcessError(result.returncode, ["git"] + args, result.stdout, result.stderr)
+    return result.stdout
+
+class CandidateWorkspace:
+    """
+    A private copy of `source` that one candidate can modify freely.
+
+    Git repositories get a detached `git worktree` (sharing the object store) reset to a
+    snapshot of the source's current working tree, uncommitted and untracked files included;
+    anything else is copied with `shutil.copytree`. Only the winner's changes are applied
+    back to `source`, the rest are discarded with `cleanup`.
+    """
+    def __init__(self, source: str, base_tree: Optional[str], root: str):
+        self.source = os.path.abspath(source)
+        self.base_tree = base_tree
+        self.path = tempfile.mkdtemp(prefix=os.path.basename(self.source) + "-", dir=root)
+        self.is_worktree = False
+        # Copies only: relpath -> (mtime_ns, size) of the files as copied from `source`
+        self.base_files: Dict[str, Tuple[int, int]] = {}
+
+    @classmethod
+    def create(cls, source: str, base_tree: Optional[str], workspace_root: str = "workspaces") -> "CandidateWorkspace":
+        """
+        :param base_tree: Snapshot of `source` (see `workspace.snapshot_tree`); None for non-git directories
+        """
+        root = os.path.join(os.path.abspath(workspace_root), ".candidates")
+        os.makedirs(root, exist_ok=True)
+        candidate = cls(source, base_tree, root)
+        # Worktrees cover the whole repository, so only use one when `source` is its top level
+        if base_tree and workspace.head_commit(candidate.source) and not _git(candidate.source, ["rev-parse", "--show-prefix"]).strip():
+            try:
+                os.rmdir(candidate.path)
+                _git(candidate.source, ["worktree", "add", "--detach", candidate.path, "HEAD"])
+                candidate.is_worktree = True
+                # Bring in the uncommitted state of the source (read-tree -u also removes deleted files)
+                _git(candidate.path, ["read-tree", "-u", "--reset", base_tree])
+                return candidate
+            except subprocess.CalledProcessError:
+                candidate.cleanup()
+                candidate = cls(source, base_tree, root)
+        os.rmdir(candidate.path)
+        shutil.copytree(candidate.source, candidate.path, symlinks=True, ignore=shutil.ignore_patterns(".git"))
+        candidate.base_files = candidate._manifest()
+        return candidate
+
+    def _manifest(self) -> Dict[str, Tuple[int, int]]:
+        files = {}
+        for rel, is_dir, _ in walk(self.path):
+            if is_dir:
+                continue
+            st = os.stat(os.path.join(self.path, rel))
+            files[rel] = (st.st_mtime_ns, st.st_size)
+        return files
+
+    def apply_to_source(self) -> None:
+        """Applies this candidate's changes to the source workspace. Raises on conflicts."""
+        if self.is_worktree:
+            new_tree = workspace.snapshot_tree(self.path)
+            if not new_tree or new_tree == self.base_tree:
+                return
+            diff = workspace.binary_diff(self.path, self.base_tree, new_tree)
+            try:
+                workspace.apply_patch(self.source, diff)
+            except subprocess.CalledProcessError as e:
+                raise RuntimeError(f"git apply failed: {e.stderr.decode('utf-8', errors='replace').strip()}") from e
+            return
+
+        # Only what the candidate changed relative to the copy it started from, so files added to
+        # (or changed in) the source in the meantime are left alone
+        current = self._manifest()
+        for rel, signature in current.items():
+            if self.base_files.get(rel) == signature:
+                continue
+            src, dst = os.path.join(self.path, rel), os.path.join(self.source, rel)
+            if not os.path.exists(dst) or not filecmp.cmp(src, dst, shallow=False):
+                os.makedirs(os.path.dirname(dst), exist_ok=True)
+                shutil.copy2(src, dst)
+        for rel in self.base_files:
+            if rel not in current:
+                try:
+                    os.unlink(os.path.join(self.source, rel))
+                except FileNotFoundError:
+                    pass
+
+    def cleanup(self) -> None:
+        if self.is_worktree:
+            _git(self.source, ["worktree", "remove", "--force", self.path], check=False)
+            _git(self.source, ["worktree", "prune"], check=False)
+        shutil.rmtree(self.path, ignore_errors=True)
+        drop_index(self.path)
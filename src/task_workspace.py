@@ -0,0 +1,209 @@
+"""Per-task git worktrees, so concurrent tasks on one repository never touch each other's files."""
+import os
+import json
+import time
+import shutil
+import tempfile
+import threading
+import subprocess
+from typing import Dict, List, Optional
+from src import workspace
+from src.skills.code_search import drop_index
+
+def _git(path: str, args: List[str], check: bool = True, env: Optional[dict] = None) -> bytes:
+    result = subprocess.run(["git"] + args, cwd=path, capture_output=True, env=env)
+    if check and result.returncode != 0:
+        raise subprocess.CalledProcessError(result.returncode, ["git"] + args, result.stdout, result.stderr)
+    return result.stdout
+
+# How often a running task refreshes its worktree's metadata (see `TaskWorkspace.touch`)
+KEEPALIVE_INTERVAL = 600.0
+
+# `git worktree add/remove` on one repository contend for its locks; serialize them per repository
+_repo_locks: Dict[str, threading.Lock] = {}
+_repo_locks_guard = threading.Lock()
+
+def _repo_lock(common_dir: str) -> threading.Lock:
+    with _repo_locks_guard:
+        return _repo_locks.setdefault(common_dir, threading.Lock())
+
+class TaskWorkspace:
+    """
+    A detached `git worktree` private to one task. It shares the object store of the
+    repository it came from (a local checkout or a bare mirror), so creating one costs a
+    checkout, not a clone. The task's changes come back as a patch against `base_tree`, or
+    as a commit on a branch of the source repository. `cleanup` removes the worktree.
+
+    Worktrees live under `<workspace_root>/.tasks/`; next to each one a small JSON file
+    records where it came from, so `open` can pick it up again (e.g. on resume) and
+    `prune_stale` can remove those left behind by a crashed process. A running task
+    `touch`es that file every `KEEPALIVE_INTERVAL` seconds to keep its worktree from being pruned.
+    """
+    def __init__(self, root: str, source: str, base_commit: str, base_tree: str, prefix: str = "", task_id: str = "", bare: bool = False):
+        self.root = root                # Worktree top level
+        self.source = source            # Repository whose object store is shared (checkout or bare mirror)
+        self.base_commit = base_commit
+        self.base_tree = base_tree      # What the task started from (uncommitted changes of a checkout included)
+        self.prefix = prefix            # Sub-directory of the repository the task works in
+        self.task_id = task_id
+        self.bare = bare                # Source is a bare mirror (no checkout of its own)
+
+    @property
+    def path(self) -> str:
+        """The task's working directory."""
+        return os.path.join(self.root, self.prefix) if self.prefix else self.root
+
+    @property
+    def _meta_path(self) -> str:
+        return self.root + ".json"
+
+    @staticmethod
+    def _tasks_root(workspace_root: str) -> str:
+        root = os.path.join(os.path.abspath(workspace_root), ".tasks")
+        os.makedirs(root, exist_ok=True)
+        return root
+
+    @classmethod
+    def _add(cls, source: str, commit: str, tree: Optional[str], prefix: str, task_id: str, workspace_root: str) -> "TaskWorkspace":
+        common_dir = os.path.abspath(os.path.join(source, _git(source, ["rev-parse", "--git-common-dir"]).decode().strip()))
+        root = tempfile.mkdtemp(prefix=f"{task_id or 'task'}-", dir=cls._tasks_root(workspace_root))
+        os.rmdir(root)
+        with _repo_lock(common_dir):
+            _git(source, ["worktree", "add", "--detach", root, commit])
+        bare = _git(source, ["rev-parse", "--is-bare-repository"]).decode().strip() == "true"
+        ws = cls(root, os.path.abspath(source), commit, tree or "", prefix, task_id, bare)
+        try:
+            if tree:
+                # Bring in the source's uncommitted state (read-tree -u also removes deleted files)
+                _git(root, ["read-tree", "-u", "--reset", tree])
+            else:
+                ws.base_tree = _git(root, ["rev-parse", f"{commit}^{{tree}}"]).decode().strip()
+            with open(ws._meta_path, "w", encoding="utf-8") as f:
+                json.dump({"source": ws.source, "base_commit": commit, "base_tree": ws.base_tree, "prefix": prefix, "task_id": task_id, "bare": bare}, f)
+        except Exception:
+            ws.cleanup()
+            raise
+        return ws
+
+    @classmethod
+    def from_repository(cls, path: str, task_id: str = "", workspace_root: str = "workspaces") -> Optional["TaskWorkspace"]:
+        """
+        Worktree of the repository containing `path`, reproducing its current working tree
+        (uncommitted and untracked files included). The task works in the same sub-directory.
+        Returns None if `path` is not inside a git repository with at least one commit.
+        """
+        path = os.path.abspath(path)
+        if not workspace.is_git_repo(path) or not workspace.head_commit(path):
+            return None
+        top = _git(path, ["rev-parse", "--show-toplevel"]).decode().strip()
+        prefix = _git(path, ["rev-parse", "--show-prefix"]).decode().strip().rstrip("/")
+        tree = workspace.snapshot_tree(top)
+        return cls._add(top, workspace.head_commit(top), tree, prefix, task_id, workspace_root)
+
+    @classmethod
+    def from_mirror(cls, mirror: str, rev: str = "HEAD", task_id: str = "", workspace_root: str = "workspaces") -> "TaskWorkspace":
+        """Worktree of `rev` from a bare mirror (see `RepositorySkill.prepare_mirror`)."""
+        commit = _git(mirror, ["rev-parse", "--verify", f"{rev}^{{commit}}"]).decode().strip()
+        return cls._add(mirror, commit, None, "", task_id, workspace_root)
+
+    @classmethod
+    def open(cls, path: str) -> Optional["TaskWorkspace"]:
+        """Re-attaches to an existing task worktree (`path` as returned by `.path`); None if it isn't one."""
+        root = os.path.abspath(path)
+        while root and not os.path.isfile(root + ".json"):
+            parent = os.path.dirname(root)
+            if parent == root or os.path.basename(parent) == ".tasks":
+                return None
+            root = parent
+        try:
+            with open(root + ".json", "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not os.path.isdir(root):
+            return None
+        return cls(root, meta["source"], meta["base_commit"], meta["base_tree"], meta.get("prefix", ""), meta.get("task_id", ""), meta.get("bare", False))
+
+    def snapshot(self) -> str:
+        return workspace.snapshot_tree(self.root)
+
+    def patch(self) -> bytes:
+        """The task's changes as a binary git diff against what it started from (`git apply` at the repository root)."""
+        return workspace.binary_diff(self.root, self.base_tree, self.snapshot())
+
+    def commit(self, message: str) -> Optional[str]:
+        """Commits the task's changes on top of `base_commit` without touching any branch. None if nothing changed."""
+        tree = self.snapshot()
+        if tree == self.base_tree:
+            return None
+        parents = ["-p", self.base_commit]
+        env = dict(os.environ)
+        if not _git(self.root, ["config", "user.email"], check=False).strip():
+            # No identity configured (e.g. a fresh mirror on a server): commit-tree would refuse
+            for key, value in (("NAME", "Multi-Agent Worker"), ("EMAIL", "worker@localhost")):
+                env.setdefault(f"GIT_AUTHOR_{key}", value)
+                env.setdefault(f"GIT_COMMITTER_{key}", value)
+        if self.base_tree != _git(self.root, ["rev-parse", f"{self.base_commit}^{{tree}}"]).decode().strip():
+            # The task started from uncommitted changes: record them as their own commit first
+            base = _git(self.root, ["commit-tree", self.base_tree, "-p", self.base_commit, "-m", "Uncommitted changes the task started from"], env=env)
+            parents = ["-p", base.decode().strip()]
+        return _git(self.root, ["commit-tree", tree] + parents + ["-m", message], env=env).decode().strip()
+
+    def publish_branch(self, branch: str, message: str) -> Optional[str]:
+        """Commits the task's changes and points `branch` of the source repository at them. Returns the commit, None if nothing changed."""
+        commit = self.commit(message)
+        if commit:
+            _git(self.source, ["update-ref", f"refs/heads/{branch}", commit])
+        return commit
+
+    def cleanup(self) -> None:
+        common_dir = os.path.abspath(os.path.join(self.source, _git(self.source, ["rev-parse", "--git-common-dir"], check=False).decode().strip() or "."))
+        with _repo_lock(common_dir):
+            _git(self.source, ["worktree", "remove", "--force", self.root], check=False)
+            shutil.rmtree(self.root, ignore_errors=True)
+            _git(self.source, ["worktree", "prune"], check=False)
+        try:
+            os.unlink(self._meta_path)
+        except OSError:
+            pass
+        drop_index(self.path)
+
+    def touch(self) -> None:
+        """Marks the worktree as in use: `prune_stale` leaves it alone for another `max_age`."""
+        try:
+            os.utime(self._meta_path)
+        except OSError:
+            pass
+
+    def __enter__(self) -> "TaskWorkspace":
+        return self
+
+    def __exit__(self, *exc):
+        self.cleanup()
+
+    @classmethod
+    def prune_stale(cls, workspace_root: str = "workspaces", max_age: float = 24 * 3600) -> int:
+        """
+        Removes task worktrees whose metadata wasn't touched for `max_age` seconds (e.g. left by a crash;
+        running tasks touch theirs every `KEEPALIVE_INTERVAL`). Returns how many.
+        """
+        root = cls._tasks_root(workspace_root)
+        removed = 0
+        now = time.time()
+        for name in os.listdir(root):
+            if not name.endswith(".json"):
+                continue
+            meta_path = os.path.join(root, name)
+            try:
+                if now - os.path.getmtime(meta_path) < max_age:
+                    continue
+            except OSError:
+                continue
+            ws = cls.open(meta_path[:-len(".json")])
+            if ws is not None:
+                ws.cleanup()
+            else:
+                shutil.rmtree(meta_path[:-len(".json")], ignore_errors=True)
+                os.unlink(meta_path)
+            removed += 1
+        return removed
@@ -0,0 +1,96 @@
+"""Git helpers for snapshotting, diffing and patching a workspace without touching its index or branches."""
+import os
+import shutil
+import subprocess
+import tempfile
+from typing import List, Optional
+
+def _git(path: str, args: List[str], env: Optional[dict] = None, check: bool = True) -> str:
+    result = subprocess.run(
+        ["git"] + args,
+        cwd=path,
+        env=env,
+        capture_output=True,
+        text=True,
+        encoding="utf-8",
+        errors="replace"
+    )
+    if check and result.returncode != 0:
+        raise subprocess.CalledProcessError(result.returncode, ["git"] + args, result.stdout, result.stderr)
+    return result.stdout
+
+def is_git_repo(path: Optional[str]) -> bool:
+    if not path or not os.path.isdir(path):
+        return False
+    try:
+        return _git(path, ["rev-parse", "--is-inside-work-tree"]).strip() == "true"
+    except (subprocess.CalledProcessError, OSError):
+        return False
+
+def head_commit(path: str) -> Optional[str]:
+    try:
+        return _git(path, ["rev-parse", "HEAD"]).strip()
+    except subprocess.CalledProcessError:
+        return None  # No commits yet
+
+def snapshot_tree(path: str) -> Optional[str]:
+    """
+    Returns the git tree hash of the current working tree (tracked + untracked, minus ignored files).
+    A copy of the real index is used, so the user's staging area is left alone and only files
+    whose stat info changed get re-hashed.
+    """
+    if not is_git_repo(path):
+        return None
+    index_path = _git(path, ["rev-parse", "--path-format=absolute", "--git-path", "index"]).strip()
+    fd, tmp_index = tempfile.mkstemp(prefix="snapshot-index-")
+    os.close(fd)
+    try:
+        if os.path.exists(index_path):
+            shutil.copyfile(index_path, tmp_index)
+        else:
+            os.unlink(tmp_index)
+        env = dict(os.environ, GIT_INDEX_FILE=tmp_index)
+        _git(path, ["add", "-A"], env=env)
+        return _git(path, ["write-tree"], env=env).strip()
+    finally:
+        if os.path.exists(tmp_index):
+            os.unlink(tmp_index)
+
+def diff_trees(path: str, old_tree: str, new_tree: str, max_chars: Optional[int] = None) -> str:
+    """Unified diff between two snapshots, optionally truncated to `max_chars`."""
+    if old_tree == new_tree:
+        return ""
+    diff = _git(path, ["diff", "--no-color", "--no-ext-diff", old_tree, new_tree])
+    if max_chars is not None and len(diff) > max_chars:
+        diff = diff[:max_chars] + f"\n... (diff truncated, {len(diff) - max_chars} more characters)"
+    return diff
+
+def changed_files(path: str, old_tree: str, new_tree: str) -> List[str]:
+    """Paths (relative to `path`) that differ between two snapshots, excluding deletions."""
+    if old_tree == new_tree:
+        return []
+    out = _git(path, ["diff", "--name-only", "--relative", "--diff-filter=d", "-z", old_tree, new_tree])
+    return [p for p in out.split("\0") if p]
+
+def binary_diff(path: str, old_tree: str, new_tree: str) -> bytes:
+    """`git diff --binary` between two snapshots, as raw bytes (suitable for `apply_patch`)."""
+    if old_tree == new_tree:
+        return b""
+    result = subprocess.run(
+        ["git", "diff", "--binary", "--no-color", "--no-ext-diff", old_tree, new_tree],
+        cwd=path, capture_output=True
+    )
+    if result.returncode != 0:
+        raise subprocess.CalledProcessError(result.returncode, result.args, result.stdout, result.stderr)
+    return result.stdout
+
+def apply_patch(path: str, patch: bytes):
+    """Applies a `binary_diff` patch to the working tree of `path` (the index is left alone)."""
+    if not patch:
+        return
+    result = subprocess.run(
+        ["git", "apply", "--binary", "--whitespace=nowarn", "-"],
+        cwd=path, input=patch, capture_output=True
+    )
+    if result.returncode != 0:
+        raise subprocess.CalledProcessError(result.returncode, result.args, result.stdout, result.stderr)
@@ -0,0 +1,24 @@
+import pytest
+from src.skills.patch import PatchError, apply_unified_diff
+
+ORIGINAL = "a\nb\nc\nd\ne\n"
+
+@pytest.mark.parametrize("diff, expected", [
+    # Zero-context insertions (old count 0) go after line N
+    ("@@ -0,0 +1,1 @@\n+X\n", "X\na\nb\nc\nd\ne\n"),
+    ("@@ -2,0 +3,1 @@\n+X\n", "a\nb\nX\nc\nd\ne\n"),
+    ("@@ -5,0 +6,1 @@\n+X\n", "a\nb\nc\nd\ne\nX\n"),
+    ("@@ -1,0 +2,2 @@\n+X\n+Y\n@@ -4,0 +7,1 @@\n+Z\n", "a\nX\nY\nb\nc\nd\nZ\ne\n"),
+    # With context
+    ("@@ -2,2 +2,3 @@\n b\n+X\n c\n", "a\nb\nX\nc\nd\ne\n"),
+    ("@@ -5,1 +5,0 @@\n-e\n", "a\nb\nc\nd\n"),
+])
+def test_apply_unified_diff(diff, expected):
+    assert apply_unified_diff(ORIGINAL, diff) == expected
+
+def test_insert_into_empty_file():
+    assert apply_unified_diff("", "@@ -0,0 +1,2 @@\n+x\n+y\n") == "x\ny\n"
+
+def test_mismatched_hunk():
+    with pytest.raises(PatchError):
+        apply_unified_diff(ORIGINAL, "@@ -2,1 +2,1 @@\n-nope\n+X\n")